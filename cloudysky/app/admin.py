@@ -2,7 +2,7 @@ from django.contrib import admin
 
 # Register your models here.
 from django.contrib import admin
-from .models import Profile, Post, Comment, ModerationReason, PostMedia
+from .models import Profile, Post, Comment, ModerationReason, ModerationEvent, PostMedia
 
 # Register your models here so they appear on the admin site.
 admin.site.register(Profile)
@@ -10,3 +10,19 @@ admin.site.register(Post)
 admin.site.register(Comment)
 admin.site.register(ModerationReason)
 admin.site.register(PostMedia)
+
+
+@admin.register(ModerationEvent)
+class ModerationEventAdmin(admin.ModelAdmin):
+    # Append-only: browsable, never edited
+    list_display = ('created_at', 'action', 'target_type', 'target_id', 'moderator', 'reason')
+    list_filter = ('action', 'target_type')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
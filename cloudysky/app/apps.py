@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'app'
+
+    def ready(self):
+        # Connects the cache invalidation, search index, blob refcount and SQL metrics receivers
+        from . import authors, blobs, feed_cache, metrics, permissions, reasons, search  # noqa: F401
@@ -0,0 +1,226 @@
+"""
+Hot/cold split of the post history.
+
+Every feed reads app_post/app_comment, which only ever grow. The archive job
+(manage.py archive_posts) moves posts whose thread has been quiet for
+ARCHIVE_AFTER_DAYS, with their comments, into ArchivedPost/ArchivedComment:
+same ids, only the columns the dump and the post page render, optionally in
+a database of their own (ARCHIVE_DATABASE, see routers.py). The hot tables
+and everything built from them stay the size of the recent history.
+
+Reading it back:
+- find_post(post_id) gives a post and its comments from the hot tables, else
+  from the archive, so /app/post/<id>/ keeps answering for archived posts
+- merge_posts(hot, cold) walks both newest first as one stream, reading each
+  with its own (chunked) iterator: /app/dumpFeed?archive=1
+- merged_page() is one keyset page over both
+
+Archived threads are read-only: new comments on them answer 410 and
+hide/unhide answer 404 for them (the bulk hides report "archived" per id).
+Posts with media stay hot (PostMedia counts the references to their files),
+and archived text is not in the search index.
+"""
+import heapq
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.utils import timezone
+
+from .authors import aattach_author_cards, attach_author_cards
+from .feed import comment_queryset, keyset_queryset, post_queryset, split_page
+from .feed_cache import DUMP, FEED, invalidate
+from .models import ArchivedComment, ArchivedPost, Comment, Post, PostMedia
+from .routers import feed_read_hints
+
+DEFAULT_AFTER_DAYS = 365
+DEFAULT_BATCH_SIZE = 500
+
+# Copied as-is: the archive models use the hot models' attnames
+POST_COLUMNS = [f.attname for f in ArchivedPost._meta.concrete_fields if f.attname != 'archived_at']
+COMMENT_COLUMNS = [f.attname for f in ArchivedComment._meta.concrete_fields]
+
+# ===================================================================
+# ARCHIVING
+# ===================================================================
+
+def archivable(cutoff):
+    """Hot posts created, and last commented on, before `cutoff` (posts with media stay hot)."""
+    return (Post.objects
+            .filter(Q(last_activity_at__lt=cutoff) | Q(last_activity_at__isnull=True), created_at__lt=cutoff)
+            .filter(~Exists(PostMedia.objects.filter(post=OuterRef('pk')))))
+
+
+def archive_batch(post_ids, cutoff, now=None):
+    """
+    Moves the posts in `post_ids` that are still archivable, with their
+    comments. Returns (posts, comments) moved.
+
+    The archive rows are written before the hot rows are deleted, so a post is
+    always in at least one of the two. In one database that is one
+    transaction; with a separate archive database a failure in between leaves
+    a post in both, which the readers skip and the next run writes again.
+    """
+    now = now or timezone.now()
+    hot, cold = router.db_for_write(Post), router.db_for_write(ArchivedPost)
+    with transaction.atomic(using=hot):
+        # Re-checked inside the transaction, as a comment may just have landed.
+        # PostgreSQL locks the rows (FOR UPDATE); SQLite either takes the write
+        # lock up front (IMMEDIATE, settings_production) or fails the DELETE
+        # below if someone wrote in between, never losing the new comment.
+        posts = list(archivable(cutoff).select_for_update().filter(id__in=post_ids).values(*POST_COLUMNS))
+        ids = [row['id'] for row in posts]
+        if not ids:
+            return 0, 0
+        comments = list(Comment.objects.filter(post_id__in=ids).values(*COMMENT_COLUMNS))
+
+        with transaction.atomic(using=cold):
+            # Upserts, so re-archiving what an interrupted run left behind just overwrites it
+            ArchivedPost.objects.bulk_create(
+                [ArchivedPost(archived_at=now, **row) for row in posts], batch_size=DEFAULT_BATCH_SIZE,
+                update_conflicts=True, unique_fields=['id'], update_fields=POST_COLUMNS[1:] + ['archived_at'])
+            ArchivedComment.objects.bulk_create(
+                [ArchivedComment(**row) for row in comments], batch_size=DEFAULT_BATCH_SIZE,
+                update_conflicts=True, unique_fields=['id'], update_fields=COMMENT_COLUMNS[1:])
+
+        # Plain DELETEs: QuerySet.delete() would load every row to send
+        # post_delete, and the feed receivers would then bump the cache per row
+        Comment.objects.filter(post_id__in=ids)._raw_delete(hot)
+        Post.objects.filter(id__in=ids)._raw_delete(hot)
+        invalidate(DUMP, FEED)
+    return len(ids), len(comments)
+
+
+def archive_posts(older_than=None, batch_size=None, limit=None, now=None):
+    """
+    Archives every post quiet for `older_than` (default ARCHIVE_AFTER_DAYS),
+    at most `limit` of them, `batch_size` posts per transaction so the hot
+    database is never locked for long. Returns (posts, comments) moved.
+    """
+    if older_than is None:
+        older_than = timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS))
+    batch_size = batch_size or getattr(settings, 'ARCHIVE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    now = now or timezone.now()
+    cutoff = now - older_than
+
+    moved_posts = moved_comments = 0
+    last_id = 0
+    while limit is None or moved_posts < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved_posts)
+        ids = list(archivable(cutoff).filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:size])
+        if not ids:
+            break
+        posts, comments = archive_batch(ids, cutoff, now)
+        moved_posts += posts
+        moved_comments += comments
+        last_id = ids[-1]
+    return moved_posts, moved_comments
+
+# ===================================================================
+# QUERYSETS
+# ===================================================================
+
+def archived_comment_queryset():
+    """Archived comments, oldest first (like feed.comment_queryset)."""
+    return ArchivedComment.objects.db_manager(hints=feed_read_hints()).order_by('created_at')
+
+
+def archived_post_queryset(with_comments=False):
+    """Archived posts, newest first (like feed.post_queryset; archived posts have no media)."""
+    qs = ArchivedPost.objects.db_manager(hints=feed_read_hints()).order_by('-created_at', '-id')
+    if with_comments:
+        comments = archived_comment_queryset().order_by('post_id', 'created_at')
+        qs = qs.prefetch_related(Prefetch('comments', queryset=comments, to_attr='feed_comments'))
+    return qs
+
+
+def archived_feed_queryset(user, is_admin, with_comments=False):
+    """archived_post_queryset() restricted to what this viewer may see (as feed.feed_queryset)."""
+    qs = archived_post_queryset(with_comments=with_comments)
+    if is_admin:
+        return qs
+    return qs.filter(Q(is_hidden=False, is_suppressed=False) | Q(author_id=user.id))
+
+# ===================================================================
+# READING HOT + COLD
+# ===================================================================
+
+def find_post(post_id):
+    """
+    (post, list of comments) from the hot tables, else from the archive, with
+    their author cards attached. Raises Post.DoesNotExist when neither has it.
+    """
+    try:
+        post = post_queryset().get(id=post_id)
+        comments = comment_queryset().filter(post=post)
+    except Post.DoesNotExist:
+        # Archived rows are written before the hot ones go, so a miss above means it is here (or nowhere)
+        try:
+            post = archived_post_queryset().get(id=post_id)
+        except ArchivedPost.DoesNotExist:
+            raise Post.DoesNotExist(f"No post {post_id}")
+        comments = archived_comment_queryset().filter(post_id=post.id)
+    post, *comments = attach_author_cards([post, *comments])
+    return post, comments
+
+
+async def afind_post(post_id):
+    """Async twin of find_post(); returns (post, list of comments)."""
+    try:
+        post = await post_queryset().aget(id=post_id)
+        comments = comment_queryset().filter(post=post)
+    except Post.DoesNotExist:
+        try:
+            post = await archived_post_queryset().aget(id=post_id)
+        except ArchivedPost.DoesNotExist:
+            raise Post.DoesNotExist(f"No post {post_id}")
+        comments = archived_comment_queryset().filter(post_id=post.id)
+    post, *comments = await aattach_author_cards([post, *[c async for c in comments]])
+    return post, comments
+
+
+def archived_ids(model, ids):
+    """The ids in `ids` of Post (or Comment) rows that now live in the archive."""
+    archived = {Post: ArchivedPost, Comment: ArchivedComment}[model]
+    return set(archived.objects.filter(id__in=ids).values_list('id', flat=True))
+
+
+def _newest_first(post):
+    return post.created_at, post.id
+
+
+def merge_posts(hot, cold):
+    """
+    Two newest-first post iterables as one, newest first. A post in both (an
+    interrupted archive run) comes out once, from the hot side.
+    """
+    last_id = None
+    # Equal keys come out hot first and next to each other
+    for post in heapq.merge(hot, cold, key=_newest_first, reverse=True):
+        if post.id != last_id:
+            yield post
+        last_id = post.id
+
+
+async def amerge_posts(hot, cold):
+    """Async twin of merge_posts() for two async iterables."""
+    hot, cold = aiter(hot), aiter(cold)
+    a, b = await anext(hot, None), await anext(cold, None)
+    last_id = None
+    while a is not None or b is not None:
+        if b is None or (a is not None and _newest_first(a) >= _newest_first(b)):
+            post, a = a, await anext(hot, None)
+        else:
+            post, b = b, await anext(cold, None)
+        if post.id != last_id:
+            yield post
+        last_id = post.id
+
+
+def merged_page(hot, cold, cursor, limit):
+    """feed.keyset_page() over hot and archived posts together; (posts, next_cursor)."""
+    rows = merge_posts(attach_author_cards(keyset_queryset(hot, cursor)[:limit + 1]),
+                       attach_author_cards(keyset_queryset(cold, cursor)[:limit + 1]))
+    return split_page(list(islice(rows, limit + 1)), limit)
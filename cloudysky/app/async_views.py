@@ -0,0 +1,178 @@
+"""
+Async (ASGI) versions of the CloudySky read endpoints.
+
+Same payloads and opt-in modes as dump_feed / feed / post_detail in views.py,
+but written with the async ORM (aiterator, aget, afirst) and async cache calls,
+so under uvicorn/daphne (cloudysky/asgi.py) a request waiting on the database
+does not pin a worker thread.
+
+Served under /app/async/...; the sync views stay where they are for WSGI.
+The live event stream (/app/feed/stream) only exists here: it holds its
+connection open, which an ASGI server does for the price of a coroutine.
+"""
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotFound, StreamingHttpResponse
+
+from .archive import afind_post, amerge_posts, archived_feed_queryset, merge_posts
+from .feed import (
+    feed_queryset, can_see_post,
+    page_params, keyset_queryset, split_page, aiter_posts, astream_json_array,
+)
+from .feed_cache import acached_feed, DUMP, FEED
+from .conditional import conditional_feed
+from .events import broker, sse, visible
+from .feed_json import JsonRenderer, json_array, json_response
+from .models import Post
+from .permissions import ais_censor
+from . import reasons
+
+# ===================================================================
+# HELPERS
+# ===================================================================
+
+async def _viewer(request):
+    user = await request.auser()
+    # The renderers look reasons up without querying; read the table now if it is due
+    await reasons.awarm()
+    return user, await ais_censor(user)
+
+
+async def _keyset_page(posts, cursor, limit):
+    rows = [post async for post in aiter_posts(keyset_queryset(posts, cursor)[:limit + 1])]
+    return split_page(rows, limit)
+
+
+async def _merged_page(posts, archived, cursor, limit):
+    # archive.merged_page() with the two reads done async
+    hot = [post async for post in aiter_posts(keyset_queryset(posts, cursor)[:limit + 1])]
+    cold = [post async for post in aiter_posts(keyset_queryset(archived, cursor)[:limit + 1])]
+    return split_page(list(merge_posts(hot, cold))[:limit + 1], limit)
+
+# ===================================================================
+# READ ENDPOINTS
+# ===================================================================
+
+@login_required
+@conditional_feed(DUMP)
+async def dump_feed(request):
+    """Async /app/dumpFeed (see views.dump_feed)."""
+    user, is_admin = await _viewer(request)
+    try:
+        cursor, limit = page_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Bad cursor or limit: {e}")
+    renderer = JsonRenderer(user.id, is_admin)
+    with_archive = bool(request.GET.get('archive'))
+
+    if limit is not None:
+        posts = feed_queryset(user, is_admin, with_comments=True)
+        if with_archive:
+            archived = archived_feed_queryset(user, is_admin, with_comments=True)
+            page, next_cursor = await _merged_page(posts, archived, cursor, limit)
+        else:
+            page, next_cursor = await _keyset_page(posts, cursor, limit)
+        response = json_response(json_array([renderer.dump_post(p) for p in page]))
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    if request.GET.get('stream') or with_archive:
+        posts = aiter_posts(feed_queryset(user, is_admin, with_comments=True))
+        if with_archive:
+            posts = amerge_posts(posts, aiter_posts(archived_feed_queryset(user, is_admin, with_comments=True)))
+        fragments = (renderer.dump_post(p) async for p in posts)
+        if not request.GET.get('stream'):
+            return json_response(json_array([fragment async for fragment in fragments]))
+        return StreamingHttpResponse(astream_json_array(fragments), content_type='application/json')
+
+    return json_response(await acached_feed(DUMP, user, is_admin))
+
+
+@login_required
+@conditional_feed(FEED)
+async def feed(request):
+    """Async /app/feed/ (see views.feed)."""
+    user, is_admin = await _viewer(request)
+    try:
+        cursor, limit = page_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Bad cursor or limit: {e}")
+    renderer = JsonRenderer(user.id, is_admin)
+    posts = feed_queryset(user, is_admin, with_media=True)
+
+    if request.GET.get('sort') == 'activity':
+        if limit is not None:
+            return HttpResponseBadRequest("Cursor paging only supports the default (newest first) order")
+        posts = posts.order_by('-last_activity_at', '-id')
+        fragments = [renderer.feed_post(p) async for p in aiter_posts(posts)]
+        return json_response(json_array(fragments, prefix=b'{"feed": [', suffix=b']}'))
+
+    if limit is not None:
+        page, next_cursor = await _keyset_page(posts, cursor, limit)
+        suffix = b'], "next_cursor": %s}' % renderer.cursor(next_cursor)
+        response = json_response(json_array([renderer.feed_post(p) for p in page], prefix=b'{"feed": [', suffix=suffix))
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    if request.GET.get('stream'):
+        fragments = (renderer.feed_post(p) async for p in aiter_posts(posts))
+        return StreamingHttpResponse(astream_json_array(fragments, prefix=b'{"feed": [', suffix=b']}'),
+                                     content_type='application/json')
+
+    return json_response(b'{"feed": %s}' % await acached_feed(FEED, user, is_admin))
+
+
+@login_required
+@conditional_feed(DUMP)
+async def post_detail(request, post_id):
+    """Async /app/post/<id>/ (see views.post_detail)."""
+    try:
+        post, comments = await afind_post(post_id)
+    except Post.DoesNotExist:
+        raise Http404("No Post matches the given query.")
+
+    user, is_admin = await _viewer(request)
+    if not can_see_post(post, user, is_admin):
+        return HttpResponseNotFound("Post not found.")
+
+    return json_response(JsonRenderer(user.id, is_admin).post_detail(post, comments))
+
+# ===================================================================
+# LIVE EVENTS (server-sent events)
+# ===================================================================
+
+@login_required
+async def feed_stream(request):
+    """
+    /app/feed/stream: new posts/comments and hides as they happen (see events.py),
+    as text/event-stream. Comments on hidden posts only reach censors and the
+    post's author. A ": ping" comment every FEED_STREAM_HEARTBEAT seconds keeps
+    proxies from timing the connection out.
+    """
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would try to buffer this endless stream whole
+        return HttpResponse("The event stream needs an ASGI server", status=501)
+    user, is_admin = await _viewer(request)
+    heartbeat = getattr(settings, 'FEED_STREAM_HEARTBEAT', 15)
+    subscription = broker().subscribe()
+
+    async def events():
+        try:
+            # Reconnect after 3s if the connection drops
+            yield b"retry: 3000\n\n"
+            while True:
+                message = await subscription.get(timeout=heartbeat)
+                if message is None:
+                    yield b": ping\n\n"
+                elif visible(message, user.id, is_admin):
+                    yield sse(message)
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # nginx: don't buffer the stream
+    return response
@@ -0,0 +1,233 @@
+"""
+Author cards: what the feeds show about a user (username, color, user_type).
+
+The feed querysets used to join every post and comment to auth_user and
+app_profile just for a name and a color. Now each worker keeps a card per
+user id in an LRU (AUTHOR_CACHE_SIZE entries) and the querysets select only
+author_id:
+
+- attach_author_cards(rows) looks up the cards of a batch of loaded rows
+  (posts, with the comments prefetched into post.feed_comments) in one go:
+  one dict lookup per row, plus ONE query for the ids this worker does not
+  know yet. Each row keeps its card as row.author_card. feed.iter_posts() /
+  aiter_posts() do it per chunk; async code awaits aattach_author_cards()
+- card_of(row) then gives the card for rendering. A row that was never
+  attached falls back to the LRU and, off the event loop, to one lookup; on
+  the event loop it never queries and renders a blank card instead
+
+User and Profile saves drop the card here and bump a version number in the
+feed cache backend (FEED_CACHE_ALIAS); other workers see the new version on
+their next lookup and drop their whole LRU. That only reaches them if the
+backend is shared (settings_production sets one up): on a locmem cache other
+processes keep their cards until they are evicted, which is only right when
+there is a single process (runserver, the tests).
+"""
+import asyncio
+import threading
+from collections import OrderedDict, namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Profile
+
+DEFAULT_COLOR = "#000000"
+DEFAULT_CACHE_SIZE = 50_000
+LOOKUP_CHUNK = 500  # ids per IN (...) when loading misses
+
+VERSION_KEY = "cloudysky:authors:version"
+
+AuthorCard = namedtuple("AuthorCard", "username color user_type")
+BLANK_CARD = AuthorCard("", DEFAULT_COLOR, Profile.UserType.SERF)
+
+# ===================================================================
+# CACHE
+# ===================================================================
+
+class CardCache:
+    """Bounded LRU of user id -> AuthorCard, tagged with the shared version it was filled under."""
+
+    def __init__(self):
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+        self.version = None
+
+    def get(self, user_id):
+        with self._lock:
+            card = self._cards.get(user_id)
+            if card is not None:
+                self._cards.move_to_end(user_id)
+            return card
+
+    def put_many(self, cards):
+        limit = getattr(settings, 'AUTHOR_CACHE_SIZE', DEFAULT_CACHE_SIZE)
+        with self._lock:
+            self._cards.update(cards)
+            for user_id in cards:
+                self._cards.move_to_end(user_id)
+            while len(self._cards) > limit:
+                self._cards.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._cards.pop(user_id, None)
+
+    def clear(self, version=None):
+        with self._lock:
+            self._cards.clear()
+            self.version = version
+
+    def __len__(self):
+        return len(self._cards)
+
+
+_cards = CardCache()
+
+
+def _shared():
+    return caches[getattr(settings, 'FEED_CACHE_ALIAS', 'default')]
+
+
+def _check_version():
+    """Drops the LRU if another worker changed a user or profile since we filled it."""
+    version = _shared().get(VERSION_KEY)
+    if version != _cards.version:
+        _cards.clear(version)
+
+
+def _bump_version():
+    cache = _shared()
+    previous = _cards.version
+    cache.add(VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(VERSION_KEY)
+    except ValueError:  # evicted in between
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY)
+    if previous is not None and version == previous + 1:
+        # Only our own change, whose card the receiver already dropped: keep the rest
+        _cards.version = version
+    else:
+        _cards.clear(version)
+
+
+def forget(user_id=None):
+    """Drops one user's card (or every card) in this worker."""
+    if user_id is None:
+        _cards.clear(_cards.version)
+    else:
+        _cards.discard(user_id)
+
+# ===================================================================
+# LOOKUPS
+# ===================================================================
+
+def _load(user_ids):
+    cards = {}
+    ids = list(user_ids)
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        rows = (User.objects.filter(id__in=ids[start:start + LOOKUP_CHUNK])
+                .values_list('id', 'username', 'profile__color', 'profile__user_type'))
+        for user_id, username, color, user_type in rows:
+            # LEFT JOIN: a user without a profile renders in black, as a SERF
+            cards[user_id] = AuthorCard(username, color or DEFAULT_COLOR, user_type or Profile.UserType.SERF)
+    return cards
+
+
+def author_cards(user_ids):
+    """{user id: AuthorCard} for `user_ids`; one query for the ones not cached (none if all are)."""
+    _check_version()
+    found, missing = {}, set()
+    for user_id in set(user_ids):
+        card = _cards.get(user_id)
+        if card is None:
+            missing.add(user_id)
+        else:
+            found[user_id] = card
+    if missing:
+        loaded = _load(missing)
+        _cards.put_many(loaded)
+        found.update(loaded)
+    return found
+
+
+def author_card(user_id):
+    """One user's card: cached, else (off the event loop) one lookup, else BLANK_CARD."""
+    card = _cards.get(user_id)
+    if card is None:
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return author_cards([user_id]).get(user_id, BLANK_CARD)
+        # The ORM refuses to run on the event loop; rows rendered there are attached first
+        return BLANK_CARD
+    return card
+
+
+def card_of(row):
+    """The card to render a post or comment with (see attach_author_cards)."""
+    card = getattr(row, 'author_card', None)
+    return card if card is not None else author_card(row.author_id)
+
+# ===================================================================
+# ATTACHING
+# ===================================================================
+
+def attach_author_cards(rows):
+    """
+    Looks up the authors of `rows` (posts or comments; a post's prefetched
+    feed_comments too) in one author_cards() call and keeps each card on its
+    row as row.author_card. Returns the rows as a list.
+
+    Renderers read the card off the row, so nothing evicted or invalidated in
+    between can send them back to the database.
+    """
+    rows = list(rows)
+    everything = rows + [comment for row in rows for comment in getattr(row, 'feed_comments', ())]
+    cards = author_cards({obj.author_id for obj in everything})
+    for obj in everything:
+        # A dangling author id (user deleted under archived rows) renders blank
+        obj.author_card = cards.get(obj.author_id, BLANK_CARD)
+    return rows
+
+
+async def aattach_author_cards(rows):
+    """attach_author_cards() for async views: the lookup runs off the event loop."""
+    return await sync_to_async(attach_author_cards)(rows)
+
+# ===================================================================
+# INVALIDATION
+# ===================================================================
+
+def _changed(user_id):
+    forget(user_id)
+    _bump_version()
+    # A reader may reload the old row before we commit; tell everyone again after
+    transaction.on_commit(lambda: _committed(user_id))
+
+
+def _committed(user_id):
+    forget(user_id)
+    _bump_version()
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def _profile_changed(sender, instance, created=False, **kwargs):
+    if created:
+        # Comes with its new user (models.create_user_profile), before anyone rendered them
+        forget(instance.user_id)
+        return
+    _changed(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def _user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        # A new user has no card anywhere yet; a login does not change one
+        return
+    _changed(instance.pk)
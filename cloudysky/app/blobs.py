@@ -0,0 +1,126 @@
+"""
+Reference counts and garbage collection for the content-addressed media store
+(app/storage.py).
+
+Blob.refcount is the number of PostMedia file fields (original, thumbnail,
+display) naming that blob. Row saves and deletes keep it current through the
+receivers below; make_renditions() points rows at renditions with
+QuerySet.update() and adds its references with add_refs() itself. Anything that
+bypasses both (raw SQL, loaddata) is fixed by `gc_blobs --recount`.
+
+A blob whose refcount drops to zero is not deleted straight away: an upload
+that hashed to it may be about to save its row. `gc_blobs` deletes
+unreferenced blobs once they have not been touched for a grace period.
+"""
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Blob, PostMedia
+from .storage import BLOB_DIR
+
+FILE_FIELDS = ("media_file", "thumbnail", "display")
+DEFAULT_GRACE = timedelta(hours=1)
+
+# ===================================================================
+# REFERENCE COUNTS
+# ===================================================================
+
+def blob_refs(media):
+    return [getattr(media, field).name for field in FILE_FIELDS if getattr(media, field).name]
+
+
+def add_refs(names, count=1):
+    """Adds `count` references to each name in `names` (negative count drops them)."""
+    for name, n in Counter(names).items():
+        Blob.objects.filter(name=name).update(refcount=F('refcount') + n * count)
+
+
+@receiver(post_init, sender=PostMedia)
+def _remember_refs(sender, instance, **kwargs):
+    instance._blob_refs = blob_refs(instance) if instance.pk else []
+
+
+@receiver(post_save, sender=PostMedia)
+def _media_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old, new = Counter(instance._blob_refs), Counter(blob_refs(instance))
+    if old != new:
+        added, removed = new - old, old - new
+        add_refs(added.elements())
+        add_refs(removed.elements(), -1)
+    instance._blob_refs = list(new.elements())
+
+
+@receiver(post_delete, sender=PostMedia)
+def _media_deleted(sender, instance, **kwargs):
+    add_refs(blob_refs(instance), -1)
+
+# ===================================================================
+# GARBAGE COLLECTION
+# ===================================================================
+
+def recount():
+    """Recomputes every Blob.refcount from the PostMedia rows in one UPDATE."""
+    total = 0
+    for field in FILE_FIELDS:
+        refs = (PostMedia.objects.filter(**{field: OuterRef('name')}).order_by()
+                .values(field).annotate(n=Count('id')).values('n'))
+        total = Coalesce(Subquery(refs), 0) + total
+    return Blob.objects.update(refcount=total)
+
+
+def collect_garbage(storage, grace=DEFAULT_GRACE, batch_size=500, dry_run=False):
+    """
+    Deletes unreferenced blobs not touched within `grace`, then stray files
+    under blobs/ and tmp/ that no Blob row knows about.
+    Returns {"blobs": n, "orphans": n, "bytes": n}.
+    """
+    cutoff = timezone.now() - grace
+    stats = {"blobs": 0, "orphans": 0, "bytes": 0}
+
+    last_id = 0
+    while True:
+        batch = list(Blob.objects.filter(refcount__lte=0, touched_at__lt=cutoff, id__gt=last_id)
+                     .order_by('id').values_list('id', 'name', 'size')[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1][0]
+        for blob_id, name, size in batch:
+            if not dry_run:
+                with transaction.atomic():
+                    # Re-checked in the DELETE: an upload may have touched it meanwhile
+                    deleted, _ = Blob.objects.filter(id=blob_id, refcount__lte=0, touched_at__lt=cutoff).delete()
+                    if not deleted:
+                        continue
+                    storage.delete(name)
+            stats["blobs"] += 1
+            stats["bytes"] += size
+
+    # Files with no Blob row: a deletion that died between the row and the file,
+    # or temp files of uploads that never finished
+    cutoff_ts = cutoff.timestamp()
+    for directory in (BLOB_DIR, "tmp"):
+        root = storage.path(directory)
+        for dirpath, _, filenames in os.walk(root):
+            names = {f"{directory}/{os.path.relpath(os.path.join(dirpath, f), root).replace(os.sep, '/')}"
+                     for f in filenames}
+            known = set(Blob.objects.filter(name__in=names).values_list('name', flat=True))
+            for name in names - known:
+                path = storage.path(name)
+                stat = os.stat(path)
+                if stat.st_mtime >= cutoff_ts:
+                    continue
+                if not dry_run:
+                    os.unlink(path)
+                stats["orphans"] += 1
+                stats["bytes"] += stat.st_size
+    return stats
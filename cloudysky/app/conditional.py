@@ -0,0 +1,122 @@
+"""
+Conditional GET (ETag / Last-Modified) for the feed and post endpoints.
+
+What those endpoints render only changes when the feed generation of their
+kind is bumped (feed_cache.py), so generation + viewer class is a validator
+that costs one cache read: no query, no serialization. The frontend polls
+/app/feed/; a poll whose If-None-Match (or If-Modified-Since) still matches
+gets an empty 304 before the view runs.
+
+Viewer class: censors all see the same body; anyone else may get their own
+hidden items overlaid, so their validator is per user.
+
+The generation is only a validator if every worker sees every bump, so the
+feed cache must be shared (settings_production sets one up). On a
+process-local backend (locmem) a worker that never saw a write would keep
+answering 304 to stale clients; there the decorator sends plain 200s unless
+CONDITIONAL_GET_ON_LOCAL_CACHE says this is the only process (runserver, the
+tests). A dummy cache has no generations at all and never validates.
+"""
+import logging
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .feed_cache import feed_cache, generation, ageneration, last_changed, alast_changed
+from .feed_json import backend
+from .permissions import is_censor, ais_censor
+
+logger = logging.getLogger(__name__)
+_warned = False
+
+
+def shared_generations():
+    """True when every worker sees the same feed generations (or there is only one worker)."""
+    cache = feed_cache()
+    if isinstance(cache, DummyCache):
+        return False
+    if isinstance(cache, LocMemCache):
+        return getattr(settings, 'CONDITIONAL_GET_ON_LOCAL_CACHE', False)
+    return True
+
+
+def _disabled():
+    global _warned
+    if shared_generations():
+        return False
+    if not _warned:
+        _warned = True
+        logger.warning("Conditional GET is off: FEED_CACHE_ALIAS is process-local, so other workers' "
+                       "writes would not change the ETags. Point it at a shared cache.")
+    return True
+
+
+def validators(kind, gen, changed, user, is_admin):
+    """(ETag, Last-Modified as a Unix timestamp or None) for one viewer of one feed generation."""
+    if not shared_generations():
+        raise ImproperlyConfigured("Feed validators need a shared FEED_CACHE_ALIAS (see conditional.py)")
+    viewer = "admin" if is_admin else f"u{user.id}"
+    etag = f'"{kind}-{gen}-{backend()}-{viewer}"'
+    # HTTP dates have one-second resolution. Only advertise a second that is
+    # over, so no later change can share it and look unmodified.
+    last_modified = None
+    if changed is not None and int(changed) < int(time.time()):
+        last_modified = int(changed)
+    return etag, last_modified
+
+
+def _not_modified(request, etag, last_modified):
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def _add_headers(request, response, etag, last_modified):
+    if request.method not in ("GET", "HEAD") or response.status_code not in (200, 304):
+        return response
+    response.headers.setdefault("ETag", etag)
+    if last_modified is not None:
+        response.headers.setdefault("Last-Modified", http_date(last_modified))
+    # Browsers must revalidate every poll (no heuristic freshness off
+    # Last-Modified), and shared caches must not keep per-viewer bodies
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def conditional_feed(kind):
+    """
+    View decorator: answers 304 when the client's copy of a `kind` feed (or a
+    page rendered from the same data) is current. Goes under @login_required.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_inner(request, *args, **kwargs):
+                if _disabled():
+                    return await view(request, *args, **kwargs)
+                user = await request.auser()
+                etag, last_modified = validators(kind, await ageneration(kind), await alast_changed(kind),
+                                                 user, await ais_censor(user))
+                response = _not_modified(request, etag, last_modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _add_headers(request, response, etag, last_modified)
+            return async_inner
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if _disabled():
+                return view(request, *args, **kwargs)
+            etag, last_modified = validators(kind, generation(kind), last_changed(kind),
+                                             request.user, is_censor(request.user))
+            response = _not_modified(request, etag, last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return _add_headers(request, response, etag, last_modified)
+        return inner
+    return decorator
@@ -0,0 +1,247 @@
+"""
+Newline-delimited JSON dumps of a whole CloudySky dataset (export_cloudysky /
+import_cloudysky).
+
+A dump is one JSON object per line: a header, then every row of every table
+in dependency order, each as {"type": <kind>, "data": {<column>: <value>}}.
+Columns are the models' own (attnames, so foreign keys are "author_id") and
+ids are kept, so a dump restores into an empty database as the same graph.
+
+    {"format": "cloudysky", "version": 1, "types": ["reason", "user", ...]}
+    {"type": "reason", "data": {"id": 1, "reason_text": "NIXON", "description": ""}}
+    {"type": "user", "data": {"id": 1, "password": "pbkdf2_sha256$...", ...}}
+
+Both directions stream: export walks each table with a chunked iterator and
+import inserts fixed-size batches as it reads, so memory stays flat however
+big the dump is. Media files, groups and permissions are not included.
+"""
+import gzip
+import io
+import json
+import sys
+from contextlib import ExitStack, contextmanager
+
+from django.contrib.auth.models import User
+from django.db import connections, router, transaction
+
+try:
+    import orjson
+except ImportError:  # optional speedup, as in feed_json.py
+    orjson = None
+
+from .models import ArchivedComment, ArchivedPost, Comment, ModerationEvent, ModerationReason, Post, Profile
+from .search import TRIGGERS, rebuild_search_index
+
+FORMAT = "cloudysky"
+VERSION = 1
+
+# Dump order: every row comes after the rows it points at
+MODELS = {
+    "reason": ModerationReason,
+    "user": User,
+    "profile": Profile,
+    "post": Post,
+    "comment": Comment,
+    "moderation_event": ModerationEvent,
+    "archived_post": ArchivedPost,
+    "archived_comment": ArchivedComment,
+}
+
+# The FTS insert triggers (search.py); dropped during an import, rebuilt in one pass after
+FTS_INSERT_TRIGGERS = ("app_post_fts_ai", "app_comment_fts_ai")
+
+# ===================================================================
+# FILES AND ENCODING
+# ===================================================================
+
+def open_dump(path, mode):
+    """Text-mode handle for `path` ("-" is stdin/stdout, *.gz is gzipped)."""
+    if path == '-':
+        return _Unclosed(sys.stdin if mode == 'r' else sys.stdout)
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8', buffering=io.DEFAULT_BUFFER_SIZE * 16)
+
+
+class _Unclosed:
+    """stdin/stdout for `with`, without closing them."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __enter__(self):
+        return self.stream
+
+    def __exit__(self, *exc):
+        self.stream.flush() if self.stream is sys.stdout else None
+
+
+def _default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def encode(record):
+        return orjson.dumps(record).decode()
+
+    decode = orjson.loads
+else:
+    def encode(record):
+        return json.dumps(record, default=_default, separators=(',', ':'))
+
+    decode = json.loads
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def connection_for(model):
+    # The archive tables may live in a database of their own (routers.py)
+    return connections[router.db_for_write(model)]
+
+
+@contextmanager
+def atomic(models):
+    """One transaction on every database `models` live in."""
+    with ExitStack() as stack:
+        for alias in sorted({router.db_for_write(model) for model in models}):
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+@contextmanager
+def snapshot(models):
+    """
+    One read-only transaction on every database `models` live in, so an
+    export sees a single consistent state.
+
+    Not atomic(): settings_production opens SQLite transactions with BEGIN
+    IMMEDIATE, which would hold the write lock for the whole export. Here
+    SQLite begins DEFERRED (a WAL reader, writers carry on) and PostgreSQL
+    gets a REPEATABLE READ, READ ONLY transaction.
+    """
+    with ExitStack() as stack:
+        for alias in sorted({router.db_for_read(model) for model in models}):
+            connection = connections[alias]
+            connection.ensure_connection()
+            if connection.vendor == 'sqlite':
+                # Read when the transaction begins; put back after it ends (callbacks unwind last)
+                stack.callback(setattr, connection, 'transaction_mode', connection.transaction_mode)
+                connection.transaction_mode = 'DEFERRED'
+            stack.enter_context(transaction.atomic(using=alias))
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        yield
+
+# ===================================================================
+# EXPORT
+# ===================================================================
+
+def header(types):
+    return {"format": FORMAT, "version": VERSION, "types": list(types)}
+
+
+def export_rows(kind, chunk_size=2000):
+    """Every row of one kind as a dump record, in id order, `chunk_size` rows per fetch."""
+    model = MODELS[kind]
+    names = columns(model)
+    rows = model._base_manager.order_by('pk').values_list(*names).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield {"type": kind, "data": dict(zip(names, row))}
+
+# ===================================================================
+# IMPORT
+# ===================================================================
+
+def check_header(record):
+    if record.get("format") != FORMAT:
+        raise ValueError("not a CloudySky dump (first line is not its header)")
+    if record.get("version") != VERSION:
+        raise ValueError(f"dump version {record.get('version')} is not supported (expected {VERSION})")
+
+
+def build(kind, data):
+    """An unsaved model instance from one record's data."""
+    return MODELS[kind](**data)
+
+
+@contextmanager
+def keep_timestamps(models):
+    """
+    Lets bulk_create write the dump's created_at values: auto_now_add fields
+    would otherwise be stamped with "now".
+    """
+    fields = [field for model in models for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now_add', False)]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def secondary_indexes(model):
+    """[(name, CREATE INDEX sql)] of the non-unique indexes on model's table (SQLite/PostgreSQL)."""
+    table = model._meta.db_table
+    connection = connection_for(model)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # sql is NULL for the indexes behind UNIQUE/PRIMARY KEY constraints
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = %s "
+                           "AND sql IS NOT NULL", [table])
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s", [table])
+        else:
+            return []
+        return [(name, sql) for name, sql in cursor.fetchall() if 'UNIQUE' not in sql.upper().split('(')[0]]
+
+
+@contextmanager
+def without_secondary_indexes(models):
+    """
+    Drops the tables' secondary indexes (and, on SQLite, the FTS insert
+    triggers) for the duration: inserting into a heap and building each index
+    once at the end is much faster than updating every index per row.
+    Everything is put back even if the import fails.
+    """
+    dropped = [(model, name, sql) for model in models for name, sql in secondary_indexes(model)]
+    for model, name, _ in dropped:
+        connection = connection_for(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+    triggers = []
+    connection = connection_for(Post)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s)",
+                           list(FTS_INSERT_TRIGGERS))
+            triggers = [row[0] for row in cursor.fetchall()]
+            for name in triggers:
+                cursor.execute(f"DROP TRIGGER {name}")
+    try:
+        yield [name for _, name, _ in dropped]
+    finally:
+        for model, _, sql in dropped:
+            with connection_for(model).cursor() as cursor:
+                cursor.execute(sql)
+        with connection.cursor() as cursor:
+            for name in triggers:
+                cursor.execute(TRIGGERS[name])
+        if triggers:
+            rebuild_search_index(connection)
+
+
+def reset_sequences(models):
+    """Moves id sequences past the imported ids (a no-op on SQLite, which tracks them itself)."""
+    from django.core.management.color import no_style
+    for model in models:
+        connection = connection_for(model)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [model]):
+                cursor.execute(sql)
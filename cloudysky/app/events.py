@@ -0,0 +1,219 @@
+"""
+Live feed events, pushed to browsers over server-sent events (/app/feed/stream).
+
+Writers publish small JSON events once their transaction commits:
+- {"type": "post", "post": <feed entry>}
+- {"type": "comment", "post_id": .., "comment": <comment entry>, "comment_count": .., "visible_comment_count": ..}
+- {"type": "hide_posts", "post_ids": [..]}
+- {"type": "hide_comments", "comment_ids": [..]}
+- {"type": "resync"} when something came back (an unhide)
+
+Events that only some viewers may see (a comment on a hidden post) carry
+`visible_to` user ids; censors get everything.
+
+The broker is pluggable (settings.FEED_EVENTS_BROKER):
+- InProcessBroker (default): fans events out to the stream responses of this
+  process. Enough for one ASGI process (writers running in its threads included).
+- RedisBroker: publishes through a Redis channel so every process sees every
+  event; each process keeps one subscription and fans out locally. Needs `redis`.
+
+There is no replay: a client that reconnects (or falls behind and gets a
+"resync" event) reloads /app/feed/, which is a cheap 304 when nothing changed.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:  # only RedisBroker needs it
+    redis = None
+
+from .feed import comment_entry, feed_entry, is_flagged
+
+logger = logging.getLogger(__name__)
+
+RESYNC = {"event": {"type": "resync"}, "visible_to": None}  # same shape as message()
+
+_broker = None
+_broker_lock = threading.Lock()
+
+# ===================================================================
+# BROKERS
+# ===================================================================
+
+class Subscription:
+    """One stream's queue. get() returns the next message, or None after `timeout` seconds."""
+
+    def __init__(self, broker, loop, queue):
+        self.broker, self.loop, self.queue = broker, loop, queue
+
+    async def get(self, timeout=None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or getattr(settings, 'FEED_EVENTS_QUEUE_SIZE', 100)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """Call from the event loop that will read the subscription."""
+        subscription = Subscription(self, asyncio.get_running_loop(), asyncio.Queue(self.queue_size))
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, message):
+        """Thread-safe; callable from sync views or the event loop."""
+        self.fan_out(message)
+
+    def fan_out(self, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(_offer, subscription.queue, message)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+
+def _offer(queue, message):
+    if queue.full():
+        # A stream that fell this far behind reloads the feed instead
+        while not queue.empty():
+            queue.get_nowait()
+        message = RESYNC
+    queue.put_nowait(message)
+
+
+class RedisBroker(InProcessBroker):
+
+    def __init__(self, url=None, channel=None, **kwargs):
+        if redis is None:
+            raise ImproperlyConfigured("RedisBroker needs the redis package (pip install redis)")
+        super().__init__(**kwargs)
+        self.url = url or settings.FEED_EVENTS_REDIS_URL
+        self.channel = channel or getattr(settings, 'FEED_EVENTS_CHANNEL', 'cloudysky:feed-events')
+        self._client = redis.Redis.from_url(self.url)
+        self._listener = None
+
+    def publish(self, message):
+        self._client.publish(self.channel, json.dumps(message))
+
+    def subscribe(self):
+        subscription = super().subscribe()
+        if self._listener is None or self._listener.done():
+            self._listener = subscription.loop.create_task(self._listen())
+        return subscription
+
+    async def _listen(self):
+        # One Redis subscription per process, relayed to the local streams
+        while True:
+            try:
+                client = redis_asyncio.Redis.from_url(self.url)
+                async with client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for raw in pubsub.listen():
+                        self.fan_out(json.loads(raw["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Feed event subscription lost; reconnecting")
+                # Streams may have missed events meanwhile
+                self.fan_out(RESYNC)
+                await asyncio.sleep(1)
+
+
+def broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(getattr(settings, 'FEED_EVENTS_BROKER', 'app.events.InProcessBroker'))()
+        return _broker
+
+# ===================================================================
+# PUBLISHING
+# ===================================================================
+
+def publish(build):
+    """
+    Sends the message build() returns to the streams once the current
+    transaction commits (right away outside one).
+    """
+    def send():
+        try:
+            broker().publish(build())
+        except Exception:
+            # Live updates are best effort; never fail the write that triggered them
+            logger.exception("Could not publish a feed event")
+    transaction.on_commit(send)
+
+
+def message(event, visible_to=None):
+    return {"event": event, "visible_to": visible_to}
+
+
+def post_created(post):
+    publish(lambda: message({"type": "post", "post": feed_entry(post)}))
+
+
+def comment_created(comment, post):
+    def build():
+        post.refresh_from_db(fields=['comment_count', 'visible_comment_count', 'is_hidden', 'is_suppressed'])
+        event = {
+            "type": "comment",
+            "post_id": post.id,
+            "comment": comment_entry(comment, comment.author, False),
+            "comment_count": post.comment_count,
+            "visible_comment_count": post.visible_comment_count,
+        }
+        # Comments on a hidden post are only news to censors and the post's author
+        return message(event, [post.author_id] if is_flagged(post) else None)
+    publish(build)
+
+
+def posts_hidden(post_ids):
+    post_ids = sorted(post_ids)
+    publish(lambda: message({"type": "hide_posts", "post_ids": post_ids}))
+
+
+def comments_hidden(comment_ids):
+    comment_ids = sorted(comment_ids)
+    publish(lambda: message({"type": "hide_comments", "comment_ids": comment_ids}))
+
+def content_restored():
+    # Rare (an unhide); streams just reload the feed rather than learn a new event type
+    publish(lambda: RESYNC)
+
+# ===================================================================
+# STREAM FORMAT
+# ===================================================================
+
+def visible(message, user_id, is_admin):
+    return is_admin or message["visible_to"] is None or user_id in message["visible_to"]
+
+
+def sse(message):
+    event = message["event"]
+    return b"event: %s\ndata: %s\n\n" % (event["type"].encode(), json.dumps(event).encode())
@@ -0,0 +1,237 @@
+"""
+Feed cache for /app/dumpFeed and /app/feed/.
+
+A feed only depends on the viewer class (censor or not), which posts/comments
+the viewer wrote, and the table contents. So we keep, per feed kind, rendered
+JSON (feed_json.py) in Django's cache framework:
+- admin:  exactly what censors see
+- public: what everyone else sees, plus each author's own hidden items, which
+          are overlaid per request (feed_json.overlay_owned_json)
+
+Keys carry a per-kind generation number. Any write that changes what a feed
+renders bumps the generation (signals below, plus explicit calls for bulk
+QuerySet.update()s that skip signals), so stale entries are never read again
+and simply age out.
+
+The backend is whatever CACHES[FEED_CACHE_ALIAS] points at: locmem by
+default, a cache shared by every worker in settings_production (the
+generations are also the feeds' ETags, see conditional.py).
+"""
+import time
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Profile, Post, Comment, ModerationReason, PostMedia
+from .authors import attach_author_cards
+from .feed import dump_feed_entries, feed_entries, feed_queryset, post_queryset, aiter_posts
+from .feed_json import JsonRenderer, backend, json_array, public_feed_json, overlay_owned_json
+
+DUMP = "dump"
+FEED = "feed"
+FEED_KINDS = (DUMP, FEED)
+
+# Reference (dict) builders; the cached JSON must parse to exactly their output
+BUILDERS = {DUMP: dump_feed_entries, FEED: feed_entries}
+# Per-post JSON renderers, called as RENDERERS[kind](renderer, post)
+RENDERERS = {DUMP: JsonRenderer.dump_post, FEED: JsonRenderer.feed_post}
+
+
+def feed_cache():
+    return caches[getattr(settings, 'FEED_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(kind):
+    return f"cloudysky:feed:{kind}:gen"
+
+
+def generation(kind):
+    """Current generation for a feed kind (starts from the clock, so an evicted counter never rewinds)."""
+    cache = feed_cache()
+    key = _generation_key(kind)
+    gen = cache.get(key)
+    if gen is None:
+        cache.add(key, time.time_ns(), None)
+        gen = cache.get(key)
+    return gen
+
+
+def invalidate(*kinds):
+    """Bumps the generation of the given feed kinds (all of them by default)."""
+    _bump(kinds)
+    # A reader that rebuilt between the bump and the COMMIT cached pre-commit
+    # rows under the new generation; bump once more when the data is visible.
+    transaction.on_commit(partial(_bump, kinds))
+
+
+def _bump(kinds):
+    cache = feed_cache()
+    now = time.time()
+    for kind in kinds or FEED_KINDS:
+        try:
+            cache.incr(_generation_key(kind))
+        except ValueError:
+            # Counter was never set or got evicted
+            cache.set(_generation_key(kind), time.time_ns(), None)
+        cache.set(_changed_key(kind), now, None)
+
+
+def _changed_key(kind):
+    return f"cloudysky:feed:{kind}:changed"
+
+
+def last_changed(kind):
+    """Unix time of the last invalidate(kind), or None if this cache never saw one."""
+    return feed_cache().get(_changed_key(kind))
+
+
+async def alast_changed(kind):
+    return await feed_cache().aget(_changed_key(kind))
+
+
+async def ageneration(kind):
+    """Async twin of generation()."""
+    cache = feed_cache()
+    key = _generation_key(kind)
+    gen = await cache.aget(key)
+    if gen is None:
+        await cache.aadd(key, time.time_ns(), None)
+        gen = await cache.aget(key)
+    return gen
+
+
+def _prefix(kind, gen):
+    # Backends encode non-ASCII differently, so they never share entries
+    return f"cloudysky:feed:{kind}:{backend()}:{gen}"
+
+
+def _primary(posts):
+    # Fills always read the primary: rows from a lagging replica would be
+    # cached under the new generation and outlive the write that bumped it.
+    return posts.using(DEFAULT_DB_ALIAS)
+
+
+def _public_entries(public):
+    """
+    Cache entries for a public_feed_json() result. Most viewers own nothing
+    hidden and only ever load "public" (the shared body) and "owned" (small);
+    "parts" is read just for the authors that need an overlay.
+    """
+    return {"public": json_array(public["parts"]), "owned": public["owned"], "parts": public["parts"]}
+
+
+def cached_feed(kind, user, is_admin):
+    """The full (unpaged) feed of `kind` as `user` sees it, as a JSON array (bytes), from cache when possible."""
+    cache = feed_cache()
+    timeout = getattr(settings, 'FEED_CACHE_TIMEOUT', 300)
+    prefix = _prefix(kind, generation(kind))
+
+    if is_admin:
+        body = cache.get(f"{prefix}:admin")
+        if body is None:
+            renderer, render = JsonRenderer(user.id, True), RENDERERS[kind]
+            posts = _primary(feed_queryset(user, True, with_comments=kind == DUMP, with_media=kind == FEED))
+            body = json_array([render(renderer, post) for post in attach_author_cards(posts)])
+            cache.set(f"{prefix}:admin", body, timeout)
+        return body
+
+    def build():
+        posts = _primary(post_queryset(with_comments=kind == DUMP, with_media=kind == FEED))
+        entries = _public_entries(public_feed_json(kind, attach_author_cards(posts)))
+        cache.set_many({f"{prefix}:{name}": value for name, value in entries.items()}, timeout)
+        return entries
+
+    found = cache.get_many([f"{prefix}:public", f"{prefix}:owned"])
+    if len(found) < 2:
+        entries = build()
+        found = {f"{prefix}:public": entries["public"], f"{prefix}:owned": entries["owned"]}
+
+    slot = found[f"{prefix}:owned"].get(user.id)
+    if slot is None:
+        return found[f"{prefix}:public"]
+    parts = cache.get(f"{prefix}:parts")
+    if parts is None:
+        parts = build()["parts"]
+    return json_array(overlay_owned_json(parts, slot))
+
+async def acached_feed(kind, user, is_admin):
+    """Async twin of cached_feed(): async cache calls, rows fetched with aiterator()."""
+    cache = feed_cache()
+    timeout = getattr(settings, 'FEED_CACHE_TIMEOUT', 300)
+    prefix = _prefix(kind, await ageneration(kind))
+    with_comments = kind == DUMP
+
+    if is_admin:
+        body = await cache.aget(f"{prefix}:admin")
+        if body is None:
+            renderer, render = JsonRenderer(user.id, True), RENDERERS[kind]
+            posts = _primary(feed_queryset(user, True, with_comments=with_comments, with_media=not with_comments))
+            body = json_array([render(renderer, post) async for post in aiter_posts(posts)])
+            await cache.aset(f"{prefix}:admin", body, timeout)
+        return body
+
+    async def build():
+        posts = _primary(post_queryset(with_comments=with_comments, with_media=not with_comments))
+        posts = [post async for post in aiter_posts(posts)]
+        entries = _public_entries(public_feed_json(kind, posts))
+        await cache.aset_many({f"{prefix}:{name}": value for name, value in entries.items()}, timeout)
+        return entries
+
+    found = await cache.aget_many([f"{prefix}:public", f"{prefix}:owned"])
+    if len(found) < 2:
+        entries = await build()
+        found = {f"{prefix}:public": entries["public"], f"{prefix}:owned": entries["owned"]}
+
+    slot = found[f"{prefix}:owned"].get(user.id)
+    if slot is None:
+        return found[f"{prefix}:public"]
+    parts = await cache.aget(f"{prefix}:parts")
+    if parts is None:
+        parts = (await build())["parts"]
+    return json_array(overlay_owned_json(parts, slot))
+
+# ===================================================================
+# INVALIDATION
+# ===================================================================
+
+@receiver([post_save, post_delete], sender=Post)
+def _post_changed(sender, **kwargs):
+    invalidate(DUMP, FEED)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def _comment_changed(sender, **kwargs):
+    # The frontend feed shows comment counts and last activity
+    invalidate(DUMP, FEED)
+
+
+@receiver([post_save, post_delete], sender=PostMedia)
+def _media_changed(sender, **kwargs):
+    # Only the frontend feed lists attachments
+    invalidate(FEED)
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def _profile_changed(sender, **kwargs):
+    # Author colors are part of every feed
+    invalidate(DUMP, FEED)
+
+
+@receiver([post_save, post_delete], sender=ModerationReason)
+def _reason_changed(sender, created=False, **kwargs):
+    # A new reason is on no row yet; a renamed one shows up in "[reason]" prefixes
+    if not created:
+        invalidate(DUMP)
+
+
+@receiver([post_save, post_delete], sender=User)
+def _user_changed(sender, update_fields=None, **kwargs):
+    # Usernames are rendered too, but the last_login bump on every login is not
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    invalidate(DUMP, FEED)
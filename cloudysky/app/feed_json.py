@@ -0,0 +1,294 @@
+"""
+Pre-serialized JSON for the feed endpoints (dumpFeed, feed, post detail).
+
+Building a dict per row, strftime'ing its dates and running the whole list
+through JsonResponse's encoder costs more than the query once feeds get big.
+Instead every post/comment is rendered straight to a JSON fragment (bytes) and
+the response is the fragments spliced together.
+
+Fragments are kept in a bounded in-process store keyed by the row id, its
+`version` (bumped on every save()) and the few fields that bulk UPDATEs and
+other tables can change (flags, counters, author name/color, hidden reason),
+so after a feed cache invalidation only the rows that actually changed are
+re-encoded.
+
+The output parses to exactly what the dict builders in feed.py produce. With
+the stdlib backend (the default) it is also byte-for-byte what JsonResponse
+would send. orjson is opt-in (FEED_JSON_BACKEND = "orjson", or "auto" to use
+it when installed): faster, but it writes non-ASCII text as UTF-8 instead of
+\\u escapes, so clients comparing bytes with the old responses will see a
+difference for non-ASCII posts.
+"""
+import threading
+from itertools import islice
+from json.encoder import encode_basestring_ascii
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional speedup
+    orjson = None
+
+from .authors import attach_author_cards, card_of
+from .feed import REMOVED_COMMENT, is_flagged, revealed_content, post_queryset
+from .media import media_entry
+from .reasons import reason_text
+
+DEFAULT_FRAGMENT_CACHE_SIZE = 200_000
+
+# Comment variants: how a viewer gets to see a comment
+PLAIN, REMOVED, REVEALED = 0, 1, 2
+
+# ===================================================================
+# ENCODING
+# ===================================================================
+
+def _quote_json(value):
+    return encode_basestring_ascii(value).encode()
+
+
+def _quote_orjson(value):
+    try:
+        return orjson.dumps(value)
+    except orjson.JSONEncodeError:
+        # e.g. lone surrogates, which the stdlib escapes happily
+        return _quote_json(value)
+
+
+QUOTERS = {"json": _quote_json, "orjson": _quote_orjson}
+
+
+def backend():
+    """The configured string encoder: "json" (default) or "orjson" ("auto" picks orjson if installed)."""
+    choice = getattr(settings, 'FEED_JSON_BACKEND', 'json')
+    if choice == 'auto':
+        return "orjson" if orjson is not None else "json"
+    if choice not in QUOTERS:
+        raise ImproperlyConfigured(f"FEED_JSON_BACKEND must be auto, json or orjson, not {choice!r}")
+    if choice == "orjson" and orjson is None:
+        raise ImproperlyConfigured("FEED_JSON_BACKEND = 'orjson' but orjson is not installed")
+    return choice
+
+
+def minute(value):
+    """
+    DATE_FORMAT ("%Y-%m-%d %H:%M") without strftime: isoformat is implemented
+    in C and already yields "YYYY-MM-DD HH:MM" followed by the UTC offset.
+    """
+    return value.isoformat(" ", "minutes")[:16].encode()
+
+
+def json_array(fragments, prefix=b"[", suffix=b"]"):
+    return prefix + b", ".join(fragments) + suffix
+
+
+def json_response(body):
+    """HttpResponse for an already-encoded body (what JsonResponse would have sent)."""
+    return HttpResponse(body, content_type="application/json")
+
+# ===================================================================
+# FRAGMENT STORE
+# ===================================================================
+
+class FragmentStore:
+    """Bounded insertion-ordered dict; the oldest tenth goes when it is full."""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def put(self, key, value):
+        limit = getattr(settings, 'FEED_FRAGMENT_CACHE_SIZE', DEFAULT_FRAGMENT_CACHE_SIZE)
+        with self._lock:
+            if len(self._data) >= limit:
+                for old in list(islice(iter(self._data), max(1, limit // 10))):
+                    del self._data[old]
+            self._data[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# One store per backend since their bytes differ
+_stores = {name: FragmentStore() for name in QUOTERS}
+
+
+def clear_fragments():
+    for store in _stores.values():
+        store.clear()
+
+# ===================================================================
+# RENDERER
+# ===================================================================
+
+def _author(row):
+    """(username, color) of a post's or comment's author (authors.card_of)."""
+    card = card_of(row)
+    return card.username, card.color
+
+
+class JsonRenderer:
+    """
+    Renders rows as one viewer sees them.
+    Rows must come from feed.post_queryset()/comment_queryset(), loaded with
+    their author cards attached (authors.py); hidden reasons come from reasons.py.
+    """
+
+    def __init__(self, user_id=None, is_admin=False):
+        self.user_id = user_id
+        self.is_admin = is_admin
+        name = backend()
+        self.quote = QUOTERS[name]
+        self.fragments = _stores[name]
+
+    def comment(self, comment):
+        if not is_flagged(comment):
+            variant = PLAIN
+        elif self.is_admin or comment.author_id == self.user_id:
+            variant = REVEALED
+        else:
+            variant = REMOVED
+        username, color = _author(comment)
+        reason = reason_text(comment.hidden_reason_id) if variant == REVEALED else None
+
+        key = ("comment", comment.id, comment.version, variant, username, color, reason)
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            if variant == PLAIN:
+                content = comment.content
+            elif variant == REMOVED:
+                content = REMOVED_COMMENT
+            else:
+                content = revealed_content(comment)
+            q = self.quote
+            fragment = b'{"id": %d, "username": %s, "content": %s, "date": "%s", "color": %s}' % (
+                comment.id, q(username), q(content), minute(comment.created_at), q(color))
+            self.fragments.put(key, fragment)
+        return fragment
+
+    def dump_post(self, post):
+        """feed.dump_feed_entry() as JSON; comments come from the prefetch."""
+        username, color = _author(post)
+        flagged = is_flagged(post)
+        key = ("dump", post.id, post.version, flagged, username, color)
+        parts = self.fragments.get(key)
+        if parts is None:
+            q = self.quote
+            head = (b'{"id": %d, "title": %s, "username": %s, "author": %s, "date": "%s", '
+                    b'"content": %s, "comments": [') % (
+                post.id, q(post.title), q(username), q(username), minute(post.created_at), q(post.content))
+            tail = b'], "is_suppressed": %s, "color": %s}' % (b"true" if flagged else b"false", q(color))
+            parts = (head, tail)
+            self.fragments.put(key, parts)
+        return parts[0] + b", ".join([self.comment(c) for c in post.feed_comments]) + parts[1]
+
+    def feed_post(self, post):
+        """feed.feed_entry() as JSON."""
+        username, color = _author(post)
+        media = [media_entry(m) for m in post.media.all()]
+        key = ("feed", post.id, post.version, post.is_hidden, username, color,
+               post.comment_count, post.visible_comment_count, post.last_activity_at,
+               tuple((m["id"], m["status"], m["thumbnail"], m["display"]) for m in media))
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            q = self.quote
+            content = post.content
+            short_content = content[:50] + "..." if len(content) > 50 else content
+            last_activity = b'"%s"' % minute(post.last_activity_at) if post.last_activity_at else b"null"
+            fragment = (b'{"id": %d, "title": %s, "username": %s, "date": "%s", "content_truncated": %s, '
+                        b'"is_suppressed": %s, "color": %s, "comment_count": %d, '
+                        b'"visible_comment_count": %d, "last_activity": %s, "media": [%s]}') % (
+                post.id, q(post.title), q(username), minute(post.created_at), q(short_content),
+                b"true" if post.is_hidden else b"false", q(color), post.comment_count,
+                post.visible_comment_count, last_activity, b", ".join(self.media(m) for m in media))
+            self.fragments.put(key, fragment)
+        return fragment
+
+    def media(self, entry):
+        """One media.media_entry() dict (small, rendered with its post)."""
+        q = self.quote
+
+        def url(value):
+            return q(value) if value is not None else b"null"
+
+        return b'{"id": %d, "status": %s, "thumbnail": %s, "display": %s}' % (
+            entry["id"], q(entry["status"]), url(entry["thumbnail"]), url(entry["display"]))
+
+    def post_detail(self, post, comments):
+        """feed.post_detail_entry() as JSON."""
+        username, color = _author(post)
+        key = ("detail", post.id, post.version, username, color)
+        parts = self.fragments.get(key)
+        if parts is None:
+            q = self.quote
+            head = b'{"id": %d, "title": %s, "username": %s, "date": "%s", "content": %s, "comments": [' % (
+                post.id, q(post.title), q(username), minute(post.created_at), q(post.content))
+            parts = (head, b'], "color": %s}' % q(color))
+            self.fragments.put(key, parts)
+        return parts[0] + b", ".join([self.comment(c) for c in comments]) + parts[1]
+
+    def cursor(self, value):
+        return self.quote(value) if value is not None else b"null"
+
+# ===================================================================
+# PUBLIC FEED (for the feed cache)
+# ===================================================================
+
+def public_feed_json(kind, posts=None):
+    """
+    The feed as a viewer who owns nothing sees it, plus what each author gets on top.
+    kind is "dump" (dumpFeed) or "feed" (frontend feed).
+
+    Returns {"parts": [fragment per post], "owned": {user_id: {"posts": [...], "replace": [...]}}}:
+    - posts: (position, fragment) for the author's own hidden posts, as they see them
+    - replace: (position, fragment) for public posts that carry their own hidden
+      comments, re-rendered with those comments revealed
+    Positions index into "parts"; overlay_owned_json() splices them back in.
+    `posts` defaults to every post (async callers pass rows they already fetched).
+    """
+    with_comments = kind == "dump"
+    if posts is None:
+        posts = attach_author_cards(post_queryset(with_comments=with_comments, with_media=not with_comments))
+    public = JsonRenderer()
+    parts, owned = [], {}
+
+    def slot(user_id):
+        return owned.setdefault(user_id, {"posts": [], "replace": []})
+
+    for post in posts:
+        if is_flagged(post):
+            owner = JsonRenderer(post.author_id)
+            fragment = owner.dump_post(post) if with_comments else owner.feed_post(post)
+            slot(post.author_id)["posts"].append((len(parts), fragment))
+            continue
+
+        if with_comments:
+            for user_id in {c.author_id for c in post.feed_comments if is_flagged(c)}:
+                slot(user_id)["replace"].append((len(parts), JsonRenderer(user_id).dump_post(post)))
+            parts.append(public.dump_post(post))
+        else:
+            parts.append(public.feed_post(post))
+
+    return {"parts": parts, "owned": owned}
+
+
+def overlay_owned_json(parts, slot):
+    """Applies one author's slot from public_feed_json() to a copy of the public parts."""
+    parts = list(parts)
+    for pos, fragment in slot["replace"]:
+        parts[pos] = fragment
+
+    # Positions are relative to the public list, so shift past posts already inserted
+    for inserted, (pos, fragment) in enumerate(slot["posts"]):
+        parts.insert(pos + inserted, fragment)
+    return parts
@@ -0,0 +1,49 @@
+"""
+manage.py archive_posts [--days 365] [--batch-size 500] [--limit N] [--dry-run]
+
+Moves posts with no activity for --days (default settings.ARCHIVE_AFTER_DAYS),
+and their comments, from the hot tables to the archive tables (app/archive.py),
+--batch-size posts per transaction. Safe to interrupt and re-run; meant for a
+nightly cron. With ARCHIVE_DATABASE set, migrate that database first:
+
+    python manage.py migrate --database archive
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from app.archive import DEFAULT_AFTER_DAYS, archivable, archive_posts
+
+
+class Command(BaseCommand):
+    help = "Move old, quiet posts and their comments into the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=None,
+                            help="Archive posts quiet for this many days (default ARCHIVE_AFTER_DAYS).")
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help="Posts per transaction (default ARCHIVE_BATCH_SIZE).")
+        parser.add_argument('--limit', type=int, default=None, help="Archive at most this many posts.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'ARCHIVE_AFTER_DAYS', DEFAULT_AFTER_DAYS)
+        if days < 0 or (options['batch_size'] is not None and options['batch_size'] < 1):
+            raise CommandError("--days must not be negative and --batch-size must be positive.")
+        older_than = timedelta(days=days)
+
+        if options['dry_run']:
+            count = archivable(timezone.now() - older_than).count()
+            self.stdout.write(f"{count} posts are older than {days:g} days and would be archived.")
+            return
+
+        start = time.perf_counter()
+        posts, comments = archive_posts(older_than, options['batch_size'], options['limit'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {posts} posts and {comments} comments in {elapsed:.1f}s."))
@@ -0,0 +1,201 @@
+"""
+manage.py bench_app [--scales 1000 10000] [--repeat 10] [--json] [--output FILE] [--compare FILE]
+
+In-process benchmark of the main CloudySky endpoints at several data sizes.
+For each scale it adds synthetic data (app/synthetic.py) until the database
+holds that many posts (a scale below what is already there runs on the
+existing data), then times requests through the full Django stack (test Client,
+middleware included):
+
+- dump_feed / feed:  cold (feed cache, fragments and censor memo emptied
+                     before each request), warm (served from the cache), and a
+                     50-post keyset page
+- post_detail:       the post with the most comments
+- hide_post:         a different visible post each time, as a censor
+- create_post_api / create_comment_api
+
+Reports p50/p95 latency, SQL queries and response bytes per endpoint. All
+rows are created in a transaction that is rolled back at the end, so the
+database is left as it was. --json / --output write a stable, sorted JSON
+document; --compare prints the change against an earlier one, e.g.
+
+    python manage.py bench_app --output before.json
+    git checkout my-branch
+    python manage.py bench_app --compare before.json
+"""
+import json
+import logging
+import platform
+import sqlite3
+import statistics
+import time
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from app import authors, reasons
+from app.feed_cache import feed_cache
+from app.feed_json import clear_fragments
+from app.models import Post
+from app.permissions import forget
+from app.synthetic import censor, generate, viewer
+
+
+class Rollback(Exception):
+    pass
+
+
+def reset_caches():
+    feed_cache().clear()
+    clear_fragments()
+    forget()
+    # Per-worker lookups too, or "cold" runs resolve authors and reasons from memory
+    authors.forget()
+    reasons.forget()
+
+
+class Command(BaseCommand):
+    help = "Benchmark endpoint latency and query counts on synthetic data (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+', default=[1000, 10000], help="Posts per scale.")
+        parser.add_argument('--repeat', type=int, default=10, help="Requests per endpoint and mode.")
+        parser.add_argument('--comments-mean', type=float, default=5.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+        parser.add_argument('--output', help="Also write the JSON results to this file.")
+        parser.add_argument('--compare', help="Earlier JSON results to compare against.")
+
+    def handle(self, *args, **options):
+        results = []
+        # Slow cold requests are the point here, not something to warn about
+        metrics_logger = logging.getLogger("app.metrics")
+        level = metrics_logger.level
+        metrics_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], RATE_LIMIT_ENABLED=False), \
+                    transaction.atomic():
+                for scale in sorted(options['scales']):
+                    # Scales count every post, existing ones included
+                    existing = Post.objects.count()
+                    if scale > existing:
+                        generate(scale - existing, comments_mean=options['comments_mean'],
+                                 seed=options['seed'] + scale)
+                    results += self.run_scale(max(scale, existing), options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            metrics_logger.setLevel(level)
+            reset_caches()
+
+        document = {"environment": environment(), "results": results}
+        text = json.dumps(document, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(text + "\n")
+        if options['json']:
+            self.stdout.write(text)
+        else:
+            self.print_table(results)
+        if options['compare']:
+            with open(options['compare']) as handle:
+                self.print_comparison(json.load(handle)["results"], results)
+
+    # ---------------------------------------------------------------
+    # Measuring
+    # ---------------------------------------------------------------
+
+    def run_scale(self, scale, repeat):
+        # Not one of generate()'s users: none exist when the database already held enough posts
+        reader_user = viewer()
+        moderator = censor()
+        reader, writer, admin = Client(), Client(), Client()
+        reader.force_login(reader_user)
+        writer.force_login(reader_user)
+        admin.force_login(moderator)
+
+        hot = Post.objects.order_by('-comment_count', 'id').first()
+        visible = iter(Post.objects.filter(is_hidden=False, is_suppressed=False).order_by('id')
+                       .values_list('id', flat=True)[:repeat])
+        rows = []
+
+        def bench(endpoint, mode, request, before=None):
+            rows.append(self.measure(scale, endpoint, mode, request, repeat, before))
+
+        for endpoint, url in (("dump_feed", "/app/dumpFeed"), ("feed", "/app/feed/")):
+            bench(endpoint, "cold", lambda i: reader.get(url), before=reset_caches)
+            reader.get(url)
+            bench(endpoint, "warm", lambda i: reader.get(url))
+            bench(endpoint, "page", lambda i: reader.get(url, {"limit": 50}), before=reset_caches)
+        bench("post_detail", "cold", lambda i: reader.get(f"/app/post/{hot.id}/"), before=reset_caches)
+        bench("hide_post", "write", lambda i: admin.post("/app/hidePost", {"post_id": next(visible),
+                                                                             "reason": "SPAM"}))
+        bench("create_post_api", "write", lambda i: writer.post("/app/createPost", {
+            "title": f"bench {i}", "content": "benchmark post"}))
+        bench("create_comment_api", "write", lambda i: writer.post("/app/createComment", {
+            "post_id": hot.id, "content": f"benchmark comment {i}"}))
+        return rows
+
+    @staticmethod
+    def measure(scale, endpoint, mode, request, repeat, before=None):
+        samples, queries, size = [], [], 0
+        for i in range(repeat):
+            if before:
+                before()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = request(i)
+                samples.append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{endpoint} ({mode}) answered {response.status_code}")
+            queries.append(len(captured))
+            size = len(response.content)
+        samples.sort()
+        return {
+            "posts": scale,
+            "endpoint": endpoint,
+            "mode": mode,
+            "p50_ms": round(statistics.median(samples), 2),
+            "p95_ms": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2),
+            "queries": int(statistics.median(queries)),
+            "queries_max": max(queries),
+            "bytes": size,
+        }
+
+    # ---------------------------------------------------------------
+    # Output
+    # ---------------------------------------------------------------
+
+    def print_table(self, results):
+        self.stdout.write(f"{'posts':>7} {'endpoint':<20} {'mode':<6} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'queries':>8} {'bytes':>11}")
+        for row in results:
+            self.stdout.write(f"{row['posts']:>7} {row['endpoint']:<20} {row['mode']:<6} {row['p50_ms']:>9.2f} "
+                              f"{row['p95_ms']:>9.2f} {row['queries']:>8} {row['bytes']:>11}")
+
+    def print_comparison(self, before, after):
+        old = {(r['posts'], r['endpoint'], r['mode']): r for r in before}
+        self.stdout.write(f"\n{'posts':>7} {'endpoint':<20} {'mode':<6} {'p50 before':>11} {'after':>9} "
+                          f"{'change':>8} {'queries':>9}")
+        for row in after:
+            prev = old.get((row['posts'], row['endpoint'], row['mode']))
+            if prev is None:
+                continue
+            change = (row['p50_ms'] - prev['p50_ms']) / prev['p50_ms'] * 100 if prev['p50_ms'] else 0.0
+            queries = f"{prev['queries']}->{row['queries']}" if prev['queries'] != row['queries'] else "same"
+            self.stdout.write(f"{row['posts']:>7} {row['endpoint']:<20} {row['mode']:<6} {prev['p50_ms']:>11.2f} "
+                              f"{row['p50_ms']:>9.2f} {change:>+7.1f}% {queries:>9}")
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "database": connection.vendor,
+    }
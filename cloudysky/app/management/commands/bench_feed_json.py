@@ -0,0 +1,108 @@
+"""
+manage.py bench_feed_json [--sizes 10000 100000] [--comments 1] [--repeat 3]
+
+Compares dumpFeed serialization paths on the same rows:
+- dicts:  dump_feed_entry() per post + json.dumps (what JsonResponse did)
+- cold:   feed_json fragments with an empty fragment store
+- warm:   feed_json fragments again (the usual case after an invalidation)
+for both the stdlib and orjson string encoders. Rows are fetched once up front
+so only serialization is timed. The synthetic posts are inserted inside a
+transaction that is rolled back, so the database is left untouched.
+"""
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.test.utils import override_settings
+
+from app.authors import attach_author_cards
+from app.feed import dump_feed_entry, post_queryset
+from app.feed_json import JsonRenderer, clear_fragments, json_array, orjson
+from app.models import Post, Comment
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark dict+json.dumps vs pre-serialized feed fragments (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--comments', type=int, default=1, help="Comments per post.")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per path (median is reported).")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        backends = ["json"] + (["orjson"] if orjson is not None else [])
+        results = []
+        try:
+            with transaction.atomic():
+                author = User.objects.create_user("bench_feed_author")
+                inserted = 0
+                for size in sorted(options['sizes']):
+                    self._grow(author, size - inserted, options['comments'])
+                    inserted = size
+                    posts = attach_author_cards(post_queryset(with_comments=True)[:size])
+                    row = {"posts": size, "dicts_ms": self._time(lambda: self._dicts(posts), options['repeat'])}
+                    limit = size * (options['comments'] + 1) * 2
+                    for name in backends:
+                        with override_settings(FEED_JSON_BACKEND=name, FEED_FRAGMENT_CACHE_SIZE=limit):
+                            row[f"{name}_cold_ms"] = self._time(lambda: self._fragments(posts, cold=True),
+                                                                options['repeat'])
+                            row[f"{name}_warm_ms"] = self._time(lambda: self._fragments(posts, cold=False),
+                                                                options['repeat'])
+                    results.append(row)
+                raise Rollback
+        except Rollback:
+            pass
+        clear_fragments()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        columns = [key for key in results[0] if key.endswith("_ms")]
+        self.stdout.write(f"{'posts':>8} " + " ".join(f"{c[:-3]:>12}" for c in columns))
+        for row in results:
+            self.stdout.write(f"{row['posts']:>8} " + " ".join(f"{row[c]:>12.1f}" for c in columns))
+        for row in results:
+            best = min(row[c] for c in columns if c != "dicts_ms")
+            self.stdout.write(f"{row['posts']} posts: fastest fragment path is {row['dicts_ms'] / best:.1f}x dicts")
+
+    def _grow(self, author, count, comments):
+        for start in range(0, count, 5000):
+            posts = Post.objects.bulk_create([
+                Post(author=author, title=f"Post {start + i}", content=f"Body of post {start + i} " * 4)
+                for i in range(min(5000, count - start))
+            ])
+            Comment.objects.bulk_create([
+                Comment(author=author, post=post, content=f"Comment {j} on {post.title}")
+                for post in posts for j in range(comments)
+            ])
+
+    @staticmethod
+    def _dicts(posts):
+        viewer = AnonymousUser()
+        return json.dumps([dump_feed_entry(p, viewer, False) for p in posts], cls=DjangoJSONEncoder).encode()
+
+    @staticmethod
+    def _fragments(posts, cold):
+        if cold:
+            clear_fragments()
+        renderer = JsonRenderer()
+        return json_array([renderer.dump_post(p) for p in posts])
+
+    @staticmethod
+    def _time(fn, repeat):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
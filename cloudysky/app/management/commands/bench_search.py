@@ -0,0 +1,90 @@
+"""
+manage.py bench_search [--sizes 1000 10000 100000] [--repeat 20]
+
+Measures /app/search query latency as the corpus grows. For each size it
+bulk-inserts that many synthetic posts (the FTS triggers index them), times a
+fixed set of searches, and reports the median. Everything runs inside a
+transaction that is rolled back, so the database is left untouched.
+
+With an inverted index the time should grow far slower than the corpus
+(compare the "x corpus" and "x latency" columns).
+"""
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from app.models import Post
+from app.search import search
+
+# A few real words plus a long tail of made-up ones, drawn with Zipf-like
+# weights so the corpus has both very common and rare terms, like real text.
+VOCABULARY = (
+    "cloud sky rain storm sun pelican lake river mountain coffee lunch code "
+    "python django database index query cache feed post comment moderator "
+    "spam meme photo travel music game book movie garden city night morning"
+).split() + [f"zq{n:04d}x" for n in range(5000)]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+QUERIES = ["pelican", "coffee lunch", "data", "storm river", "zq0420x", "zq1234x moderator"]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Benchmark FTS5 search latency at several corpus sizes (rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs per query.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(13600)
+        results = []
+        try:
+            with transaction.atomic():
+                author = User.objects.create_user("bench_search_author")
+                inserted = 0
+                for size in sorted(options['sizes']):
+                    self._grow(author, size - inserted, rng)
+                    inserted = size
+                    results.append({"posts": size, "median_ms": self._time(author, options['repeat'])})
+                raise Rollback
+        except Rollback:
+            pass
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        base = results[0]
+        self.stdout.write(f"{'posts':>10} {'median ms':>10} {'x corpus':>9} {'x latency':>10}")
+        for row in results:
+            self.stdout.write(f"{row['posts']:>10} {row['median_ms']:>10.3f} "
+                              f"{row['posts'] / base['posts']:>9.1f} {row['median_ms'] / base['median_ms']:>10.1f}")
+
+    def _grow(self, author, count, rng):
+        batch = []
+        for _ in range(count):
+            words = rng.choices(VOCABULARY, weights=WEIGHTS, k=rng.randint(8, 40))
+            batch.append(Post(author=author, title=" ".join(words[:4]), content=" ".join(words)))
+            if len(batch) == 5000:
+                Post.objects.bulk_create(batch)
+                batch = []
+        Post.objects.bulk_create(batch)
+
+    def _time(self, author, repeat):
+        samples = []
+        for _ in range(repeat):
+            for query in QUERIES:
+                start = time.perf_counter()
+                search(query, author, is_admin=False, limit=20)
+                samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
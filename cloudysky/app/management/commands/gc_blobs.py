@@ -0,0 +1,39 @@
+"""
+manage.py gc_blobs [--recount] [--grace-minutes 60] [--dry-run]
+
+Garbage-collects the content-addressed media store (app/storage.py): deletes
+blobs no PostMedia references any more, plus stray files under blobs/ and
+tmp/ that have no Blob row. Anything touched within the grace period is left
+alone, so it is safe to run while uploads are coming in (cron it).
+
+--recount rebuilds every refcount from the PostMedia rows first; use it after
+anything that wrote PostMedia without going through the ORM.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from app.blobs import DEFAULT_GRACE, collect_garbage, recount
+from app.media import media_storage
+
+
+class Command(BaseCommand):
+    help = "Delete unreferenced media blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help="Recompute refcounts from PostMedia rows first.")
+        parser.add_argument('--grace-minutes', type=float, default=DEFAULT_GRACE.total_seconds() / 60,
+                            help="Leave blobs touched within this many minutes alone.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be deleted.")
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            self.stdout.write(f"Recounted {recount()} blobs.")
+
+        stats = collect_garbage(media_storage(), grace=timedelta(minutes=options['grace_minutes']),
+                                batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {stats['blobs']} unreferenced blobs and {stats['orphans']} stray files "
+            f"({stats['bytes'] / 1024 / 1024:.1f} MiB)."))
@@ -0,0 +1,48 @@
+"""
+manage.py generate_data --posts 100000 [--users N] [--comments-mean 5] [--alpha 1.5]
+                        [--hidden 0.05] [--seed 0] [--clear]
+
+Fills the database with synthetic users, posts and power-law distributed
+comments (app/synthetic.py), a fraction of them hidden with reasons. Every
+synthetic user's password is "password"; "synth_censor" is a censor.
+Point it at a scratch database, e.g.
+
+    CLOUDYSKY_DB_PATH=/tmp/cloudysky.sqlite3 python manage.py generate_data \\
+        --posts 100000 --settings=cloudysky.settings_production
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from app.synthetic import clear, generate
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, posts and comments with bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=None, help="Default: posts / 10.")
+        parser.add_argument('--comments-mean', type=float, default=5.0, help="Mean comments per post.")
+        parser.add_argument('--alpha', type=float, default=1.5,
+                            help="Pareto shape of comments per post (lower = heavier tail).")
+        parser.add_argument('--comments-cap', type=int, default=1000, help="Most comments on one post.")
+        parser.add_argument('--hidden', type=float, default=0.05, help="Fraction of posts/comments hidden.")
+        parser.add_argument('--days', type=int, default=90, help="Spread posts over this many days.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--clear', action='store_true', help="Delete earlier synthetic data first.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            self.stdout.write(f"Deleted {clear()} synthetic rows.")
+
+        start = time.perf_counter()
+        stats = generate(options['posts'], users=options['users'], comments_mean=options['comments_mean'],
+                         alpha=options['alpha'], comments_cap=options['comments_cap'],
+                         hidden=options['hidden'], days=options['days'], seed=options['seed'],
+                         batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {stats['users']} users, {stats['posts']} posts ({stats['hidden_posts']} hidden) and "
+            f"{stats['comments']} comments ({stats['hidden_comments']} hidden) in {elapsed:.1f}s."))
@@ -0,0 +1,37 @@
+"""
+manage.py process_media [--retry-failed]
+
+Builds thumbnails/display renditions for every PostMedia still "pending".
+The upload view hands renditions to an in-process worker pool; anything that
+pool lost (worker restart, crash) is finished here. Runs in the foreground.
+"""
+from django.core.management.base import BaseCommand
+
+from app.media import make_renditions
+from app.models import PostMedia
+
+
+class Command(BaseCommand):
+    help = "Build missing thumbnails/renditions for uploaded post media."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retry-failed', action='store_true',
+                            help="Also retry rows whose renditions failed before.")
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            PostMedia.objects.filter(status=PostMedia.Status.FAILED).update(status=PostMedia.Status.PENDING)
+
+        # make_renditions() also finishes every other row sharing the same bytes,
+        # and always moves its row out of "pending", so this terminates
+        done = 0
+        while True:
+            media = PostMedia.objects.filter(status=PostMedia.Status.PENDING).order_by('id').first()
+            if media is None:
+                break
+            make_renditions(media.id)
+            done += 1
+
+        ready = PostMedia.objects.filter(status=PostMedia.Status.READY).count()
+        failed = PostMedia.objects.filter(status=PostMedia.Status.FAILED).count()
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} files ({ready} ready, {failed} failed)."))
@@ -0,0 +1,123 @@
+"""
+manage.py stress_db [--seconds 10] [--writers 4] [--readers 8]
+
+Concurrent write/read stress test for the database profile in use. Writer
+threads add comments the way createComment does (INSERT + counter UPDATE in
+one transaction) while reader threads pull dumpFeed pages. Reports
+throughput, write latency and how many operations died with "database is
+locked".
+
+Compare the default settings with the WAL profile on a scratch database:
+
+    python manage.py stress_db --settings=cloudysky.settings
+    CLOUDYSKY_DB_PATH=/tmp/cloudysky.sqlite3 python manage.py stress_db \\
+        --settings=cloudysky.settings_production
+
+Rows it creates belong to a throwaway user that is deleted at the end.
+"""
+import json
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.db.models import F
+
+from app.authors import attach_author_cards
+from app.feed import feed_queryset
+from app.models import Post, Comment
+
+STRESS_USERNAME = "stress_db_writer"
+
+
+class Command(BaseCommand):
+    help = "Hammer the database with concurrent comment writes and feed reads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10.0)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--page-size', type=int, default=50, help="Posts per feed read.")
+        parser.add_argument('--json', action='store_true', help="Print results as JSON.")
+
+    def handle(self, *args, **options):
+        User.objects.filter(username=STRESS_USERNAME).delete()
+        author = User.objects.create_user(STRESS_USERNAME)
+        posts = [Post.objects.create(author=author, title=f"stress {i}", content="x") for i in range(20)]
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+
+        stats = {"writes": [], "reads": 0, "write_errors": 0, "read_errors": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def writer(n):
+            i = 0
+            try:
+                while time.perf_counter() < deadline:
+                    post = posts[(n + i) % len(posts)]
+                    i += 1
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            comment = Comment.objects.create(author=author, post=post, content=f"w{n} #{i}")
+                            Post.objects.filter(id=post.id).update(
+                                comment_count=F('comment_count') + 1,
+                                visible_comment_count=F('visible_comment_count') + 1,
+                                last_activity_at=comment.created_at,
+                            )
+                    except OperationalError:
+                        with lock:
+                            stats["write_errors"] += 1
+                        continue
+                    with lock:
+                        stats["writes"].append(time.perf_counter() - start)
+            finally:
+                connections.close_all()
+
+        def reader():
+            try:
+                while time.perf_counter() < deadline:
+                    try:
+                        attach_author_cards(feed_queryset(author, False, with_comments=True)[:options['page_size']])
+                    except OperationalError:
+                        with lock:
+                            stats["read_errors"] += 1
+                        continue
+                    with lock:
+                        stats["reads"] += 1
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        threads += [threading.Thread(target=reader) for _ in range(options['readers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        User.objects.filter(username=STRESS_USERNAME).delete()
+
+        writes = sorted(stats["writes"])
+        result = {
+            "database": str(connections[DEFAULT_DB_ALIAS].settings_dict['NAME']),
+            "journal_mode": journal_mode,
+            "writers": options['writers'],
+            "readers": options['readers'],
+            "writes_per_s": round(len(writes) / elapsed, 1),
+            "reads_per_s": round(stats["reads"] / elapsed, 1),
+            "write_p50_ms": round(statistics.median(writes) * 1000, 2) if writes else None,
+            "write_p99_ms": round(writes[int(len(writes) * 0.99)] * 1000, 2) if writes else None,
+            "write_errors": stats["write_errors"],
+            "read_errors": stats["read_errors"],
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        for key, value in result.items():
+            self.stdout.write(f"{key:>14}: {value}")
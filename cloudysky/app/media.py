@@ -0,0 +1,157 @@
+"""
+Media uploads for posts (PostMedia).
+
+Files live in the content-addressed store (app/storage.py): each
+UploadedFile.chunks() chunk is hashed (sha256) and written to a temp file in
+the same pass, so no upload is ever held in memory whole. If those bytes were
+stored before, the temp file is dropped (no second write) and the new row
+points at the existing blob; otherwise the temp file is moved into place.
+Renditions are stored the same way.
+
+Thumbnails and display-size renditions are produced off the request thread by
+a small worker pool once the upload's transaction commits. The feed serves
+those URLs; rows stay "pending" until their renditions exist. Renditions lost
+to a restart are picked up again by `manage.py process_media`.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # renditions are optional
+    Image = None
+
+from .models import PostMedia
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each rendition
+RENDITION_SIZES = {"thumbnail": 320, "display": 1280}
+IMAGE_TYPES = ("image/jpeg", "image/png", "image/gif", "image/webp")
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# ===================================================================
+# STREAMING UPLOADS
+# ===================================================================
+
+def media_storage():
+    return PostMedia._meta.get_field('media_file').storage
+
+
+def save_upload(post, upload):
+    """
+    Stores one uploaded file for `post` and queues its renditions.
+    Returns (PostMedia, deduplicated).
+    """
+    stored = media_storage().save_chunks(upload.chunks(), os.path.splitext(upload.name)[1])
+    content_type = upload.content_type or ""
+    media = PostMedia(post=post, media_file=stored.name, sha256=stored.sha256, size=stored.size,
+                      content_type=content_type)
+    existing = PostMedia.objects.filter(sha256=stored.sha256).exclude(media_file="").first()
+    if existing is not None:
+        # Same bytes already attached somewhere: share whatever renditions it has
+        media.thumbnail.name = existing.thumbnail.name
+        media.display.name = existing.display.name
+        media.status = existing.status
+    else:
+        media.status = PostMedia.Status.PENDING if wants_renditions(content_type) else PostMedia.Status.NONE
+    media.save()
+
+    if existing is None and media.status == PostMedia.Status.PENDING:
+        transaction.on_commit(partial(schedule_renditions, media.id))
+    return media, not stored.created
+
+
+def wants_renditions(content_type):
+    return Image is not None and content_type in IMAGE_TYPES
+
+# ===================================================================
+# RENDITIONS (worker pool)
+# ===================================================================
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'MEDIA_RENDITION_WORKERS', 2),
+                                           thread_name_prefix="media-renditions")
+        return _executor
+
+
+def schedule_renditions(media_id):
+    """Queues renditions for one PostMedia (inline when MEDIA_RENDITIONS_INLINE is set, e.g. tests)."""
+    if getattr(settings, 'MEDIA_RENDITIONS_INLINE', False):
+        make_renditions(media_id)
+    else:
+        executor().submit(_run_in_worker, media_id)
+
+
+def _run_in_worker(media_id):
+    try:
+        make_renditions(media_id)
+    except Exception:
+        logger.exception("Renditions failed for PostMedia %s", media_id)
+    finally:
+        # Worker threads get their own DB connections; don't leak them
+        close_old_connections()
+
+
+def render(image, longest_side):
+    """JPEG bytes of `image` scaled to fit longest_side (never upscaled)."""
+    copy = image.copy()
+    copy.thumbnail((longest_side, longest_side))
+    if copy.mode not in ("RGB", "L"):
+        copy = copy.convert("RGB")
+    out = io.BytesIO()
+    copy.save(out, "JPEG", quality=85, optimize=True)
+    return out.getvalue()
+
+
+def make_renditions(media_id):
+    """Builds the thumbnail/display files for one PostMedia and every row sharing its bytes."""
+    from .blobs import add_refs
+    from .feed_cache import invalidate, FEED
+
+    media = PostMedia.objects.filter(id=media_id).first()
+    if media is None or media.status != PostMedia.Status.PENDING:
+        return
+
+    names = {}
+    try:
+        with media.media_file.open("rb") as handle, Image.open(handle) as image:
+            image = ImageOps.exif_transpose(image)
+            for field, longest_side in RENDITION_SIZES.items():
+                names[field] = media_storage().save(f"{media.sha256}_{longest_side}.jpg",
+                                                    ContentFile(render(image, longest_side)))
+        status = PostMedia.Status.READY
+    except Exception:
+        logger.exception("Could not render PostMedia %s", media_id)
+        status = PostMedia.Status.FAILED
+
+    # Duplicates uploaded while this was pending point at the same bytes
+    with transaction.atomic():
+        updated = PostMedia.objects.filter(sha256=media.sha256, status=PostMedia.Status.PENDING).update(
+            status=status, **names)
+        add_refs(names.values(), updated)
+    invalidate(FEED)
+
+
+def media_entry(media):
+    """What the feed shows for one attachment: precomputed renditions only."""
+    ready = media.status == PostMedia.Status.READY
+    return {
+        "id": media.id,
+        "status": media.status,
+        "thumbnail": media.thumbnail.url if ready and media.thumbnail else None,
+        "display": media.display.url if ready and media.display else None,
+    }
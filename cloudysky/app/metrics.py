@@ -0,0 +1,228 @@
+"""
+Per-view request metrics, exposed in Prometheus text format at /app/metrics.
+
+MetricsMiddleware (first in settings.MIDDLEWARE) times every request and
+records, per view: wall time, SQL query count, SQL time and response size,
+as histograms held in this process's memory (each worker reports its own;
+Prometheus sums them across scrape targets).
+
+SQL is counted by an execute wrapper installed on every database connection
+(connection.execute_wrapper semantics, but attached on connection_created so
+it also sees the queries async views run in sync_to_async threads). The
+wrapper finds the request it belongs to through a context variable, so
+queries from other threads or outside a request are ignored. Queries a
+streaming response runs after the view returned are not counted.
+
+Requests over METRICS_QUERY_BUDGET queries or METRICS_LATENCY_BUDGET_MS are
+logged as warnings (logger "app.metrics") with their SQL. Views that are slow
+by design (password hashing) get their own latency budget in
+METRICS_VIEW_LATENCY_BUDGETS_MS.
+"""
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+_current = contextvars.ContextVar("cloudysky_request_stats", default=None)
+
+# ===================================================================
+# HISTOGRAMS
+# ===================================================================
+
+class Histogram:
+    """Prometheus-style cumulative histogram (bucket counts are stored non-cumulative)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+
+    METRICS = {
+        # name: (help, buckets)
+        "cloudysky_request_duration_seconds": ("Wall time per request.", SECONDS_BUCKETS),
+        "cloudysky_request_queries": ("SQL queries per request.", QUERY_BUCKETS),
+        "cloudysky_request_sql_seconds": ("Time spent in SQL per request.", SECONDS_BUCKETS),
+        "cloudysky_response_size_bytes": ("Response body size (non-streaming responses).", BYTES_BUCKETS),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self.histograms = {name: {} for name in self.METRICS}
+            self.requests = {}  # (view, method, status) -> count
+
+    def record(self, view, method, status, seconds, queries, sql_seconds, size):
+        labels = (view, method)
+        with self._lock:
+            self.requests[labels + (status,)] = self.requests.get(labels + (status,), 0) + 1
+            for name, value in (("cloudysky_request_duration_seconds", seconds),
+                                ("cloudysky_request_queries", queries),
+                                ("cloudysky_request_sql_seconds", sql_seconds),
+                                ("cloudysky_response_size_bytes", size)):
+                if value is None:
+                    continue
+                series = self.histograms[name]
+                if labels not in series:
+                    series[labels] = Histogram(self.METRICS[name][1])
+                series[labels].observe(value)
+
+    def render(self):
+        """Everything in Prometheus text exposition format (0.0.4)."""
+        lines = ["# HELP cloudysky_requests_total Requests handled, by view, method and status.",
+                 "# TYPE cloudysky_requests_total counter"]
+        with self._lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'cloudysky_requests_total{{view="{_escape(view)}",method="{method}",'
+                             f'status="{status}"}} {count}')
+            for name, (help_text, _) in self.METRICS.items():
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (view, method), histogram in sorted(self.histograms[name].items()):
+                    labels = f'view="{_escape(view)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:g}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+registry = Registry()
+
+# ===================================================================
+# SQL ACCOUNTING
+# ===================================================================
+
+class RequestStats:
+
+    def __init__(self, keep_sql):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.keep_sql = keep_sql
+        self.sql = []  # (seconds, sql) for the budget log, at most keep_sql of them
+
+    def add(self, sql, seconds):
+        self.queries += 1
+        self.sql_seconds += seconds
+        if len(self.sql) < self.keep_sql:
+            self.sql.append((seconds, sql))
+
+
+def record_sql(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - start)
+
+
+@receiver(connection_created)
+def _install_wrapper(sender, connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+# ===================================================================
+# MIDDLEWARE
+# ===================================================================
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unresolved>"
+    # The function path, so /x and /x/ routes to one view share a series
+    return match._func_path
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_budget = getattr(settings, 'METRICS_QUERY_BUDGET', 50)
+        self.latency_budget = getattr(settings, 'METRICS_LATENCY_BUDGET_MS', 500) / 1000
+        self.view_latency_budgets = {
+            view: ms / 1000 for view, ms in getattr(settings, 'METRICS_VIEW_LATENCY_BUDGETS_MS', {}).items()
+        }
+        self.keep_sql = getattr(settings, 'METRICS_LOGGED_QUERIES', 100)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, start = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, response, stats, start)
+        return response
+
+    def _start(self):
+        stats = RequestStats(self.keep_sql)
+        return stats, _current.set(stats), time.perf_counter()
+
+    def _finish(self, request, response, stats, start):
+        seconds = time.perf_counter() - start
+        view = view_name(request)
+        registry.record(view, request.method, response.status_code, seconds,
+                        stats.queries, stats.sql_seconds, response_size(response))
+        latency_budget = self.view_latency_budgets.get(view, self.latency_budget)
+        if stats.queries > self.query_budget or seconds > latency_budget:
+            self._log_over_budget(request, view, seconds, stats)
+
+    def _log_over_budget(self, request, view, seconds, stats):
+        listed = "\n".join(f"  {s * 1000:8.2f} ms  {sql}" for s, sql in stats.sql)
+        more = stats.queries - len(stats.sql)
+        if more > 0:
+            listed += f"\n  ... {more} more"
+        logger.warning("Over budget: %s %s (%s) took %.0f ms, %d queries, %.0f ms SQL\n%s",
+                       request.method, request.path, view, seconds * 1000, stats.queries,
+                       stats.sql_seconds * 1000, listed)
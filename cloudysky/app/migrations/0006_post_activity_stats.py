@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_stats(apps, schema_editor):
+    Post = apps.get_model('app', 'Post')
+    Comment = apps.get_model('app', 'Comment')
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+    visible = comments.filter(is_hidden=False, is_suppressed=False)
+    Post.objects.update(
+        comment_count=Coalesce(Subquery(comments.annotate(n=Count('id')).values('n')), 0),
+        visible_comment_count=Coalesce(Subquery(visible.annotate(n=Count('id')).values('n')), 0),
+        last_activity_at=Coalesce(Subquery(comments.annotate(latest=Max('created_at')).values('latest')),
+                                  F('created_at')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_feed_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='last_activity_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='visible_comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['last_activity_at'], name='post_activity_idx'),
+        ),
+        migrations.RunPython(backfill_post_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:46
+
+from django.db import migrations
+
+# External-content FTS5 indexes over app_post(title, content) and
+# app_comment(content). Triggers keep them in sync for every write path,
+# including bulk_create() and QuerySet.update(). The UPDATE triggers only
+# fire when the indexed text changes, not on moderation/count updates.
+FTS_SQL = [
+    """CREATE VIRTUAL TABLE app_post_fts USING fts5(
+        title, content, content='app_post', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER app_post_fts_ai AFTER INSERT ON app_post BEGIN
+        INSERT INTO app_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    """CREATE TRIGGER app_post_fts_ad AFTER DELETE ON app_post BEGIN
+        INSERT INTO app_post_fts(app_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    """CREATE TRIGGER app_post_fts_au AFTER UPDATE OF title, content ON app_post BEGIN
+        INSERT INTO app_post_fts(app_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO app_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    "INSERT INTO app_post_fts(app_post_fts) VALUES ('rebuild')",
+
+    """CREATE VIRTUAL TABLE app_comment_fts USING fts5(
+        content, content='app_comment', content_rowid='id', tokenize='porter unicode61')""",
+    """CREATE TRIGGER app_comment_fts_ai AFTER INSERT ON app_comment BEGIN
+        INSERT INTO app_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER app_comment_fts_ad AFTER DELETE ON app_comment BEGIN
+        INSERT INTO app_comment_fts(app_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER app_comment_fts_au AFTER UPDATE OF content ON app_comment BEGIN
+        INSERT INTO app_comment_fts(app_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO app_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    "INSERT INTO app_comment_fts(app_comment_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS app_post_fts_ai",
+    "DROP TRIGGER IF EXISTS app_post_fts_ad",
+    "DROP TRIGGER IF EXISTS app_post_fts_au",
+    "DROP TABLE IF EXISTS app_post_fts",
+    "DROP TRIGGER IF EXISTS app_comment_fts_ai",
+    "DROP TRIGGER IF EXISTS app_comment_fts_ad",
+    "DROP TRIGGER IF EXISTS app_comment_fts_au",
+    "DROP TABLE IF EXISTS app_comment_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 is SQLite-only; other backends simply get no search index
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0006_post_activity_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+import app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0008_content_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postmedia',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='display',
+            field=models.FileField(blank=True, upload_to=app.models.rendition_path),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='size',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='status',
+            field=models.CharField(choices=[('none', 'No renditions (not an image)'), ('pending', 'Renditions queued'), ('ready', 'Renditions ready'), ('failed', 'Renditions failed')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='postmedia',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to=app.models.rendition_path),
+        ),
+    ]
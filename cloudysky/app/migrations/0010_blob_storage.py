@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:16
+
+import app.models
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0009_media_renditions'),
+    ]
+
+    operations = [
+        # Only the storage changes, nothing in the table: skip SQLite's table rebuild
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='postmedia',
+                    name='display',
+                    field=models.FileField(blank=True, storage=app.models.blob_storage, upload_to=app.models.rendition_path),
+                ),
+                migrations.AlterField(
+                    model_name='postmedia',
+                    name='media_file',
+                    field=models.FileField(storage=app.models.blob_storage, upload_to=app.models.post_media_path),
+                ),
+                migrations.AlterField(
+                    model_name='postmedia',
+                    name='thumbnail',
+                    field=models.FileField(blank=True, storage=app.models.blob_storage, upload_to=app.models.rendition_path),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('refcount', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('touched_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refcount', 'touched_at'], name='app_blob_refcoun_ee30f2_idx')],
+            },
+        ),
+    ]
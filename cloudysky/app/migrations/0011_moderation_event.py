@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_hidden(apps, schema_editor):
+    # The history starts with one "hide" per row that is hidden today
+    ModerationEvent = apps.get_model('app', 'ModerationEvent')
+    for target_type, model_name in (('post', 'Post'), ('comment', 'Comment')):
+        hidden = (apps.get_model('app', model_name).objects.filter(is_hidden=True).order_by('id')
+                  .values_list('id', 'hidden_by_id', 'hidden_reason_id', 'hidden_at', 'created_at'))
+        ModerationEvent.objects.bulk_create(
+            (ModerationEvent(action='hide', target_type=target_type, target_id=pk, moderator_id=moderator,
+                             reason_id=reason, created_at=hidden_at or created_at)
+             for pk, moderator, reason, hidden_at, created_at in hidden.iterator(chunk_size=2000)),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0010_blob_storage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModerationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(choices=[('hide', 'Hidden'), ('unhide', 'Unhidden'), ('reason', 'Reason changed')], max_length=8)),
+                ('target_type', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment')], max_length=8)),
+                ('target_id', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('moderator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='moderation_events', to=settings.AUTH_USER_MODEL)),
+                ('previous_reason', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.moderationreason')),
+                ('reason', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='app.moderationreason')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['target_type', 'target_id', '-id'], name='modevent_target_idx'), models.Index(fields=['moderator', '-id'], name='modevent_moderator_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_hidden, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0011_moderation_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPost',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('author_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=255)),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('is_suppressed', models.BooleanField(default=False)),
+                ('is_hidden', models.BooleanField(default=False)),
+                ('hidden_by_id', models.BigIntegerField(blank=True, null=True)),
+                ('hidden_reason_id', models.BigIntegerField(blank=True, null=True)),
+                ('hidden_at', models.DateTimeField(blank=True, null=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='archpost_created_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedComment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('author_id', models.BigIntegerField()),
+                ('content', models.TextField()),
+                ('created_at', models.DateTimeField()),
+                ('is_suppressed', models.BooleanField(default=False)),
+                ('is_hidden', models.BooleanField(default=False)),
+                ('hidden_by_id', models.BigIntegerField(blank=True, null=True)),
+                ('hidden_reason_id', models.BigIntegerField(blank=True, null=True)),
+                ('hidden_at', models.DateTimeField(blank=True, null=True)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('post', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='comments', to='app.archivedpost')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['post', 'created_at'], name='archcomment_post_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0012_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='moderationevent',
+            name='target_id',
+            field=models.PositiveBigIntegerField(),
+        ),
+    ]
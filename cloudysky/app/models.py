@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -12,6 +14,25 @@ def user_avatar_path(instance, filename):
 def post_media_path(instance, filename):
     return f'posts/post_{instance.post.id}/{filename}'
 
+def rendition_path(instance, filename):
+    return f'renditions/{filename}'
+
+def blob_storage():
+    # Callable so migrations reference it instead of freezing the storage instance
+    from .storage import ContentAddressedStorage
+    return ContentAddressedStorage()
+
+def bump_version(instance, save_kwargs):
+    """
+    Every save() gets a new version, so edits (admin, hide views) can never be
+    served from a stale feed fragment. QuerySet.update() callers only touch the
+    moderation flags and counters, which the fragment keys include directly.
+    """
+    instance.version += 1
+    update_fields = save_kwargs.get('update_fields')
+    if update_fields is not None:
+        save_kwargs['update_fields'] = {*update_fields, 'version'}
+
 # --- MERGED PROFILE MODEL ---
 # This contains BOTH your Admin logic (UserType) AND your Color logic.
 class Profile(models.Model):
@@ -58,15 +79,44 @@ class Post(models.Model):
     hidden_reason = models.ForeignKey(ModerationReason, on_delete=models.SET_NULL, null=True, blank=True)
     hidden_at = models.DateTimeField(null=True, blank=True)
 
+    # Denormalized activity stats, kept current with F() updates by the comment
+    # and moderation views; `manage.py rebuild_post_stats` recomputes them.
+    comment_count = models.PositiveIntegerField(default=0)
+    visible_comment_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    # Bumped by save(); keys the cached JSON fragments in feed_json.py
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed order. SQLite appends the rowid (= id) to every index and can walk it
+            # backwards, so this serves ORDER BY created_at DESC, id DESC without a sort.
+            models.Index(fields=['created_at'], name='post_created_idx'),
+            # Public feed only ever reads visible posts
+            models.Index(fields=['created_at'], name='post_visible_created_idx',
+                         condition=models.Q(is_hidden=False, is_suppressed=False)),
+            # "My posts" half of the non-admin feed filter
+            models.Index(fields=['author', 'created_at'], name='post_author_created_idx'),
+            # ?sort=activity on the frontend feed
+            models.Index(fields=['last_activity_at'], name='post_activity_idx'),
+        ]
 
     def __str__(self):
         return f"Post {self.id} by {self.author.username}"
 
+    def save(self, *args, **kwargs):
+        # A brand new post is its own latest activity
+        if self.last_activity_at is None:
+            self.last_activity_at = timezone.now()
+        bump_version(self, kwargs)
+        super().save(*args, **kwargs)
+
 class Comment(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
+    # No standalone FK index: comment_post_created_idx below starts with post_id and covers it
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', db_index=False)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     is_suppressed = models.BooleanField(default=False)
@@ -77,33 +127,201 @@ class Comment(models.Model):
     hidden_reason = models.ForeignKey(ModerationReason, on_delete=models.SET_NULL, null=True, blank=True)
     hidden_at = models.DateTimeField(null=True, blank=True)
 
+    # Bumped by save(); keys the cached JSON fragments in feed_json.py
+    version = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Comments are always read per post, oldest first
+            models.Index(fields=['post', 'created_at'], name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f"Comment {self.id} on Post {self.post.id}"
 
+    def save(self, *args, **kwargs):
+        bump_version(self, kwargs)
+        super().save(*args, **kwargs)
+
+class Blob(models.Model):
+    """
+    One file in the content-addressed media store (app/storage.py). Each distinct
+    content is stored once; refcount is how many PostMedia file fields point at it.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Last time an upload hashed to this blob; the GC leaves recently touched blobs alone
+    touched_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['refcount', 'touched_at'])]
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount} refs)"
+
 class PostMedia(models.Model):
+    class Status(models.TextChoices):
+        NONE = 'none', 'No renditions (not an image)'
+        PENDING = 'pending', 'Renditions queued'
+        READY = 'ready', 'Renditions ready'
+        FAILED = 'failed', 'Renditions failed'
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='media')
-    media_file = models.FileField(upload_to=post_media_path)
+    media_file = models.FileField(upload_to=post_media_path, storage=blob_storage)
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
+    # Filled in while the upload streams in (app/media.py); sha256 finds duplicates
+    sha256 = models.CharField(max_length=64, blank=True, db_index=True)
+    size = models.PositiveBigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+
+    # Precomputed by the rendition worker pool; the feed serves these, not the original
+    thumbnail = models.FileField(upload_to=rendition_path, storage=blob_storage, blank=True)
+    display = models.FileField(upload_to=rendition_path, storage=blob_storage, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.NONE)
+
     def __str__(self):
         return f"Media for Post {self.post.id}"
 
+class ModerationEvent(models.Model):
+    """
+    Append-only moderation history (app/moderation.py writes it). The is_hidden /
+    hidden_* columns on Post and Comment stay the current state the feeds read;
+    this table is only read by /app/moderation/log.
+    """
+    class Action(models.TextChoices):
+        HIDE = 'hide', 'Hidden'
+        UNHIDE = 'unhide', 'Unhidden'
+        REASON = 'reason', 'Reason changed'
+
+    class Target(models.TextChoices):
+        POST = 'post', 'Post'
+        COMMENT = 'comment', 'Comment'
+
+    action = models.CharField(max_length=8, choices=Action.choices)
+    # No FK: the history outlives deleted posts and comments
+    target_type = models.CharField(max_length=8, choices=Target.choices)
+    target_id = models.PositiveBigIntegerField()
+    moderator = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='moderation_events',
+                                  null=True, blank=True)
+    reason = models.ForeignKey(ModerationReason, on_delete=models.SET_NULL, related_name='+',
+                               null=True, blank=True)
+    previous_reason = models.ForeignKey(ModerationReason, on_delete=models.SET_NULL, related_name='+',
+                                        null=True, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # The log is read newest first (by id), per target or per moderator
+            models.Index(fields=['target_type', 'target_id', '-id'], name='modevent_target_idx'),
+            models.Index(fields=['moderator', '-id'], name='modevent_moderator_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.target_type} {self.target_id}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Moderation events are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("Moderation events are append-only")
+
+class ArchivedPost(models.Model):
+    """
+    A post moved out of app_post by the archive job (app/archive.py), with its
+    original id. Plain integer columns instead of FKs: the archive tables may
+    live in a database of their own (settings.ARCHIVE_DATABASE). Only what
+    dumpFeed and the post page render is kept; the feed counters are not.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    author_id = models.BigIntegerField()
+    title = models.CharField(max_length=255)
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    is_suppressed = models.BooleanField(default=False)
+    is_hidden = models.BooleanField(default=False)
+    hidden_by_id = models.BigIntegerField(null=True, blank=True)
+    hidden_reason_id = models.BigIntegerField(null=True, blank=True)
+    hidden_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Merged into dumpFeed newest first, like post_created_idx
+            models.Index(fields=['created_at'], name='archpost_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived post {self.id}"
+
+
+class ArchivedComment(models.Model):
+    """A comment archived along with its post (same id, same columns as Comment)."""
+    id = models.BigIntegerField(primary_key=True)
+    post = models.ForeignKey(ArchivedPost, on_delete=models.CASCADE, related_name='comments', db_index=False)
+    author_id = models.BigIntegerField()
+    content = models.TextField()
+    created_at = models.DateTimeField()
+    is_suppressed = models.BooleanField(default=False)
+    is_hidden = models.BooleanField(default=False)
+    hidden_by_id = models.BigIntegerField(null=True, blank=True)
+    hidden_reason_id = models.BigIntegerField(null=True, blank=True)
+    hidden_at = models.DateTimeField(null=True, blank=True)
+    version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_at'], name='archcomment_post_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived comment {self.id} on post {self.post_id}"
+
+def post_stats_updates():
+    """
+    Column -> expression map that recomputes Post's denormalized stats from the
+    comment table with correlated subqueries (so a whole batch is one UPDATE).
+    """
+    comments = Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+    visible = comments.filter(is_hidden=False, is_suppressed=False)
+    return {
+        'comment_count': Coalesce(Subquery(comments.annotate(n=Count('id')).values('n')), 0),
+        'visible_comment_count': Coalesce(Subquery(visible.annotate(n=Count('id')).values('n')), 0),
+        'last_activity_at': Coalesce(
+            Subquery(comments.annotate(latest=Max('created_at')).values('latest')),
+            F('created_at'),
+        ),
+    }
+
+
+def rebuild_post_stats(posts=None):
+    """Recomputes comment counts and last activity for `posts` (default: all) in one UPDATE."""
+    if posts is None:
+        posts = Post.objects.all()
+    return posts.update(**post_stats_updates())
+
+
 # --- SIGNALS (The Logic that Creates the Random Color) ---
+def random_color():
+    # HERE IS YOUR COLOR LOGIC: We still generate a random HEX color!
+    return "#{:06x}".format(random.randint(0, 0xFFFFFF))
+
+
 @receiver(post_save, sender=User)
-def create_user_profile(sender, instance, created, **kwargs):
-    if created:
-        # HERE IS YOUR COLOR LOGIC: We still generate a random HEX color!
-        random_color = "#{:06x}".format(random.randint(0, 0xFFFFFF))
-        
+def create_user_profile(sender, instance, created, raw=False, **kwargs):
+    # Only on the INSERT. Later saves (login updating last_login, admin edits)
+    # never touch the Profile row; code that changes a profile saves it itself.
+    # Fixtures (raw) bring their own Profile rows.
+    if created and not raw:
         Profile.objects.create(
             user=instance,
-            color=random_color,        # Saving the color
-            user_type=Profile.UserType.SERF # Defaulting to normal user
+            color=random_color(),            # Saving the color
+            user_type=Profile.UserType.SERF  # Defaulting to normal user
         )
-
-@receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
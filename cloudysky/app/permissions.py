@@ -0,0 +1,152 @@
+"""
+Censor (moderator) permission resolution.
+
+is_censor() used to cost up to five queries per call (two has_perm checks that
+load every permission, the profile and the groups). Now:
+- superuser/staff flags and the username rule are read off the user object (free)
+- the permission, profile and group rules are answered together by ONE query
+  with EXISTS subqueries
+- that answer is memoized on the user object for the rest of the request and
+  in a short-TTL process cache keyed by user id
+
+The process cache is dropped whenever groups, permissions or Profile.user_type
+change (receivers at the bottom). Other worker processes catch up within
+CENSOR_CACHE_TTL seconds.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group, Permission
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import Lower
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Profile
+
+CENSOR_PERMISSIONS = ['change_post', 'delete_post']
+CENSOR_GROUPS = ['censor', 'censors', 'mod', 'mods', 'moderator', 'moderators', 'admin', 'admins']
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+# ===================================================================
+# RESOLVER
+# ===================================================================
+
+def is_censor(user):
+    """
+    Returns True if user is an admin/censor.
+    Checks Superuser, Staff, 'admin' in username, Permissions, Profile type and Groups.
+    """
+    known = _known_censor_bit(user)
+    if known is None:
+        # Permissions / profile / groups: one query, at most once per request
+        known = user._censor_bit = _remember(user, _censor_row(user).first())
+    return known
+
+
+async def ais_censor(user):
+    """Async twin of is_censor() for ASGI views."""
+    known = _known_censor_bit(user)
+    if known is None:
+        known = user._censor_bit = _remember(user, await _censor_row(user).afirst())
+    return known
+
+
+def _known_censor_bit(user):
+    """The answer if it needs no query (flags, username, memo, process cache), else None."""
+    if not user.is_authenticated:
+        return False
+
+    # 1. Standard flags and the username safety net
+    if user.is_superuser or user.is_staff:
+        return True
+    if 'admin' in user.username.lower():
+        return True
+
+    # 2. Already resolved for this request / recently in this process
+    cached = getattr(user, '_censor_bit', None)
+    if cached is not None:
+        return cached
+    with _cache_lock:
+        hit = _cache.get(user.id)
+    if hit is not None and hit[0] > time.monotonic():
+        user._censor_bit = hit[1]
+        return hit[1]
+    return None
+
+
+def _remember(user, row):
+    value = _censor_bit_from_row(row)
+    ttl = getattr(settings, 'CENSOR_CACHE_TTL', 30)
+    with _cache_lock:
+        _cache[user.id] = (time.monotonic() + ttl, value)
+    return value
+
+
+def _censor_row(user):
+    """Permission, profile and group rules for one user as a single-row SELECT."""
+    perms = Permission.objects.filter(content_type__app_label='app', codename__in=CENSOR_PERMISSIONS)
+    return (User.objects
+            .filter(pk=user.pk)
+            .annotate(
+                direct_perm=Exists(perms.filter(user=OuterRef('pk'))),
+                group_perm=Exists(perms.filter(group__user=OuterRef('pk'))),
+                profile_admin=Exists(Profile.objects.filter(user=OuterRef('pk'),
+                                                            user_type=Profile.UserType.ADMIN)),
+                censor_group=Exists(Group.objects.annotate(lname=Lower('name'))
+                                    .filter(user=OuterRef('pk'), lname__in=CENSOR_GROUPS)),
+            )
+            .values_list('is_active', 'direct_perm', 'group_perm', 'profile_admin', 'censor_group'))
+
+
+def _censor_bit_from_row(row):
+    if row is None:
+        return False
+
+    is_active, direct_perm, group_perm, profile_admin, censor_group = row
+    # has_perm() ignores permissions of inactive users; keep that behavior
+    has_perm = is_active and (direct_perm or group_perm)
+    return bool(has_perm or profile_admin or censor_group)
+
+
+def forget(user_id=None):
+    """Drops one user's cached bit (or everyone's)."""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+# ===================================================================
+# INVALIDATION
+# ===================================================================
+
+@receiver([post_save, post_delete], sender=Profile)
+def _profile_changed(sender, instance, **kwargs):
+    forget(instance.user_id)
+
+
+@receiver(post_delete, sender=User)
+def _user_deleted(sender, instance, **kwargs):
+    forget(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def _user_links_changed(sender, instance, reverse, **kwargs):
+    if reverse:
+        # group.user_set / permission.user_set: many users at once
+        forget()
+    else:
+        forget(instance.pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver([post_save, post_delete], sender=Group)
+@receiver([post_save, post_delete], sender=Permission)
+def _groups_changed(sender, **kwargs):
+    # Affects every member of the group
+    forget()
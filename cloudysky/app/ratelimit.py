@@ -0,0 +1,180 @@
+"""
+Token-bucket rate limits for the write endpoints (createPost, createComment, createUser).
+
+Each scope in settings.RATE_LIMITS gives a bucket per logged-in user and/or
+per client IP as (tokens added per second, bucket size):
+
+    RATE_LIMITS = {'create_comment': {'user': (2, 30), 'ip': (5, 60)}, ...}
+
+A request takes one token from every bucket that applies to it, all or
+nothing (one backend call checks them all first); when one is empty the view
+is not run and the client gets 429 with Retry-After. A burst up to the bucket
+size goes through at once, after that the sustained rate applies. Refused
+requests take nothing from any bucket, so hammering does not push the retry
+time further out, and a user over their own limit does not drain the bucket
+of everyone behind the same IP.
+
+Buckets live in a backend (settings.RATE_LIMIT_BACKEND):
+- LocalBackend (default): this process's memory. Each worker limits on its
+  own, so with N workers a client gets up to N times the rate.
+- RedisBackend: one bucket per key shared by every worker, updated by an
+  atomic Lua script. Needs `redis` and RATE_LIMIT_REDIS_URL.
+
+The client IP is REMOTE_ADDR; behind a proxy, have it set REMOTE_ADDR (or
+put a middleware that does so before this) rather than trusting X-Forwarded-For.
+"""
+import functools
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+try:
+    import redis
+except ImportError:  # only RedisBackend needs it
+    redis = None
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# ===================================================================
+# BACKENDS
+# ===================================================================
+
+class LocalBackend:
+    """Buckets in a dict; least recently used keys are dropped past max_keys."""
+
+    def __init__(self, max_keys=None):
+        self.max_keys = max_keys or getattr(settings, 'RATE_LIMIT_MAX_KEYS', 100_000)
+        self._buckets = OrderedDict()  # key -> (tokens, monotonic time of last update)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, size):
+        """Takes a token from `key`'s bucket. Returns 0 if it had one, else the seconds until it will."""
+        return self.take_all([(key, rate, size)])
+
+    def take_all(self, buckets):
+        """
+        Takes a token from every (key, rate, size) bucket if each has one, else
+        from none. Returns 0, or the seconds until the emptiest one refills.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, rate, size in buckets:
+                tokens, updated = self._buckets.pop(key, (size, now))
+                levels.append((key, min(size, tokens + (now - updated) * rate), rate))
+            wait = max([(1 - tokens) / rate for _, tokens, rate in levels if tokens < 1], default=0.0)
+            for key, tokens, _ in levels:
+                self._buckets[key] = (tokens if wait else tokens - 1, now)
+            while len(self._buckets) > self.max_keys:
+                # A forgotten key comes back with a full bucket, which only errs on the lenient side
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# KEYS = buckets, ARGV = rate, size per bucket. Takes from all of them or none.
+# Uses the server clock so workers agree.
+TAKE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels, wait = {}, 0
+for i, key in ipairs(KEYS) do
+  local rate, size = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local state = redis.call('HMGET', key, 'tokens', 'updated')
+  local tokens = tonumber(state[1]) or size
+  local updated = tonumber(state[2]) or now
+  tokens = math.min(size, tokens + math.max(0, now - updated) * rate)
+  if tokens < 1 then wait = math.max(wait, (1 - tokens) / rate) end
+  levels[i] = tokens
+end
+for i, key in ipairs(KEYS) do
+  local rate, size = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local tokens = levels[i]
+  if wait == 0 then tokens = tokens - 1 end
+  redis.call('HSET', key, 'tokens', tostring(tokens), 'updated', tostring(now))
+  redis.call('EXPIRE', key, math.ceil(size / rate) + 1)
+end
+return tostring(wait)
+"""
+
+
+class RedisBackend:
+
+    def __init__(self, url=None, prefix=None):
+        if redis is None:
+            raise ImproperlyConfigured("RedisBackend needs the redis package (pip install redis)")
+        self.prefix = prefix or getattr(settings, 'RATE_LIMIT_KEY_PREFIX', 'cloudysky:ratelimit:')
+        self._client = redis.Redis.from_url(url or settings.RATE_LIMIT_REDIS_URL)
+        self._take = self._client.register_script(TAKE_SCRIPT)
+
+    def take(self, key, rate, size):
+        return self.take_all([(key, rate, size)])
+
+    def take_all(self, buckets):
+        args = [value for _, rate, size in buckets for value in (rate, size)]
+        return float(self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args))
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = import_string(getattr(settings, 'RATE_LIMIT_BACKEND', 'app.ratelimit.LocalBackend'))()
+        return _backend
+
+
+def reset():
+    """Empties every bucket (tests, or after changing RATE_LIMITS)."""
+    backend().clear()
+
+# ===================================================================
+# DECORATOR
+# ===================================================================
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR') or 'unknown'
+
+
+def check(request, scope):
+    """Seconds the client has to wait before `scope` lets it through again (0: go ahead)."""
+    limits = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if not limits or not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+        return 0.0
+    buckets = []
+    if 'ip' in limits:
+        buckets.append((f"{scope}:ip:{client_ip(request)}", *limits['ip']))
+    if 'user' in limits and request.user.is_authenticated:
+        buckets.append((f"{scope}:user:{request.user.pk}", *limits['user']))
+    if not buckets:
+        return 0.0
+    # All or nothing: a request refused by one bucket is charged to none
+    return backend().take_all(buckets)
+
+
+def rate_limit(scope):
+    """View decorator: 429 Too Many Requests once the scope's buckets run dry."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            wait = check(request, scope)
+            if wait:
+                response = HttpResponse("Too many requests, slow down", status=429)
+                response['Retry-After'] = str(math.ceil(wait))
+                return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
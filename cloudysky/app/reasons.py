@@ -0,0 +1,152 @@
+"""
+In-process ModerationReason cache.
+
+There are only a handful of reasons ("NIXON", "SPAM", ...), but every hide
+used to run get_or_create() on one and every feed joined it per hidden
+comment. Now each worker keeps the whole table as two dicts:
+- reason_for(text) gives the moderation views a ModerationReason without a
+  query (get_or_create only the first time a text is ever used)
+- reason_text(reason_id) gives the renderers the "[NIXON]" text, so the feed
+  querysets no longer join app_moderationreason
+
+The table is read in full on first use (one query per worker; Django frowns
+on queries in AppConfig.ready) and again whenever an id turns up that this
+worker has not seen, e.g. a reason another worker created. An id the re-read
+does not find either (a reason deleted under archived rows, say) is
+remembered as missing, so it costs one read rather than one per render.
+Saves and deletes in this process update the dicts once they commit. A
+reason renamed by another worker shows its old text here until the next
+full read.
+
+Lookups never query on the event loop. The async views await warm() before
+rendering; an id first seen during an async render shows as unknown (None)
+and is read by the next warm().
+"""
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import ModerationReason
+
+_by_id = {}
+_by_text = {}
+_missing = set()  # ids the last read did not find
+_unseen = set()   # ids met on the event loop, for the next warm() to look up
+_loaded = False
+_lock = threading.Lock()
+
+# ===================================================================
+# LOADING
+# ===================================================================
+
+def _load():
+    global _loaded
+    rows = list(ModerationReason.objects.values_list('id', 'reason_text'))
+    with _lock:
+        _by_id.clear()
+        _by_text.clear()
+        for reason_id, text in rows:
+            _by_id[reason_id] = text
+            _by_text[text] = reason_id
+        _missing.difference_update(_by_id)
+        _missing.update(reason_id for reason_id in _unseen if reason_id not in _by_id)
+        _unseen.clear()
+        _loaded = True
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def warm():
+    """Reads the table if this worker has not yet, or has met ids it does not know."""
+    if not _loaded or _unseen:
+        _load()
+
+
+async def awarm():
+    if not _loaded or _unseen:
+        await sync_to_async(_load)()
+
+
+def remember(reason_id, text):
+    with _lock:
+        _missing.discard(reason_id)
+        stale = _by_id.get(reason_id)
+        if stale is not None and _by_text.get(stale) == reason_id:
+            del _by_text[stale]
+        _by_id[reason_id] = text
+        _by_text[text] = reason_id
+
+
+def forget(reason_id=None):
+    """Drops one reason (or, with no id, the whole cache; the next lookup reads the table again)."""
+    global _loaded
+    with _lock:
+        if reason_id is None:
+            _by_id.clear()
+            _by_text.clear()
+            _missing.clear()
+            _unseen.clear()
+            _loaded = False
+        else:
+            text = _by_id.pop(reason_id, None)
+            if text is not None and _by_text.get(text) == reason_id:
+                del _by_text[text]
+
+# ===================================================================
+# LOOKUPS
+# ===================================================================
+
+def reason_text(reason_id):
+    """The text of reason `reason_id` (None for None, or for an id no longer in the table)."""
+    if reason_id is None:
+        return None
+    text = _by_id.get(reason_id)
+    if text is None and reason_id not in _missing:
+        with _lock:
+            _unseen.add(reason_id)
+        if not _on_event_loop():
+            _load()
+            text = _by_id.get(reason_id)
+    return text
+
+
+def reason_for(text):
+    """
+    The ModerationReason with this text (None for no text), created the first
+    time the text is used. Free once the text is known to this worker.
+    """
+    if not text:
+        return None
+    warm()
+    reason_id = _by_text.get(text)
+    if reason_id is None:
+        reason, created = ModerationReason.objects.get_or_create(reason_text=text)
+        if not created:
+            # Made by another worker since we read the table
+            remember(reason.pk, reason.reason_text)
+        return reason
+    return ModerationReason(id=reason_id, reason_text=text)
+
+# ===================================================================
+# INVALIDATION
+# ===================================================================
+
+@receiver(post_save, sender=ModerationReason)
+def _reason_saved(sender, instance, **kwargs):
+    # Only once committed: a rolled back INSERT must not leave a dead id behind
+    transaction.on_commit(lambda: remember(instance.pk, instance.reason_text))
+
+
+@receiver(post_delete, sender=ModerationReason)
+def _reason_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: forget(instance.pk))
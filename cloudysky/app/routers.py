@@ -0,0 +1,84 @@
+"""
+Optional database routing: feed reads to a read replica, archive tables to
+an archive database.
+
+The feed querysets (feed.post_queryset / comment_queryset, search) carry a
+FEED_READ hint. When settings.FEED_REPLICA_DATABASE names a configured alias,
+those reads go there; everything else (writes, auth, sessions, is_censor,
+moderation lookups) stays on the primary. With no replica configured the
+router is a no-op.
+
+A replica lags its primary, so anything that must see a write that just
+happened reads the primary explicitly (the feed cache fills do, see
+feed_cache.py).
+
+ArchiveRouter sends ArchivedPost/ArchivedComment (app/archive.py) to
+settings.ARCHIVE_DATABASE when that names a configured alias, e.g. a
+separate SQLite file, and migrates nothing else there. Unset, the archive
+tables sit in the primary database like any other.
+"""
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+FEED_READ = "feed_read"
+ARCHIVE_MODELS = {"archivedpost", "archivedcomment"}
+
+
+def feed_read_hints():
+    # A fresh dict every time: querysets add their own hints to it in place
+    return {FEED_READ: True}
+
+
+def replica_alias():
+    alias = getattr(settings, 'FEED_REPLICA_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+class FeedReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related/prefetched rows come from wherever their parent came from
+            return instance._state.db
+        if hints.get(FEED_READ):
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS if replica_alias() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows
+        return True if replica_alias() else None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary file, never migrated on its own
+        if db == replica_alias():
+            return False
+        return None
+
+
+def archive_alias():
+    alias = getattr(settings, 'ARCHIVE_DATABASE', None)
+    return alias if alias in settings.DATABASES else None
+
+
+class ArchiveRouter:
+    """Listed before FeedReplicaRouter, so archive reads never follow the feed replica hint."""
+
+    def db_for_read(self, model, **hints):
+        if model._meta.model_name in ARCHIVE_MODELS:
+            return archive_alias()
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        alias = archive_alias()
+        if alias is None:
+            return None
+        if app_label == 'app' and model_name in ARCHIVE_MODELS:
+            return db == alias
+        # Nothing else lives in the archive database
+        return False if db == alias else None
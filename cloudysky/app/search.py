@@ -0,0 +1,160 @@
+"""
+Full-text search over posts and comments, backed by SQLite FTS5.
+
+The FTS tables (app_post_fts, app_comment_fts) are external-content indexes
+created by migration 0007 and kept in sync by triggers, so every write path
+(views, admin, bulk_create, QuerySet.update) is covered.
+
+Results are ranked with bm25 (title hits weigh more than body hits), come with
+a highlighted snippet, and follow the dumpFeed visibility rules: hidden posts
+only for censors and their author, hidden comments only for censors and their
+author, and nothing from a post the viewer cannot see.
+"""
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+from django.utils.dateparse import parse_datetime
+
+from .feed import DATE_FORMAT
+from .models import Post
+from .routers import feed_read_hints
+
+MAX_RESULTS = 100
+SNIPPET_TOKENS = 12
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# Visibility predicates: (%(admin)s = 1) short-circuits them for censors
+_POST_VISIBLE = """(%(admin)s = 1 OR p.author_id = %(user)s OR (p.is_hidden = 0 AND p.is_suppressed = 0))"""
+_COMMENT_VISIBLE = """(%(admin)s = 1 OR c.author_id = %(user)s OR (c.is_hidden = 0 AND c.is_suppressed = 0))"""
+
+SEARCH_SQL = f"""
+SELECT 'post' AS kind, p.id, p.id AS post_id, p.title, u.username, p.created_at,
+       snippet(app_post_fts, -1, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet,
+       bm25(app_post_fts, 5.0, 1.0) AS rank
+  FROM app_post_fts
+  JOIN app_post p ON p.id = app_post_fts.rowid
+  JOIN auth_user u ON u.id = p.author_id
+ WHERE app_post_fts MATCH %(query)s AND {_POST_VISIBLE}
+UNION ALL
+SELECT 'comment' AS kind, c.id, p.id AS post_id, p.title, u.username, c.created_at,
+       snippet(app_comment_fts, 0, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet,
+       bm25(app_comment_fts) AS rank
+  FROM app_comment_fts
+  JOIN app_comment c ON c.id = app_comment_fts.rowid
+  JOIN app_post p ON p.id = c.post_id
+  JOIN auth_user u ON u.id = c.author_id
+ WHERE app_comment_fts MATCH %(query)s AND {_COMMENT_VISIBLE} AND {_POST_VISIBLE}
+ORDER BY rank
+LIMIT %(limit)s
+"""
+
+
+def to_match_query(text):
+    """
+    Turns free text into a safe FTS5 query: every word is quoted (so user input
+    can never be FTS syntax) and all words must match; the last one as a prefix.
+    Returns None if there is nothing searchable.
+    """
+    words = _TOKEN.findall(text or "")
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(text, user, is_admin, limit=20):
+    """Ranked posts and comments matching `text` that `user` may see."""
+    query = to_match_query(text)
+    if query is None:
+        return []
+
+    params = {
+        "query": query,
+        "admin": 1 if is_admin else 0,
+        "user": user.id,
+        "limit": max(1, min(limit, MAX_RESULTS)),
+    }
+    using = router.db_for_read(Post, **feed_read_hints()) or DEFAULT_DB_ALIAS
+    with connections[using].cursor() as cursor:
+        cursor.execute(SEARCH_SQL, params)
+        rows = cursor.fetchall()
+
+    results = []
+    for kind, obj_id, post_id, title, username, created_at, snippet, rank in rows:
+        if isinstance(created_at, str):
+            # Raw SQL skips the model field converters
+            created_at = parse_datetime(created_at)
+        results.append({
+            "type": kind,
+            "id": obj_id,
+            "post_id": post_id,
+            "title": title,
+            "username": username,
+            "date": created_at.strftime(DATE_FORMAT),
+            "snippet": snippet,
+            "rank": round(rank, 4),
+        })
+    return results
+
+# ===================================================================
+# INDEX MAINTENANCE
+# ===================================================================
+
+# Same triggers as migration 0007. SQLite drops a table's triggers whenever
+# a later migration rebuilds app_post/app_comment, so they are re-checked
+# after every migrate.
+TRIGGERS = {
+    "app_post_fts_ai": """CREATE TRIGGER IF NOT EXISTS app_post_fts_ai AFTER INSERT ON app_post BEGIN
+        INSERT INTO app_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    "app_post_fts_ad": """CREATE TRIGGER IF NOT EXISTS app_post_fts_ad AFTER DELETE ON app_post BEGIN
+        INSERT INTO app_post_fts(app_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+    END""",
+    "app_post_fts_au": """CREATE TRIGGER IF NOT EXISTS app_post_fts_au AFTER UPDATE OF title, content ON app_post BEGIN
+        INSERT INTO app_post_fts(app_post_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO app_post_fts(rowid, title, content) VALUES (new.id, new.title, new.content);
+    END""",
+    "app_comment_fts_ai": """CREATE TRIGGER IF NOT EXISTS app_comment_fts_ai AFTER INSERT ON app_comment BEGIN
+        INSERT INTO app_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    "app_comment_fts_ad": """CREATE TRIGGER IF NOT EXISTS app_comment_fts_ad AFTER DELETE ON app_comment BEGIN
+        INSERT INTO app_comment_fts(app_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    "app_comment_fts_au": """CREATE TRIGGER IF NOT EXISTS app_comment_fts_au AFTER UPDATE OF content ON app_comment BEGIN
+        INSERT INTO app_comment_fts(app_comment_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO app_comment_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+}
+
+
+def rebuild_search_index(using=connection):
+    """Re-reads every post and comment into the FTS tables."""
+    with using.cursor() as cursor:
+        cursor.execute("INSERT INTO app_post_fts(app_post_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO app_comment_fts(app_comment_fts) VALUES ('rebuild')")
+
+
+@receiver(post_migrate)
+def _ensure_search_triggers(sender, using='default', **kwargs):
+    if sender.name != 'app':
+        return
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                       ['app_%_fts%'])
+        existing = {row[0] for row in cursor.fetchall()}
+        if 'app_post_fts' not in existing:
+            return  # migrated backwards past 0007
+        missing = [name for name in TRIGGERS if name not in existing]
+        for name in missing:
+            cursor.execute(TRIGGERS[name])
+    if missing:
+        # Writes may have happened while the triggers were gone
+        rebuild_search_index(conn)
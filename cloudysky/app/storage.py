@@ -0,0 +1,110 @@
+"""
+Content-addressed file storage for post media.
+
+Every file is stored once, named after the sha256 of its bytes:
+
+    blobs/9f/86/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08.png
+
+Saving hashes the content while it streams to a temp file next to the blobs,
+then either moves the temp file into place or, if that blob already exists,
+drops it: a duplicate upload never costs a second write. Names depend only on
+the bytes, so get_available_name() never renames anything.
+
+Each stored blob gets a Blob row; the rows that point at it keep its refcount
+and `manage.py gc_blobs` deletes blobs nobody references any more (app/blobs.py).
+"""
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+
+CHUNK_SIZE = 64 * 1024
+BLOB_DIR = "blobs"
+
+StoredBlob = namedtuple("StoredBlob", "name sha256 size created")
+
+
+def blob_name(digest, ext=""):
+    return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{ext.lower()}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same bytes, so an existing file is never "taken"
+        return name
+
+    def _save(self, name, content):
+        ext = os.path.splitext(name)[1]
+        if hasattr(content, 'temporary_file_path'):
+            # Already on disk (large Django uploads): hash it, then move it rather than copy
+            path = content.temporary_file_path()
+            digest, size = hash_file(path)
+            return self.store(path, digest, size, ext).name
+        return self.save_chunks(content.chunks(), ext).name
+
+    def temp_dir(self):
+        path = os.path.join(self.location, "tmp")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def save_chunks(self, chunks, ext=""):
+        """Streams `chunks` to a temp file while hashing, then stores it. Returns a StoredBlob."""
+        hasher, size = hashlib.sha256(), 0
+        with tempfile.NamedTemporaryFile(dir=self.temp_dir(), delete=False) as tmp:
+            try:
+                for chunk in chunks:
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    hasher.update(chunk)
+                    tmp.write(chunk)
+                    size += len(chunk)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        return self.store(tmp.name, hasher.hexdigest(), size, ext)
+
+    def store(self, path, digest, size, ext=""):
+        """
+        Puts the finished file at `path` in place as blob `digest`, or discards it
+        if that blob already exists. Returns a StoredBlob.
+        """
+        name = blob_name(digest, ext)
+        # Register (touch) first: gc_blobs never deletes a blob touched within its
+        # grace period, so the existence check below cannot race a collection
+        register_blob(name, digest, size)
+        full_path = self.path(name)
+        created = not os.path.exists(full_path)
+        if created:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # Two concurrent uploads of the same bytes may both get here; the
+            # second rename just replaces identical content
+            file_move_safe(path, full_path, allow_overwrite=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(full_path, self.file_permissions_mode)
+        elif os.path.exists(path):
+            os.unlink(path)
+        return StoredBlob(name, digest, size, created)
+
+
+def hash_file(path):
+    hasher, size = hashlib.sha256(), 0
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def register_blob(name, digest, size):
+    """Creates the Blob row for a stored file, or marks an existing one as just used."""
+    from .models import Blob  # models.py builds this storage, so import late
+
+    now = timezone.now()
+    if not Blob.objects.filter(name=name).update(touched_at=now):
+        Blob.objects.get_or_create(name=name, defaults={"sha256": digest, "size": size, "touched_at": now})
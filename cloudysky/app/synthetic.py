@@ -0,0 +1,155 @@
+"""
+Synthetic CloudySky data for benchmarks and load tests.
+
+generate() adds users (with profiles), posts and comments shaped roughly like
+a real site:
+- posts are spread over the last `days` days, authors drawn with a skew
+  (a few users write most posts)
+- comments per post follow a power law (most posts get a handful, a few get
+  hundreds), each after its post
+- a fraction of posts and comments is hidden by a censor, with a reason
+
+Everything goes in with bulk_create in batches, then one UPDATE per batch
+recomputes the posts' comment stats. Synthetic users are named
+"<prefix>_user_<n>", so clear() can remove the lot (posts/comments cascade).
+"""
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .feed_cache import invalidate
+from .models import Comment, ModerationReason, Post, Profile, random_color, rebuild_post_stats
+
+PREFIX = "synth"
+REASONS = ("SPAM", "NIXON", "OFF-TOPIC", "ABUSE")
+WORDS = ("cloud", "sky", "rain", "sun", "storm", "blue", "grey", "wind", "forecast", "umbrella",
+         "today", "tomorrow", "weekend", "cold", "warm", "snow", "fog", "bright", "dark", "again")
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def comment_count(rng, mean, alpha, cap):
+    """One draw from a Pareto distribution scaled to `mean`, capped at `cap`."""
+    # paretovariate(alpha) - 1 has mean 1 / (alpha - 1)
+    return min(cap, int((rng.paretovariate(alpha) - 1) * mean * (alpha - 1)))
+
+
+def _restamp(model, objs, stamps):
+    """
+    created_at is auto_now_add, which bulk_create overwrites with "now": put the
+    generated times back with one executemany (bulk_update's CASE WHEN is far slower).
+    """
+    ops = connection.ops
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {ops.quote_name(model._meta.db_table)} SET created_at = %s WHERE id = %s",
+            [(ops.adapt_datetimefield_value(stamp), obj.id) for obj, stamp in zip(objs, stamps)])
+    for obj, stamp in zip(objs, stamps):
+        obj.created_at = stamp
+
+
+def censor(prefix=PREFIX):
+    user, created = User.objects.get_or_create(username=f"{prefix}_censor")
+    if created:
+        user.set_password("password")
+        user.save(update_fields=['password'])
+    Profile.objects.filter(user=user).update(user_type=Profile.UserType.ADMIN)
+    return user
+
+
+def viewer(prefix=PREFIX):
+    """A plain (non-censor) synthetic user to read the feeds as, whatever is already in the database."""
+    user, created = User.objects.get_or_create(username=f"{prefix}_viewer")
+    if created:
+        user.set_password("password")
+        user.save(update_fields=['password'])
+    return user
+
+
+def generate(posts, users=None, comments_mean=5.0, alpha=1.5, comments_cap=1000,
+             hidden=0.05, days=90, seed=0, batch_size=5000, prefix=PREFIX):
+    """
+    Adds `posts` posts by `users` new users (default posts // 10, at least 1).
+    All synthetic users share the password "password". Returns counts of what was created.
+    """
+    rng = random.Random(seed)
+    users = users or max(1, posts // 10)
+    now = timezone.now()
+    moderator = censor(prefix)
+    reasons = [ModerationReason.objects.get_or_create(reason_text=text)[0] for text in REASONS]
+    password = make_password("password")  # hashed once, shared by every synthetic user
+
+    def hide(obj, created_at):
+        if rng.random() < hidden:
+            obj.is_hidden = obj.is_suppressed = True
+            obj.hidden_by = moderator
+            obj.hidden_reason = rng.choice(reasons)
+            obj.hidden_at = created_at + timedelta(minutes=rng.randint(1, 600))
+
+    stats = {"users": 0, "posts": 0, "comments": 0, "hidden_posts": 0, "hidden_comments": 0}
+    first = User.objects.filter(username__startswith=f"{prefix}_user_").count()
+    authors = []
+    for start in range(0, users, batch_size):
+        with transaction.atomic():
+            made = User.objects.bulk_create([
+                User(username=f"{prefix}_user_{first + i}", password=password)
+                for i in range(start, min(users, start + batch_size))
+            ])
+            # bulk_create skips post_save, so profiles are created here instead of by the signal
+            Profile.objects.bulk_create([Profile(user=user, color=random_color()) for user in made])
+        authors.extend(user.id for user in made)
+        stats["users"] += len(made)
+
+    # Zipf-ish authorship: weight 1/rank
+    weights = [1 / (rank + 1) for rank in range(len(authors))]
+    span = days * 24 * 3600
+    for start in range(0, posts, batch_size):
+        count = min(posts, start + batch_size) - start
+        with transaction.atomic():
+            batch = []
+            for author_id in rng.choices(authors, weights, k=count):
+                post = Post(author_id=author_id, title=_text(rng, rng.randint(2, 8)).capitalize(),
+                            content=_text(rng, rng.randint(5, 80)))
+                post.created_at = now - timedelta(seconds=rng.randint(0, span))
+                hide(post, post.created_at)
+                batch.append(post)
+            stamps = [post.created_at for post in batch]
+            made = Post.objects.bulk_create(batch)
+            _restamp(Post, made, stamps)
+
+            comments, stamps = [], []
+            for post in made:
+                age = max(1, int((now - post.created_at).total_seconds()))
+                for _ in range(comment_count(rng, comments_mean, alpha, comments_cap)):
+                    comment = Comment(post_id=post.id, author_id=rng.choice(authors),
+                                      content=_text(rng, rng.randint(3, 40)))
+                    stamps.append(post.created_at + timedelta(seconds=rng.randint(1, age)))
+                    hide(comment, stamps[-1])
+                    comments.append(comment)
+            for offset in range(0, len(comments), batch_size):
+                chunk = Comment.objects.bulk_create(comments[offset:offset + batch_size])
+                _restamp(Comment, chunk, stamps[offset:offset + batch_size])
+
+            rebuild_post_stats(Post.objects.filter(id__in=[post.id for post in made]))
+
+        stats["posts"] += len(made)
+        stats["comments"] += len(comments)
+        stats["hidden_posts"] += sum(post.is_hidden for post in made)
+        stats["hidden_comments"] += sum(comment.is_hidden for comment in comments)
+
+    # bulk_create/bulk_update skip the signals the feed cache listens to
+    invalidate()
+    return stats
+
+
+def clear(prefix=PREFIX):
+    """Deletes every synthetic user and, by cascade, their posts and comments."""
+    deleted, _ = User.objects.filter(username__startswith=f"{prefix}_").delete()
+    invalidate()
+    return deleted
@@ -1,3 +1,1529 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from PIL import Image
+
+try:
+    import orjson
+except ImportError:  # optional, like in feed_json.py
+    orjson = None
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase as DjangoTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.contrib.auth.models import AnonymousUser, User, Group, Permission
+from django.contrib.auth.hashers import make_password
+
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import (
+    Profile, Post, Comment, ModerationReason, ModerationEvent, PostMedia, Blob, ArchivedPost, ArchivedComment,
+    rebuild_post_stats,
+)
+from . import authors, conditional, dataset, events, metrics, ratelimit, reasons, schema, synthetic
+from .coalesce import CommentCoalescer
+from .blobs import collect_garbage, recount
+from .media import media_storage
+from .storage import blob_name
+from .feed_json import JsonRenderer, clear_fragments
+from .routers import ArchiveRouter, FeedReplicaRouter, FEED_READ, feed_read_hints
+from .search import search
+from .archive import archive_posts
+from .conditional import validators
+from .feed_cache import feed_cache, cached_feed, generation, BUILDERS, DUMP, FEED
+from .permissions import is_censor, forget
+from .feed import (
+    dump_feed_entries, feed_entries, feed_queryset, iter_posts, keyset_page, parse_cursor,
+    post_detail_entry, post_queryset, dump_feed_entry, feed_entry,
+)
+
+
+class TestCase(DjangoTestCase):
+    """The DB is rolled back between tests but the caches are not; start each test cold."""
+
+    def setUp(self):
+        # Over-budget warnings depend on how fast this machine is; tests that check them use assertLogs
+        metrics_logger = logging.getLogger("app.metrics")
+        self.addCleanup(metrics_logger.setLevel, metrics_logger.level)
+        metrics_logger.setLevel(logging.ERROR)
+        feed_cache().clear()
+        clear_fragments()
+        forget()
+        ratelimit.reset()
+        reasons.forget()
+        authors.forget()
+        super().setUp()
+
+
+def make_posts(author, count, comments_per_post=2):
+    for i in range(count):
+        post = Post.objects.create(author=author, title=f"Post {i}", content=f"Body {i}")
+        for j in range(comments_per_post):
+            Comment.objects.create(author=author, post=post, content=f"Comment {j}")
+
+
+class FeedQueryCountTests(TestCase):
+    """The feed builders must not go back to one query per post/comment."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.other = User.objects.create_user("bob", password="pw")
+
+    def test_dump_feed_query_count_is_constant(self):
+        make_posts(self.user, 3)
+        # Posts, the authors' cards (authors.py), comments
+        with self.assertNumQueries(3):
+            small = dump_feed_entries(self.user, is_admin=False)
+
+        make_posts(self.other, 40, comments_per_post=5)
+        with self.assertNumQueries(3):
+            large = dump_feed_entries(self.user, is_admin=False)
+        # Every author's card is cached now
+        with self.assertNumQueries(2):
+            dump_feed_entries(self.user, is_admin=False)
+
+        self.assertEqual(len(small), 3)
+        self.assertEqual(len(large), 43)
+
+    def test_feed_query_count_is_constant(self):
+        make_posts(self.other, 25)
+        # Posts + the author's card + one media prefetch
+        with self.assertNumQueries(3):
+            feed_entries(self.user, is_admin=False)
+        with self.assertNumQueries(2):
+            feed_entries(self.user, is_admin=False)
+
+    def test_dump_feed_view_queries_do_not_grow(self):
+        self.client.force_login(self.user)
+        make_posts(self.user, 2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get("/app/dumpFeed")
+        make_posts(self.other, 30, comments_per_post=4)
+        forget()
+        with CaptureQueriesContext(connection) as large:
+            self.client.get("/app/dumpFeed")
+        self.assertEqual(len(small), len(large))
+
+
+class DumpFeedOutputTests(TestCase):
+    """Pins the exact JSON that /app/dumpFeed returns."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user("alice", password="pw")
+        self.viewer = User.objects.create_user("bob", password="pw")
+        self.author.profile.color = "#112233"
+        self.author.profile.save()
+        self.viewer.profile.color = "#445566"
+        self.viewer.profile.save()
+
+        reason = ModerationReason.objects.create(reason_text="NIXON")
+        self.post = Post.objects.create(author=self.author, title="Hello", content="World")
+        Comment.objects.create(author=self.viewer, post=self.post, content="first")
+        Comment.objects.create(author=self.viewer, post=self.post, content="spam",
+                               is_hidden=True, hidden_reason=reason)
+        Comment.objects.create(author=self.author, post=self.post, content="rude",
+                               is_hidden=True)
+        Post.objects.create(author=self.author, title="Gone", content="bad", is_hidden=True)
+
+    def test_output_for_regular_viewer(self):
+        self.client.force_login(self.viewer)
+        response = self.client.get("/app/dumpFeed")
+        date = self.post.created_at.strftime("%Y-%m-%d %H:%M")
+        comments = list(self.post.comments.all())
+        self.assertEqual(response.json(), [{
+            "id": self.post.id,
+            "title": "Hello",
+            "username": "alice",
+            "author": "alice",
+            "date": date,
+            "content": "World",
+            "comments": [
+                {"id": comments[0].id, "username": "bob", "content": "first",
+                 "date": comments[0].created_at.strftime("%Y-%m-%d %H:%M"), "color": "#445566"},
+                {"id": comments[1].id, "username": "bob", "content": "[NIXON] spam",
+                 "date": comments[1].created_at.strftime("%Y-%m-%d %H:%M"), "color": "#445566"},
+                {"id": comments[2].id, "username": "alice", "content": "This comment has been removed",
+                 "date": comments[2].created_at.strftime("%Y-%m-%d %H:%M"), "color": "#112233"},
+            ],
+            "is_suppressed": False,
+            "color": "#112233",
+        }])
+
+
+class FeedPagingTests(TestCase):
+    """Keyset ?cursor=&limit= paging and ?stream=1 on dumpFeed and feed."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        make_posts(self.user, 7, comments_per_post=1)
+        # Force created_at ties so the id tie-breaker is exercised
+        first_two = Post.objects.order_by("id")[:2]
+        Post.objects.filter(id__in=[p.id for p in first_two]).update(created_at=first_two[0].created_at)
+        self.client.force_login(self.user)
+
+    def test_cursor_pages_cover_whole_dump_feed(self):
+        full = self.client.get("/app/dumpFeed").json()
+        seen = []
+        response = self.client.get("/app/dumpFeed", {"limit": 3})
+        while True:
+            seen.extend(response.json())
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+            response = self.client.get("/app/dumpFeed", {"cursor": cursor, "limit": 3})
+        self.assertEqual(seen, full)
+
+    def test_feed_page_carries_next_cursor(self):
+        data = self.client.get("/app/feed/", {"limit": 5}).json()
+        self.assertEqual(len(data["feed"]), 5)
+        rest = self.client.get("/app/feed/", {"cursor": data["next_cursor"], "limit": 5}).json()
+        self.assertEqual(len(rest["feed"]), 2)
+        self.assertIsNone(rest["next_cursor"])
+
+    def test_bad_cursor_is_rejected(self):
+        self.assertEqual(self.client.get("/app/dumpFeed", {"cursor": "yesterday,1"}).status_code, 400)
+        self.assertEqual(self.client.get("/app/feed/", {"limit": "0"}).status_code, 400)
+
+    def test_stream_matches_regular_response(self):
+        for url in ("/app/dumpFeed", "/app/feed/"):
+            regular = self.client.get(url).content
+            streamed = self.client.get(url, {"stream": 1})
+            self.assertTrue(streamed.streaming)
+            self.assertEqual(b"".join(streamed.streaming_content), regular)
+
+
+class FeedQueryPlanTests(TestCase):
+    """
+    EXPLAIN QUERY PLAN every query the feed builders issue.
+    Fails if a feed query goes back to a full table scan or a temp B-tree sort.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        other = User.objects.create_user("bob", password="pw")
+        make_posts(self.user, 5)
+        make_posts(other, 5)
+        Post.objects.filter(id__in=Post.objects.values("id")[:3]).update(is_hidden=True)
+
+    def assert_indexed(self, queries):
+        self.assertTrue(queries)
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                for row in cursor.fetchall():
+                    detail = row[-1]
+                    self.assertNotIn("TEMP B-TREE", detail, query["sql"])
+                    if detail.startswith("SCAN app_"):
+                        self.assertIn("USING", detail, query["sql"])
+
+    def capture(self, fn):
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        return ctx.captured_queries
+
+    def test_feed_queries_use_indexes(self):
+        post = Post.objects.first()
+        for is_admin in (True, False):
+            self.assert_indexed(self.capture(lambda: dump_feed_entries(self.user, is_admin)))
+            self.assert_indexed(self.capture(lambda: feed_entries(self.user, is_admin)))
+            self.assert_indexed(self.capture(
+                lambda: post_detail_entry(post_queryset().get(id=post.id), self.user, is_admin)))
+
+    def test_keyset_page_uses_index(self):
+        posts = feed_queryset(self.user, False, with_comments=True)
+        _, cursor = keyset_page(posts, None, 2)
+        self.assert_indexed(self.capture(lambda: keyset_page(posts, parse_cursor(cursor), 2)))
+
+    def test_public_feed_uses_partial_index(self):
+        queries = self.capture(lambda: list(post_queryset().filter(is_hidden=False, is_suppressed=False)))
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + queries[0]["sql"])
+            plan = " ".join(row[-1] for row in cursor.fetchall())
+        self.assertIn("post_visible_created_idx", plan)
+
+
+class FeedCacheTests(TestCase):
+    """Cached feeds must match the uncached builders for every viewer class."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.censor = User.objects.create_user("carol", password="pw")
+        reason = ModerationReason.objects.create(reason_text="NIXON")
+        make_posts(self.alice, 3)
+        make_posts(self.bob, 3)
+        Post.objects.create(author=self.bob, title="bob hidden", content="x", is_hidden=True)
+        Post.objects.create(author=self.alice, title="alice hidden", content="y", is_suppressed=True)
+        post = Post.objects.filter(author=self.alice, is_hidden=False).first()
+        Comment.objects.create(author=self.bob, post=post, content="bob rude",
+                               is_hidden=True, hidden_reason=reason)
+        Comment.objects.create(author=self.alice, post=post, content="alice rude", is_hidden=True)
+
+    def assert_matches_builders(self):
+        for kind in (DUMP, FEED):
+            for user, is_admin in ((self.alice, False), (self.bob, False), (self.censor, True)):
+                expected = BUILDERS[kind](user, is_admin)
+                for backend in ("json", "orjson") if orjson else ("json",):
+                    with self.settings(FEED_JSON_BACKEND=backend):
+                        body = cached_feed(kind, user, is_admin)
+                    self.assertEqual(json.loads(body), expected)
+                    if backend == "json":
+                        self.assertEqual(body, json.dumps(expected, cls=DjangoJSONEncoder).encode())
+
+    def test_overlays_match_uncached_output(self):
+        self.assert_matches_builders()
+        # Second round comes from the cache
+        self.assert_matches_builders()
+
+    def test_warm_cache_costs_no_queries(self):
+        cached_feed(DUMP, self.bob, False)
+        cached_feed(FEED, self.censor, True)
+        with self.assertNumQueries(0):
+            cached_feed(DUMP, self.alice, False)
+            cached_feed(FEED, self.censor, True)
+
+    def test_writes_invalidate(self):
+        self.assert_matches_builders()
+        post = Post.objects.create(author=self.alice, title="new", content="fresh")
+        self.assert_matches_builders()
+        Comment.objects.create(author=self.bob, post=post, content="reply")
+        self.assert_matches_builders()
+        self.bob.profile.color = "#abcdef"
+        self.bob.profile.save()
+        self.assert_matches_builders()
+        post.delete()
+        self.assert_matches_builders()
+
+    def test_login_does_not_invalidate(self):
+        cached_feed(DUMP, self.bob, False)
+        before = generation(DUMP)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.client.login(username="bob", password="pw"))
+        self.assertEqual(generation(DUMP), before)
+        self.assertFalse([q for q in queries if "app_profile" in q["sql"]])
+
+    def test_hide_endpoints_invalidate(self):
+        self.censor.is_staff = True
+        self.censor.save()
+        self.client.force_login(self.censor)
+        post = Post.objects.filter(author=self.alice, is_hidden=False).last()
+        before = self.client.get("/app/dumpFeed").json()
+        self.client.post("/app/hidePost", {"post_id": post.id, "reason": "NIXON"})
+        after = self.client.get("/app/dumpFeed").json()
+        self.assertNotEqual(before, after)
+        self.client.force_login(self.bob)
+        ids = [p["id"] for p in self.client.get("/app/feed/").json()["feed"]]
+        self.assertNotIn(post.id, ids)
+
+
+class CensorResolverTests(TestCase):
+    """is_censor() keeps its rules but costs at most one query."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("dave", password="pw")
+
+    def fresh(self):
+        # A new request gets a new user object
+        return User.objects.get(pk=self.user.pk)
+
+    def test_one_query_then_memoized(self):
+        user = self.fresh()
+        with self.assertNumQueries(1):
+            self.assertFalse(is_censor(user))
+        with self.assertNumQueries(0):
+            self.assertFalse(is_censor(user))
+        user = self.fresh()
+        with self.assertNumQueries(0):
+            # The process cache answers for the next request's user object too
+            self.assertFalse(is_censor(user))
+
+    def test_rules(self):
+        self.assertFalse(is_censor(self.fresh()))
+
+        self.user.profile.user_type = "ADMIN"
+        self.user.profile.save()
+        self.assertTrue(is_censor(self.fresh()))
+        self.user.profile.user_type = "SERF"
+        self.user.profile.save()
+        self.assertFalse(is_censor(self.fresh()))
+
+        group = Group.objects.create(name="Moderators")
+        self.user.groups.add(group)
+        self.assertTrue(is_censor(self.fresh()))
+        self.user.groups.remove(group)
+        self.assertFalse(is_censor(self.fresh()))
+
+        editors = Group.objects.create(name="editors")
+        self.user.groups.add(editors)
+        self.assertFalse(is_censor(self.fresh()))
+        editors.permissions.add(Permission.objects.get(codename="delete_post"))
+        self.assertTrue(is_censor(self.fresh()))
+
+        self.assertTrue(is_censor(User.objects.create_user("site_admin", password="pw")))
+
+
+class BulkModerationTests(TestCase):
+    """/app/hidePosts and /app/hideComments."""
+
+    def setUp(self):
+        super().setUp()
+        self.censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.user = User.objects.create_user("alice", password="pw")
+        make_posts(self.user, 5, comments_per_post=2)
+        self.client.force_login(self.censor)
+
+    def test_hide_posts_json(self):
+        ids = list(Post.objects.values_list("id", flat=True)[:3])
+        response = self.client.post("/app/hidePosts", {"post_ids": ids + [999999, "abc"], "reason": "NIXON"},
+                                    content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([results[str(i)] for i in ids], ["hidden"] * 3)
+        self.assertEqual(results["999999"], "not_found")
+        self.assertEqual(results["abc"], "invalid")
+        hidden = Post.objects.filter(is_hidden=True, hidden_reason__reason_text="NIXON", hidden_by=self.censor)
+        self.assertEqual(set(hidden.values_list("id", flat=True)), set(ids))
+
+    def test_hide_comments_form_and_cache(self):
+        self.client.get("/app/dumpFeed")  # warm the feed cache
+        ids = list(Comment.objects.values_list("id", flat=True)[:4])
+        response = self.client.post("/app/hideComments", {"comment_ids": ",".join(map(str, ids)), "reason": "spam"})
+        self.assertEqual(response.json()["hidden"], 4)
+        self.client.force_login(self.user)
+        contents = [c["content"] for p in self.client.get("/app/dumpFeed").json() for c in p["comments"]]
+        self.assertEqual(sum(c.startswith("[spam] ") for c in contents), 4)
+
+    def test_constant_query_count(self):
+        ids = list(Post.objects.values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as one:
+            self.client.post("/app/hidePosts", {"post_ids": ids[:1]}, content_type="application/json")
+        with CaptureQueriesContext(connection) as many:
+            self.client.post("/app/hidePosts", {"post_ids": ids}, content_type="application/json")
+        self.assertEqual(len(one), len(many))
+
+    def test_requires_censor(self):
+        self.client.force_login(self.user)
+        response = self.client.post("/app/hidePosts", {"post_ids": [1]}, content_type="application/json")
+        self.assertEqual(response.status_code, 401)
+
+
+class PostStatsTests(TestCase):
+    """Denormalized comment_count / visible_comment_count / last_activity_at."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.post = Post.objects.create(author=self.user, title="t", content="c")
+        self.client.force_login(self.user)
+        for i in range(3):
+            self.client.post("/app/createComment", {"post_id": self.post.id, "content": f"c{i}"})
+
+    def stats(self):
+        post = Post.objects.get(id=self.post.id)
+        return post.comment_count, post.visible_comment_count
+
+    def test_create_and_hide_keep_counts(self):
+        self.assertEqual(self.stats(), (3, 3))
+        latest = Comment.objects.filter(post=self.post).order_by("-created_at").first()
+        self.assertEqual(Post.objects.get(id=self.post.id).last_activity_at, latest.created_at)
+
+        self.client.force_login(self.censor)
+        comments = list(Comment.objects.filter(post=self.post).values_list("id", flat=True))
+        self.client.post("/app/hideComment", {"comment_id": comments[0]})
+        self.client.post("/app/hideComment", {"comment_id": comments[0]})  # already hidden
+        self.assertEqual(self.stats(), (3, 2))
+        self.client.post("/app/hideComments", {"comment_ids": comments}, content_type="application/json")
+        self.assertEqual(self.stats(), (3, 0))
+
+    def test_feed_lists_stats_and_sorts_by_activity(self):
+        older = self.post
+        newer = Post.objects.create(author=self.user, title="newer", content="c")
+        feed = self.client.get("/app/feed/").json()["feed"]
+        self.assertEqual([p["id"] for p in feed], [newer.id, older.id])
+        self.assertEqual(feed[1]["comment_count"], 3)
+
+        self.client.post("/app/createComment", {"post_id": older.id, "content": "bump"})
+        feed = self.client.get("/app/feed/", {"sort": "activity"}).json()["feed"]
+        self.assertEqual([p["id"] for p in feed], [older.id, newer.id])
+        self.assertEqual(feed[0]["visible_comment_count"], 4)
+
+    def test_rebuild_command(self):
+        Post.objects.update(comment_count=0, visible_comment_count=0, last_activity_at=None)
+        Comment.objects.filter(post=self.post).order_by("id")[:1].get().delete()
+        before = self.client.get("/app/feed/")
+        self.assertEqual(before.json()["feed"][0]["comment_count"], 0)
+        call_command("rebuild_post_stats", batch_size=1, stdout=StringIO())
+        self.assertEqual(self.stats(), (2, 2))
+        # The cached feed and its ETag move on with the rebuilt counts
+        after = self.client.get("/app/feed/", HTTP_IF_NONE_MATCH=before["ETag"])
+        self.assertEqual(after.status_code, 200)
+        self.assertEqual([after.json()["feed"][0][k] for k in ("comment_count", "visible_comment_count")], [2, 2])
+        self.assertIsNotNone(after.json()["feed"][0]["last_activity"])
+        self.assertIsNotNone(Post.objects.get(id=self.post.id).last_activity_at)
+
+
+class SearchTests(TestCase):
+    """/app/search: FTS5 ranking, snippets and dumpFeed visibility rules."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.public = Post.objects.create(author=self.alice, title="Pelican sightings",
+                                          content="Saw a brown pelican at the lake today")
+        self.other = Post.objects.create(author=self.alice, title="Lunch",
+                                         content="Talked about pelicans over lunch")
+        self.hidden = Post.objects.create(author=self.bob, title="Pelican spam",
+                                          content="buy pelican pills", is_hidden=True)
+        Comment.objects.create(author=self.bob, post=self.public, content="Pelicans are great")
+        Comment.objects.create(author=self.bob, post=self.public, content="pelican rant", is_hidden=True)
+
+    def results(self, user, q="pelican"):
+        self.client.force_login(user)
+        return self.client.get("/app/search", {"q": q}).json()["results"]
+
+    def test_ranked_with_snippets(self):
+        results = self.results(self.alice)
+        # Title match ranks first
+        self.assertEqual((results[0]["type"], results[0]["id"]), ("post", self.public.id))
+        self.assertIn("[", results[0]["snippet"])
+        self.assertEqual(len(results), 3)
+
+    def test_visibility(self):
+        ids = {(r["type"], r["id"]) for r in self.results(self.alice)}
+        self.assertNotIn(("post", self.hidden.id), ids)
+        self.assertEqual(sum(t == "comment" for t, _ in ids), 1)
+
+        ids = {(r["type"], r["id"]) for r in self.results(self.bob)}
+        self.assertIn(("post", self.hidden.id), ids)
+        self.assertEqual(sum(t == "comment" for t, _ in ids), 2)
+
+        self.assertEqual(len(self.results(self.censor)), 5)
+
+    def test_index_follows_writes(self):
+        self.assertEqual(self.results(self.alice, "flamingo"), [])
+        Post.objects.filter(id=self.other.id).update(content="flamingos instead")
+        Post.objects.bulk_create([Post(author=self.alice, title="Flamingo", content="pink")])
+        self.assertEqual(len(self.results(self.alice, "flamingo")), 2)
+        self.other.delete()
+        self.assertEqual(len(self.results(self.alice, "flamingo")), 1)
+
+    def test_user_input_is_not_fts_syntax(self):
+        self.assertIsInstance(self.results(self.alice, '"pel* OR NEAR('), list)
+        self.assertEqual(self.results(self.alice, "   "), [])
+
+
+class AsyncViewTests(TestCase):
+    """The /app/async/ endpoints return exactly what the sync ones do."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        other = User.objects.create_user("bob", password="pw")
+        make_posts(self.user, 4)
+        make_posts(other, 3)
+        hidden = Post.objects.filter(author=other).first()
+        hidden.is_hidden = True
+        hidden.save()
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def body(response):
+        if not response.streaming:
+            return response.content
+        if response.is_async:
+            async def collect():
+                return b"".join([chunk async for chunk in response.streaming_content])
+            return async_to_sync(collect)()
+        return b"".join(response.streaming_content)
+
+    def assert_same(self, sync_url, async_url, params=None):
+        expected = self.client.get(sync_url, params or {})
+        actual = self.client.get(async_url, params or {})
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(self.body(actual), self.body(expected))
+        self.assertEqual(actual.get("X-Next-Cursor"), expected.get("X-Next-Cursor"))
+
+    def test_feeds_match(self):
+        for params in ({}, {"limit": 3}, {"stream": 1}):
+            self.assert_same("/app/dumpFeed", "/app/async/dumpFeed", params)
+            self.assert_same("/app/feed/", "/app/async/feed/", params)
+        self.assert_same("/app/feed/", "/app/async/feed/", {"sort": "activity"})
+
+    def test_post_detail_matches(self):
+        for post in Post.objects.all():
+            self.assert_same(f"/app/post/{post.id}/", f"/app/async/post/{post.id}/")
+        self.assertEqual(self.client.get("/app/async/post/999999/").status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    """Feed/post polls revalidate with ETag / Last-Modified and get a bodiless 304 while nothing changed."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.censor = User.objects.create_user("carol", password="pw")
+        self.censor.profile.user_type = Profile.UserType.ADMIN
+        self.censor.profile.save()
+        make_posts(self.user, 3)
+        self.post = Post.objects.first()
+        self.client.force_login(self.user)
+
+    def test_matching_etag_skips_the_view(self):
+        for url in ("/app/feed/", "/app/dumpFeed", f"/app/post/{self.post.id}/",
+                    "/app/async/feed/", "/app/async/dumpFeed", f"/app/async/post/{self.post.id}/"):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertIn("no-cache", first["Cache-Control"])
+            with mock.patch("app.feed_json.JsonRenderer.__init__", side_effect=AssertionError("rendered")):
+                again = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual(again.status_code, 304, url)
+            self.assertEqual(again.content, b"")
+            self.assertEqual(again["ETag"], first["ETag"])
+
+    def test_writes_and_viewer_class_change_the_etag(self):
+        etag = self.client.get("/app/feed/")["ETag"]
+        Comment.objects.create(author=self.user, post=self.post, content="new")
+        response = self.client.get("/app/feed/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        self.client.force_login(self.censor)
+        self.assertEqual(self.client.get("/app/feed/", HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 200)
+
+    def test_process_local_cache_sends_no_validators(self):
+        # Another worker's write would never reach this locmem generation
+        with self.settings(CONDITIONAL_GET_ON_LOCAL_CACHE=False), mock.patch.object(conditional, "_warned", False), \
+                self.assertLogs("app.conditional", "WARNING"):
+            for url in ("/app/feed/", "/app/async/feed/"):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header("ETag"))
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH="*").status_code, 200)
+            with self.assertRaises(ImproperlyConfigured):
+                validators(FEED, 1, None, self.user, False)
+
+    def test_if_modified_since(self):
+        # Last-Modified is only sent once the second of the last change is over
+        self.assertFalse(self.client.get("/app/feed/").has_header("Last-Modified"))
+        feed_cache().set("cloudysky:feed:feed:changed", time.time() - 10, None)
+        last_modified = self.client.get("/app/feed/")["Last-Modified"]
+        self.assertEqual(self.client.get("/app/feed/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Comment.objects.create(author=self.user, post=self.post, content="new")
+        self.assertEqual(self.client.get("/app/feed/", HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 200)
+
+
+class FeedEventTests(TestCase):
+    """Writes publish events after commit; /app/feed/stream pushes them as server-sent events."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.censor = User.objects.create_user("carol", password="pw")
+        self.censor.profile.user_type = Profile.UserType.ADMIN
+        self.censor.profile.save()
+        self.published = []
+        patcher = mock.patch.object(events.broker(), "publish", side_effect=self.published.append)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def types(self):
+        return [m["event"]["type"] for m in self.published]
+
+    def test_writes_publish_after_commit(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/app/createPost", {"title": "hi", "content": "there"})
+            self.assertEqual(self.published, [])  # nothing before the commit
+        post = Post.objects.get(title="hi")
+        self.assertEqual(self.published[0]["event"]["post"]["id"], post.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/app/createComment", {"post_id": post.id, "content": "first"})
+        comment = self.published[-1]["event"]
+        self.assertEqual((comment["post_id"], comment["comment"]["content"], comment["comment_count"]),
+                         (post.id, "first", 1))
+        self.assertIsNone(self.published[-1]["visible_to"])
+
+        self.client.force_login(self.censor)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/app/hideComment", {"comment_id": Comment.objects.get().id})
+            self.client.post("/app/hidePost", {"post_id": post.id})
+            self.client.post("/app/hidePosts", {"post_ids": [post.id]})
+        self.assertEqual(self.types(), ["post", "comment", "hide_comments", "hide_posts", "hide_posts"])
+
+        # Comments on a hidden post only go to censors and the post's author
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/app/createComment", {"post_id": post.id, "content": "still here"})
+        message = self.published[-1]
+        self.assertEqual(message["visible_to"], [self.user.id])
+        self.assertTrue(events.visible(message, self.censor.id, True))
+        self.assertFalse(events.visible(message, self.censor.id + 1, False))
+
+    def test_stream_needs_asgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/app/feed/stream").status_code, 501)
+
+    async def test_stream_pushes_events(self):
+        broker = events.InProcessBroker(queue_size=2)
+        await self.async_client.aforce_login(self.user)
+        with mock.patch("app.async_views.broker", return_value=broker):
+            response = await self.async_client.get("/app/feed/stream")
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+
+        hidden = events.message({"type": "comment", "post_id": 1}, visible_to=[self.user.id + 99])
+        broker.publish(hidden)
+        broker.publish(events.message({"type": "hide_posts", "post_ids": [7]}))
+        self.assertEqual(await anext(stream), b'event: hide_posts\ndata: {"type": "hide_posts", "post_ids": [7]}\n\n')
+
+        # A stream that falls behind is told to resync
+        for i in range(3):
+            broker.publish(events.message({"type": "hide_posts", "post_ids": [i]}))
+        self.assertTrue((await anext(stream)).startswith(b"event: resync"))
+
+        # A client disconnect cancels the response task, which unsubscribes
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+        self.assertEqual(broker._subscriptions, set())
+
+
+class MetricsTests(TestCase):
+    """MetricsMiddleware records per-view time/SQL/size and /app/metrics exposes it."""
+
+    def setUp(self):
+        super().setUp()
+        metrics.registry.clear()
+        self.user = User.objects.create_user("alice", password="pw")
+        make_posts(self.user, 3)
+        self.client.force_login(self.user)
+
+    def series(self, body, name, view):
+        prefix = f'{name}{{view="{view}",method="GET"}} '
+        return float(next(line[len(prefix):] for line in body.splitlines() if line.startswith(prefix)))
+
+    def test_prometheus_output(self):
+        for url in ("/app/feed/", "/app/feed/", "/app/async/feed/"):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        body = self.client.get("/app/metrics").content.decode()
+
+        self.assertIn('cloudysky_requests_total{view="app.views.feed",method="GET",status="200"} 2', body)
+        self.assertIn('cloudysky_request_duration_seconds_bucket{view="app.views.feed",method="GET",le="+Inf"} 2',
+                      body)
+        self.assertEqual(self.series(body, "cloudysky_request_queries_count", "app.views.feed"), 2)
+        self.assertGreater(self.series(body, "cloudysky_request_queries_sum", "app.views.feed"), 0)
+        self.assertGreater(self.series(body, "cloudysky_response_size_bytes_sum", "app.views.feed"), 0)
+        # Async views run their queries in other threads; those count too
+        self.assertGreater(self.series(body, "cloudysky_request_queries_sum", "app.async_views.feed"), 0)
+
+    @override_settings(METRICS_QUERY_BUDGET=0)
+    def test_over_budget_requests_are_logged_with_sql(self):
+        with self.assertLogs("app.metrics", "WARNING") as logs:
+            self.client.get("/app/dumpFeed")
+        self.assertIn("/app/dumpFeed", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(METRICS_LATENCY_BUDGET_MS=0,
+                       METRICS_VIEW_LATENCY_BUDGETS_MS={"app.views.create_user_view": 60_000})
+    def test_views_can_have_their_own_latency_budget(self):
+        self.client.logout()
+        with self.assertNoLogs("app.metrics", "WARNING"):
+            self.client.post("/app/createUser", {"user_name": "bob", "email": "b@example.com",
+                                                 "password": "pw"})
+        with self.assertLogs("app.metrics", "WARNING"):
+            self.client.get("/app/feed/")
+
+    def test_metrics_access(self):
+        self.assertEqual(self.client.get("/app/metrics", REMOTE_ADDR="10.0.0.1").status_code, 403)
+        Profile.objects.filter(user=self.user).update(user_type=Profile.UserType.ADMIN)
+        forget()
+        self.assertEqual(self.client.get("/app/metrics", REMOTE_ADDR="10.0.0.1").status_code, 200)
+
+
+class CreateUserTests(TestCase):
+    """createUser must not migrate per request and replaces duplicates in one transaction."""
+
+    def setUp(self):
+        super().setUp()
+        schema.reset()
+
+    def signup(self, username, **extra):
+        return self.client.post("/app/createUser", {"username": username, "email": "a@b.c",
+                                                    "password": "pw", **extra})
+
+    def test_schema_is_checked_once(self):
+        with mock.patch.object(schema, "call_command") as migrate, \
+             mock.patch.object(schema, "pending_migrations", wraps=schema.pending_migrations) as check:
+            self.assertEqual(self.signup("alice").status_code, 200)
+            self.assertEqual(self.signup("bob").status_code, 200)
+        self.assertEqual(check.call_count, 1)
+        migrate.assert_not_called()  # test DB is already migrated
+
+    def test_duplicate_username_is_replaced(self):
+        self.signup("alice")
+        old = User.objects.get(username="alice")
+        Post.objects.create(author=old, title="t", content="c")
+
+        response = self.signup("alice", is_admin="1")
+        self.assertEqual(response.status_code, 200)
+        new = User.objects.get(username="alice")
+        self.assertNotEqual(new.pk, old.pk)
+        self.assertEqual(new.profile.user_type, Profile.UserType.ADMIN)
+        self.assertFalse(Post.objects.filter(author_id=old.pk).exists())
+
+
+class ImportUsersTests(TestCase):
+    """import_users creates users and profiles in a constant number of queries."""
+
+    def test_bulk_import(self):
+        User.objects.create_user("taken", password="pw")
+        lines = ["username,email,password,is_admin", "taken,x@y.z,pw,0", "boss,b@y.z,,1"]
+        hashed = make_password("pw")  # pre-hashed rows skip the hasher
+        lines += [f"user{i},u{i}@y.z,{hashed},0" for i in range(50)]
+        path = self.tmp_csv("\n".join(lines))
+
+        with CaptureQueriesContext(connection) as queries:
+            call_command("import_users", path, stdout=StringIO())
+        self.assertLess(len(queries), 10)
+
+        self.assertEqual(User.objects.count(), 52)
+        self.assertEqual(Profile.objects.count(), 52)
+        self.assertEqual(User.objects.get(username="boss").profile.user_type, Profile.UserType.ADMIN)
+        self.assertTrue(User.objects.get(username="user7").check_password("pw"))
+
+    def tmp_csv(self, text):
+        handle = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False)
+        handle.write(text)
+        handle.close()
+        self.addCleanup(os.remove, handle.name)
+        return handle.name
+
+
+class FeedJsonTests(TestCase):
+    """Pre-serialized feeds must say exactly what the dict builders + JsonResponse said."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bøb", password="pw")
+        reason = ModerationReason.objects.create(reason_text="NIXON")
+        self.post = Post.objects.create(author=self.alice, title="Ünïcode \"quoted\" </script>",
+                                        content="line\nbreak \u2603 " + "x" * 60)
+        Comment.objects.create(author=self.bob, post=self.post, content="tab\there")
+        Comment.objects.create(author=self.bob, post=self.post, content="rude", is_hidden=True, hidden_reason=reason)
+        Post.objects.create(author=self.bob, title="hidden", content="h", is_hidden=True)
+
+    def assert_same_json(self, body, expected):
+        self.assertEqual(body, json.dumps(expected, cls=DjangoJSONEncoder).encode())
+
+    def test_fragments_match_dict_builders(self):
+        with self.settings(FEED_JSON_BACKEND="json"):
+            for user, is_admin in ((self.alice, False), (self.bob, False), (self.alice, True)):
+                renderer = JsonRenderer(user.id, is_admin)
+                for post in post_queryset(with_comments=True):
+                    self.assert_same_json(renderer.dump_post(post), dump_feed_entry(post, user, is_admin))
+                    self.assert_same_json(renderer.feed_post(post), feed_entry(post))
+                    comments = list(post.comments.all())
+                    self.assert_same_json(renderer.post_detail(post, comments),
+                                          post_detail_entry(post, user, is_admin, comments=comments))
+
+    def test_default_backend_matches_jsonresponse(self):
+        # No FEED_JSON_BACKEND override: non-ASCII must still come out \u-escaped
+        self.client.force_login(self.bob)
+        response = self.client.get(f"/app/post/{self.post.id}/")
+        post = post_queryset().get(id=self.post.id)
+        self.assert_same_json(response.content, post_detail_entry(post, self.bob, False))
+        self.assertIn(b"\\u00dcn", response.content)
+
+    @skipUnless(orjson, "orjson is not installed")
+    def test_orjson_output_parses_the_same(self):
+        with self.settings(FEED_JSON_BACKEND="orjson"):
+            renderer = JsonRenderer(self.bob.id, False)
+            for post in post_queryset(with_comments=True):
+                self.assertEqual(json.loads(renderer.dump_post(post)), dump_feed_entry(post, self.bob, False))
+
+    def test_unchanged_rows_are_not_reencoded(self):
+        renderer = JsonRenderer(self.alice.id, False)
+        posts = list(post_queryset(with_comments=True))
+        for post in posts:
+            renderer.dump_post(post)
+        with mock.patch.object(renderer, "quote", side_effect=AssertionError("re-encoded")):
+            for post in post_queryset(with_comments=True):
+                renderer.dump_post(post)
+
+        # A save() bumps the version, so the edit shows up
+        self.post.title = "edited"
+        self.post.save()
+        post = post_queryset(with_comments=True).get(id=self.post.id)
+        self.assertEqual(json.loads(renderer.dump_post(post))["title"], "edited")
+
+    def test_bulk_hide_changes_fragment(self):
+        censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.client.force_login(self.alice)
+        before = self.client.get("/app/dumpFeed").json()
+        self.assertEqual(before[0]["comments"][0]["content"], "tab\there")
+
+        comment = self.post.comments.order_by("id").first()
+        self.client.force_login(censor)
+        self.client.post("/app/hideComments", {"comment_ids": [comment.id], "reason": "NIXON"})
+        self.client.force_login(self.alice)
+        after = self.client.get("/app/dumpFeed").json()
+        self.assertEqual(after[0]["comments"][0]["content"], "This comment has been removed")
+
+    def test_views_send_json_bytes(self):
+        self.client.force_login(self.bob)
+        with self.settings(FEED_JSON_BACKEND="json"):
+            response = self.client.get(f"/app/post/{self.post.id}/")
+            self.assertEqual(response["Content-Type"], "application/json")
+            post = post_queryset().get(id=self.post.id)
+            self.assert_same_json(response.content, post_detail_entry(post, self.bob, False))
+            paged = self.client.get("/app/feed/", {"limit": 1}).json()
+            self.assertEqual(paged["next_cursor"], self.client.get("/app/feed/", {"limit": 1})["X-Next-Cursor"])
+
+
+class FeedReplicaRouterTests(TestCase):
+    """Only hinted feed reads may go to the replica; cache fills stay on the primary."""
+
+    def test_routing(self):
+        router = FeedReplicaRouter()
+        self.assertIsNone(router.db_for_read(Post, **feed_read_hints()))
+        with self.settings(FEED_REPLICA_DATABASE="default"):
+            self.assertEqual(router.db_for_read(Post, **feed_read_hints()), "default")
+            self.assertIsNone(router.db_for_read(Post))
+            self.assertFalse(router.allow_migrate("default", "app"))
+        self.assertIsNone(router.allow_migrate("default", "app"))
+
+    def test_feed_querysets_are_hinted(self):
+        self.assertTrue(post_queryset()._hints.get(FEED_READ))
+        self.assertTrue(feed_queryset(AnonymousUser(), False)._hints.get(FEED_READ))
+
+
+def png_bytes(size=(800, 600), color=(200, 30, 30)):
+    out = BytesIO()
+    Image.new("RGB", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+class MediaUploadTests(TestCase):
+    """uploadMedia streams, dedups by content and the feed only serves renditions."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = self.settings(MEDIA_ROOT=media_root, MEDIA_RENDITIONS_INLINE=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root
+
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.post = Post.objects.create(author=self.alice, title="pic", content="look")
+        self.client.force_login(self.alice)
+
+    def upload(self, post, data, name="pic.png", content_type="image/png"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post("/app/uploadMedia", {
+                "post_id": post.id, "file": SimpleUploadedFile(name, data, content_type=content_type)})
+
+    def stored_files(self):
+        return sorted(os.path.relpath(os.path.join(d, f), self.media_root)
+                      for d, _, files in os.walk(self.media_root) for f in files)
+
+    def test_upload_builds_renditions_for_the_feed(self):
+        data = png_bytes()
+        response = self.upload(self.post, data)
+        self.assertEqual(response.status_code, 201)
+        info = response.json()["media"][0]
+        self.assertEqual(info["sha256"], hashlib.sha256(data).hexdigest())
+        self.assertEqual(info["size"], len(data))
+
+        media = PostMedia.objects.get(id=info["id"])
+        self.assertEqual(media.status, PostMedia.Status.READY)
+        with media.thumbnail.open("rb") as handle, Image.open(handle) as thumb:
+            self.assertEqual(max(thumb.size), 320)
+
+        entry = self.client.get("/app/feed/").json()["feed"][0]
+        self.assertEqual(entry["media"], [{"id": media.id, "status": "ready",
+                                           "thumbnail": media.thumbnail.url, "display": media.display.url}])
+        self.assertNotIn(media.media_file.url, json.dumps(entry))
+
+    def test_duplicate_bytes_are_stored_once(self):
+        data = png_bytes()
+        self.upload(self.post, data)
+        before = self.stored_files()
+        other = Post.objects.create(author=self.alice, title="again", content="same meme")
+        info = self.upload(other, data, name="copy.png").json()["media"][0]
+
+        self.assertTrue(info["deduplicated"])
+        self.assertEqual(self.stored_files(), before)
+        first, second = PostMedia.objects.order_by("id")
+        self.assertEqual(first.media_file.name, second.media_file.name)
+        self.assertEqual(second.thumbnail.name, first.thumbnail.name)
+
+    def test_non_images_and_permissions(self):
+        response = self.upload(self.post, b"%PDF-1.4 not an image", name="doc.pdf", content_type="application/pdf")
+        self.assertEqual(response.json()["media"][0]["status"], "none")
+        self.client.force_login(self.bob)
+        self.assertEqual(self.upload(self.post, png_bytes()).status_code, 403)
+        with self.settings(MEDIA_MAX_UPLOAD_SIZE=10):
+            self.client.force_login(self.alice)
+            self.assertEqual(self.upload(self.post, png_bytes()).status_code, 413)
+
+    def test_blob_refcounts_and_gc(self):
+        data = png_bytes()
+        self.upload(self.post, data)
+        other = Post.objects.create(author=self.alice, title="again", content="same meme")
+        self.upload(other, data, name="copy.png")
+        first = PostMedia.objects.order_by("id").first()
+        self.assertTrue(first.media_file.name.startswith("blobs/"))
+        # original + thumbnail + display, each shared by both rows
+        self.assertEqual(sorted(Blob.objects.values_list("refcount", flat=True)), [2, 2, 2])
+
+        first.delete()
+        self.assertEqual(sorted(Blob.objects.values_list("refcount", flat=True)), [1, 1, 1])
+        Blob.objects.update(refcount=7)
+        recount()
+        self.assertEqual(set(Blob.objects.values_list("refcount", flat=True)), {1})
+
+        files = self.stored_files()
+        other.delete()  # cascades to its PostMedia
+        # Still inside the grace period: nothing goes
+        self.assertEqual(collect_garbage(media_storage())["blobs"], 0)
+        self.assertEqual(self.stored_files(), files)
+        call_command("gc_blobs", "--grace-minutes", "0", stdout=StringIO())
+        self.assertEqual(Blob.objects.count(), 0)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_storage_dedups_plain_saves(self):
+        storage = media_storage()
+        first = storage.save("a.txt", ContentFile(b"same bytes"))
+        second = storage.save("b.txt", ContentFile(b"same bytes"))
+        self.assertEqual(first, second)
+        self.assertEqual(first, blob_name(hashlib.sha256(b"same bytes").hexdigest(), ".txt"))
+        self.assertEqual(self.stored_files(), [first])
+        # Unreferenced and untouched past the grace period: collected, stray files too
+        os.makedirs(os.path.join(self.media_root, "blobs", "zz"))
+        open(os.path.join(self.media_root, "blobs", "zz", "stray"), "wb").close()
+        stats = collect_garbage(storage, grace=timedelta(0))
+        self.assertEqual((stats["blobs"], stats["orphans"]), (1, 1))
+        self.assertEqual(self.stored_files(), [])
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_generate_counts_and_shape(self):
+        stats = synthetic.generate(40, comments_mean=3, hidden=0.2, seed=1)
+        self.assertEqual((stats["users"], stats["posts"]), (4, 40))
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(Comment.objects.count(), stats["comments"])
+        self.assertEqual(Post.objects.filter(is_hidden=True).count(), stats["hidden_posts"])
+        # Stats are rebuilt and no comment predates its post
+        for post in Post.objects.all():
+            self.assertEqual(post.comment_count, Comment.objects.filter(post=post).count())
+        self.assertFalse(Comment.objects.filter(created_at__lt=F("post__created_at")).exists())
+        # Same seed, same shape
+        synthetic.clear()
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(synthetic.generate(40, comments_mean=3, hidden=0.2, seed=1), stats)
+
+    def test_bench_app_json_rolls_back(self):
+        out = StringIO()
+        call_command("bench_app", "--scales", "20", "--repeat", "2", "--json", stdout=out)
+        results = json.loads(out.getvalue())["results"]
+        self.assertEqual({(r["endpoint"], r["mode"]) for r in results if r["endpoint"] in ("feed", "hide_post")},
+                         {("feed", "cold"), ("feed", "warm"), ("feed", "page"), ("hide_post", "write")})
+        warm = next(r for r in results if r["endpoint"] == "feed" and r["mode"] == "warm")
+        self.assertEqual(warm["posts"], 20)
+        self.assertLess(warm["queries"], 5)
+        self.assertEqual(Post.objects.count(), 0)
+
+    def test_bench_reset_caches_empties_the_per_worker_lookups(self):
+        from .management.commands.bench_app import reset_caches
+        user = User.objects.create_user("alice", password="pw")
+        authors.author_cards([user.id])
+        reason = reasons.reason_for("NIXON")
+        reset_caches()
+        self.assertEqual(len(authors._cards), 0)
+        with self.assertNumQueries(1):
+            reasons.reason_text(reason.id)
+
+    def test_bench_app_on_a_database_that_already_has_enough_posts(self):
+        make_posts(User.objects.create_user("alice", password="pw"), 5, comments_per_post=1)
+        rebuild_post_stats()
+        out = StringIO()
+        call_command("bench_app", "--scales", "3", "--repeat", "1", "--json", stdout=out)
+        self.assertEqual({r["posts"] for r in json.loads(out.getvalue())["results"]}, {5})
+        self.assertFalse(User.objects.filter(username__startswith="synth_").exists())
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.client.force_login(self.user)
+
+    @override_settings(RATE_LIMITS={"create_post": {"user": (0.001, 3)}})
+    def test_user_bucket_allows_a_burst_then_429(self):
+        codes = [self.client.post("/app/createPost", {"title": "t", "content": "c"}).status_code
+                 for _ in range(4)]
+        self.assertEqual(codes, [201, 201, 201, 429])
+        refused = self.client.post("/app/createPost", {"title": "t", "content": "c"})
+        self.assertGreater(int(refused["Retry-After"]), 900)
+        self.assertEqual(Post.objects.count(), 3)
+        # Another user has their own bucket
+        self.client.force_login(User.objects.create_user("bob", password="pw"))
+        self.assertEqual(self.client.post("/app/createPost", {"title": "t", "content": "c"}).status_code, 201)
+
+    @override_settings(RATE_LIMITS={"create_user": {"ip": (0.001, 2)}})
+    def test_ip_bucket(self):
+        self.client.logout()
+        codes = [self.client.post("/app/createUser", {"username": f"u{i}", "password": "pw"},
+                                  REMOTE_ADDR="10.0.0.1").status_code for i in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        other = self.client.post("/app/createUser", {"username": "u9", "password": "pw"}, REMOTE_ADDR="10.0.0.2")
+        self.assertEqual(other.status_code, 200)
+
+    @override_settings(RATE_LIMITS={"create_post": {"ip": (0.001, 3), "user": (0.001, 1)}})
+    def test_refused_requests_leave_the_ip_bucket_alone(self):
+        codes = [self.client.post("/app/createPost", {"title": "t", "content": "c"}).status_code
+                 for _ in range(5)]
+        self.assertEqual(codes, [201, 429, 429, 429, 429])
+        # alice's empty user bucket refused four requests without charging the shared ip bucket
+        self.client.force_login(User.objects.create_user("bob", password="pw"))
+        self.assertEqual(self.client.post("/app/createPost", {"title": "t", "content": "c"}).status_code, 201)
+        self.client.force_login(User.objects.create_user("carol", password="pw"))
+        self.assertEqual(self.client.post("/app/createPost", {"title": "t", "content": "c"}).status_code, 201)
+
+    def test_refill(self):
+        backend = ratelimit.LocalBackend()
+        with mock.patch("app.ratelimit.time.monotonic", side_effect=[0, 0, 0, 1.5]):
+            self.assertEqual([backend.take("k", 1, 2) for _ in range(3)], [0, 0, 1])
+            self.assertEqual(backend.take("k", 1, 2), 0)
+
+
+class CommentCoalescingTests(TransactionTestCase):
+
+    def setUp(self):
+        feed_cache().clear()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.posts = [Post.objects.create(author=self.user, title=f"p{i}", content="c") for i in range(2)]
+
+    def test_concurrent_comments_share_one_write(self):
+        coalescer = CommentCoalescer(window=5, max_batch=6)
+        results = []
+
+        def comment(i):
+            try:
+                results.append(coalescer.create(self.user, self.posts[i % 2], f"comment {i}"))
+            finally:
+                connection.close()
+
+        with mock.patch.object(CommentCoalescer, "_write", wraps=CommentCoalescer._write) as write:
+            threads = [threading.Thread(target=comment, args=(i,)) for i in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # The sixth comment filled the batch, so nobody waited out the 5s window
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(sorted(c.content for c in results), [f"comment {i}" for i in range(6)])
+        self.assertTrue(all(c.pk for c in results))
+        for post in Post.objects.all():
+            self.assertEqual((post.comment_count, post.visible_comment_count), (3, 3))
+
+    def test_failed_batch_falls_back_to_single_inserts(self):
+        coalescer = CommentCoalescer(window=0, max_batch=10)
+        with mock.patch.object(CommentCoalescer, "_write", side_effect=RuntimeError("boom")), \
+                self.assertLogs("app.coalesce", "ERROR"):
+            comment = coalescer.create(self.user, self.posts[0], "still saved")
+        self.assertTrue(Comment.objects.filter(pk=comment.pk, content="still saved").exists())
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).comment_count, 1)
+
+    @override_settings(COMMENT_COALESCE_WINDOW_MS=1)
+    def test_view_uses_coalescer(self):
+        self.client.force_login(self.user)
+        response = self.client.post("/app/createComment", {"post_id": self.posts[0].id, "content": "hi"})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(pk=self.posts[0].pk)
+        self.assertEqual((post.comment_count, post.last_activity_at), (1, Comment.objects.get().created_at))
+
+
+class ModerationLogTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.user = User.objects.create_user("alice", password="pw")
+        make_posts(self.user, 3, comments_per_post=1)
+        rebuild_post_stats()  # make_posts skips the views' counter updates
+        self.post = Post.objects.order_by("id").first()
+        self.client.force_login(self.censor)
+
+    def log(self, **params):
+        return self.client.get("/app/moderation/log", params).json()
+
+    def test_hide_reason_change_unhide(self):
+        self.client.post("/app/hidePost", {"post_id": self.post.id, "reason": "NIXON"})
+        self.client.post("/app/hidePost", {"post_id": self.post.id, "reason": "NIXON"})  # no change
+        self.client.post("/app/hidePost", {"post_id": self.post.id, "reason": "SPAM"})
+        response = self.client.post("/app/unhidePost", {"post_id": self.post.id})
+        self.assertEqual(response.status_code, 200)
+
+        post = Post.objects.get(id=self.post.id)
+        self.assertEqual((post.is_hidden, post.hidden_reason, post.hidden_by), (False, None, None))
+        events = self.log(target_type="post", target_id=self.post.id)["events"]
+        self.assertEqual([(e["action"], e["reason"], e["previous_reason"]) for e in events],
+                         [("unhide", None, "SPAM"), ("reason", "SPAM", "NIXON"), ("hide", "NIXON", None)])
+        self.assertEqual(events[0]["moderator"], "carol")
+        # Back in everyone's feed
+        self.client.force_login(self.user)
+        self.assertIn(self.post.id, [p["id"] for p in self.client.get("/app/dumpFeed").json()])
+
+    def test_unhide_comment_restores_count(self):
+        comment = Comment.objects.filter(post=self.post).get()
+        self.client.post("/app/hideComment", {"comment_id": comment.id})
+        self.assertEqual(Post.objects.get(id=self.post.id).visible_comment_count, 0)
+        self.client.post("/app/unhideComment", {"comment_id": comment.id})
+        self.assertEqual(Post.objects.get(id=self.post.id).visible_comment_count, 1)
+        self.assertEqual([e["action"] for e in self.log(target_type="comment")["events"]], ["unhide", "hide"])
+
+    def test_bulk_hide_logs_in_one_insert_and_pages(self):
+        ids = list(Post.objects.values_list("id", flat=True))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post("/app/hidePosts", {"post_ids": ids, "reason": "spam"}, content_type="application/json")
+        inserts = [q for q in queries if q["sql"].startswith('INSERT INTO "app_moderationevent"')]
+        self.assertEqual(len(inserts), 1)
+
+        first = self.log(limit=2, moderator=self.censor.id)
+        self.assertEqual(len(first["events"]), 2)
+        rest = self.log(limit=2, cursor=first["next_cursor"])
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(sorted(e["target_id"] for e in first["events"] + rest["events"]), sorted(ids))
+
+    def test_rolled_back_with_the_state_and_append_only(self):
+        with mock.patch.object(Post, "save", side_effect=RuntimeError("db down")), \
+                self.assertRaises(RuntimeError):
+            self.client.post("/app/hidePost", {"post_id": self.post.id, "reason": "NIXON"})
+        self.assertFalse(ModerationEvent.objects.exists())
+        self.client.post("/app/hidePost", {"post_id": self.post.id})
+        event = ModerationEvent.objects.get()
+        with self.assertRaises(ValueError):
+            event.save()
+
+    def test_censors_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get("/app/moderation/log").status_code, 401)
+        self.assertEqual(self.client.post("/app/unhidePost", {"post_id": self.post.id}).status_code, 401)
+
+
+class ReasonCacheTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.censor = User.objects.create_user("carol", password="pw", is_staff=True)
+        self.user = User.objects.create_user("alice", password="pw")
+        make_posts(self.user, 2, comments_per_post=1)
+        rebuild_post_stats()
+        self.client.force_login(self.censor)
+
+    def test_hides_and_feeds_skip_the_reason_table(self):
+        comment = Comment.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/app/hideComment", {"comment_id": comment.id, "reason": "NIXON"})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post("/app/hidePost", {"post_id": comment.post_id, "reason": "NIXON"})
+            body = self.client.get("/app/dumpFeed").json()
+            self.client.get(f"/app/post/{comment.post_id}/")
+        self.assertFalse([q for q in queries if "app_moderationreason" in q["sql"]])
+        contents = [c["content"] for p in body for c in p["comments"]]
+        self.assertIn("[NIXON] Comment 0", contents)
+
+    def test_rename_and_unknown_ids(self):
+        reason = reasons.reason_for("SPAM")
+        self.assertEqual(reasons.reason_text(reason.id), "SPAM")
+        with self.captureOnCommitCallbacks(execute=True):
+            reason.reason_text = "JUNK"
+            reason.save()
+        self.assertEqual(reasons.reason_text(reason.id), "JUNK")
+        self.assertEqual(reasons.reason_for("JUNK").id, reason.id)
+        # A reason this worker never saw (another process made it) is read on first sight
+        other = ModerationReason.objects.bulk_create([ModerationReason(reason_text="ELSEWHERE")])[0]
+        with self.assertNumQueries(1):
+            self.assertEqual(reasons.reason_text(other.id), "ELSEWHERE")
+        with self.assertNumQueries(0):
+            self.assertEqual(reasons.reason_for("ELSEWHERE").id, other.id)
+
+    def test_dangling_ids_are_read_once(self):
+        # Archived rows can keep the id of a reason deleted since
+        self.assertIsNone(reasons.reason_text(424242))
+        with self.assertNumQueries(0):
+            self.assertIsNone(reasons.reason_text(424242))
+
+    def test_async_lookups_never_query(self):
+        other = ModerationReason.objects.create(reason_text="ELSEWHERE")
+        reasons.forget()
+
+        async def render():
+            return reasons.reason_text(other.id)
+
+        # On the event loop the unknown id renders as None and waits for the next warm()
+        self.assertIsNone(async_to_sync(render)())
+        with self.assertNumQueries(1):
+            reasons.warm()
+        self.assertEqual(async_to_sync(render)(), "ELSEWHERE")
+        with self.assertNumQueries(0):
+            reasons.warm()
+
+
+class AuthorCardTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        make_posts(self.alice, 2, comments_per_post=0)
+        make_posts(self.bob, 2, comments_per_post=0)
+
+    def test_one_lookup_per_batch_of_misses(self):
+        with self.assertNumQueries(2):
+            posts = authors.attach_author_cards(post_queryset())
+        with self.assertNumQueries(0):
+            cards = {authors.card_of(p) for p in posts}
+        self.assertEqual({c.username for c in cards}, {"alice", "bob"})
+        with self.assertNumQueries(1):
+            authors.attach_author_cards(post_queryset())
+        # Chunked iteration looks each chunk's authors up: bob's two posts, then alice's
+        authors.forget()
+        with self.assertNumQueries(3), mock.patch("app.feed.STREAM_CHUNK_SIZE", 2):
+            list(iter_posts(post_queryset()))
+
+    def test_attached_cards_survive_the_cache_and_never_query_on_the_loop(self):
+        posts = authors.attach_author_cards(post_queryset(with_comments=True))
+        authors.forget()
+        with self.assertNumQueries(0):
+            self.assertEqual({authors.card_of(p).username for p in posts}, {"alice", "bob"})
+
+        async def render(user_id):
+            return authors.author_card(user_id)
+
+        # A row rendered on the event loop without its card gets a blank one, not a query
+        self.assertEqual(async_to_sync(render)(self.alice.id), authors.BLANK_CARD)
+        # Cards evicted between the fetch and the render: the async views still answer, names and all
+        self.client.force_login(self.alice)
+        with mock.patch.object(authors._cards, "get", return_value=None):
+            for params in ({"archive": 1}, {"limit": 10}):
+                body = self.client.get("/app/async/dumpFeed", params).json()
+                self.assertEqual({p["username"] for p in body}, {"alice", "bob"})
+
+    def test_profile_and_user_saves_refresh_cards(self):
+        feed_entries(self.alice, is_admin=False)
+        self.alice.profile.color = "#abcdef"
+        self.alice.profile.save()
+        self.bob.username = "robert"
+        self.bob.save()
+        colors = {p["username"]: p["color"] for p in feed_entries(self.alice, is_admin=False)}
+        self.assertEqual(colors["alice"], "#abcdef")
+        self.assertIn("robert", colors)
+
+    def test_other_workers_changes_drop_the_cache(self):
+        authors.author_cards([self.alice.id])
+        # What another process's save leaves behind: a newer version number
+        feed_cache().set(authors.VERSION_KEY, 99, None)
+        Profile.objects.filter(user=self.alice).update(color="#010203")
+        self.assertEqual(authors.author_cards([self.alice.id])[self.alice.id].color, "#010203")
+
+
+class DatasetExportImportTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        synthetic.generate(30, comments_mean=3, hidden=0.2, seed=2)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+
+    def snapshot(self):
+        return {kind: list(model._base_manager.order_by("pk").values_list())
+                for kind, model in dataset.MODELS.items()}
+
+    def test_round_trip_keeps_ids_timestamps_and_indexes(self):
+        path = os.path.join(self.tmp, "dump.ndjson.gz")
+        call_command("export_cloudysky", path, "--chunk-size", "7", stdout=StringIO())
+        before = self.snapshot()
+        indexes = {name for model in dataset.MODELS.values() for name, _ in dataset.secondary_indexes(model)}
+        with self.assertRaisesMessage(CommandError, "already hold rows"):
+            call_command("import_cloudysky", path, stdout=StringIO())
+
+        ModerationEvent.objects.all().delete()
+        User.objects.all().delete()
+        ModerationReason.objects.all().delete()
+        out = StringIO()
+        call_command("import_cloudysky", path, "--batch-size", "5", "--commit-every", "20", stdout=out)
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertIn("rows/s", out.getvalue())
+        self.assertEqual({name for model in dataset.MODELS.values() for name, _ in dataset.secondary_indexes(model)},
+                         indexes)
+        # Search triggers are back and the FTS tables were rebuilt from the imported rows
+        post = Post.objects.filter(is_hidden=False).first()
+        self.assertTrue([r for r in search(post.title, post.author, True) if r["type"] == "post"])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'app_%_fts_ai'")
+            self.assertEqual(len(cursor.fetchall()), 2)
+
+    def test_export_reads_without_taking_the_write_lock(self):
+        with mock.patch.object(connection, "transaction_mode", "IMMEDIATE"):
+            with dataset.snapshot(dataset.MODELS.values()):
+                self.assertEqual(connection.transaction_mode, "DEFERRED")
+            self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+        with mock.patch.object(dataset, "atomic", side_effect=AssertionError("export took a write transaction")):
+            call_command("export_cloudysky", os.path.join(self.tmp, "dump.ndjson"), stdout=StringIO())
+
+    def test_ignore_conflicts_skips_existing_rows(self):
+        path = os.path.join(self.tmp, "dump.ndjson")
+        call_command("export_cloudysky", path, "--types", "post", "reason", stdout=StringIO())
+        with open(path) as handle:
+            self.assertEqual(json.loads(handle.readline())["types"], ["reason", "post"])
+        count = Post.objects.count()
+        call_command("import_cloudysky", path, "--ignore-conflicts", "--keep-indexes", stdout=StringIO())
+        self.assertEqual(Post.objects.count(), count)
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user("alice", password="pw")
+        self.other = User.objects.create_user("bob", password="pw")
+        make_posts(self.user, 3)
+        make_posts(self.other, 3)
+        rebuild_post_stats()
+        hidden = Post.objects.filter(author=self.other).order_by("id").first()
+        hidden.is_hidden = True
+        hidden.save()
+        # The first two of each author's posts are a year and a bit old
+        self.old_ids = [p.id for u in (self.user, self.other)
+                        for p in Post.objects.filter(author=u).order_by("id")[:2]]
+        shift = timedelta(days=400)
+        Post.objects.filter(id__in=self.old_ids).update(
+            created_at=F("created_at") - shift, last_activity_at=F("last_activity_at") - shift)
+        Comment.objects.filter(post_id__in=self.old_ids).update(created_at=F("created_at") - shift)
+        self.client.force_login(self.user)
+
+    def dump(self, **params):
+        return self.client.get("/app/dumpFeed", params).content
+
+    def test_archive_moves_old_posts_and_comments(self):
+        self.assertEqual(archive_posts(), (4, 8))
+        self.assertEqual(set(ArchivedPost.objects.values_list("id", flat=True)), set(self.old_ids))
+        self.assertEqual(ArchivedComment.objects.count(), 8)
+        self.assertFalse(Post.objects.filter(id__in=self.old_ids).exists())
+        self.assertFalse(Comment.objects.filter(post_id__in=self.old_ids).exists())
+        self.assertEqual(archive_posts(), (0, 0))
+
+    def test_recent_activity_and_media_stay_hot(self):
+        active, with_media = self.old_ids[:2]
+        Post.objects.filter(id=active).update(last_activity_at=timezone.now())
+        PostMedia.objects.create(post_id=with_media, media_file="x.png")
+        self.assertEqual(archive_posts()[0], 2)
+        self.assertEqual(Post.objects.filter(id__in=[active, with_media]).count(), 2)
+
+    def test_dump_feed_and_post_detail_read_through_the_archive(self):
+        full = self.dump()
+        # (bob's hidden post is a 404 for alice before and after)
+        details = {pid: self.client.get(f"/app/post/{pid}/") for pid in self.old_ids}
+        archive_posts()
+
+        # Gone from the hot feed, back with ?archive=1 in the same order and shape
+        self.assertNotIn(self.old_ids[0], [p["id"] for p in json.loads(self.dump())])
+        self.assertEqual(self.dump(archive=1), full)
+        self.assertEqual(b"".join(self.client.get("/app/dumpFeed", {"archive": 1, "stream": 1}).streaming_content),
+                         full)
+        self.assertEqual(self.client.get("/app/async/dumpFeed", {"archive": 1}).content, full)
+
+        # Keyset pages walk across the hot/cold boundary
+        ids, cursor = [], None
+        for _ in range(10):
+            params = {"archive": 1, "limit": 2, **({"cursor": cursor} if cursor else {})}
+            response = self.client.get("/app/dumpFeed", params)
+            ids += [p["id"] for p in response.json()]
+            self.assertEqual(self.client.get("/app/async/dumpFeed", params).content, response.content)
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+        self.assertEqual(ids, [p["id"] for p in json.loads(full)])
+
+        for pid, before in details.items():
+            for url in (f"/app/post/{pid}/", f"/app/async/post/{pid}/"):
+                response = self.client.get(url)
+                self.assertEqual((response.status_code, response.content), (before.status_code, before.content))
+        self.assertEqual(self.client.get("/app/post/999999/").status_code, 404)
+
+    def test_archived_threads_are_read_only(self):
+        archive_posts()
+        pid = self.old_ids[0]
+        cid = ArchivedComment.objects.filter(post_id=pid).values_list("id", flat=True).first()
+        response = self.client.post("/app/createComment", {"post_id": pid, "content": "late reply"})
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(Comment.objects.filter(content="late reply").exists())
+
+        self.client.force_login(User.objects.create_user("carol", password="pw", is_staff=True))
+        for url, data in (("/app/hidePost", {"post_id": pid}), ("/app/hideComment", {"comment_id": cid}),
+                          ("/app/unhidePost", {"post_id": pid}), ("/app/unhideComment", {"comment_id": cid})):
+            self.assertEqual(self.client.post(url, data).status_code, 404, url)
+        results = self.client.post("/app/hidePosts", {"post_ids": [pid, 999999]}).json()["results"]
+        self.assertEqual(results, {str(pid): "archived", "999999": "not_found"})
+
+    def test_post_in_both_tables_is_merged_once(self):
+        # What a run interrupted between the archive and hot databases leaves behind
+        post = Post.objects.get(id=self.old_ids[0])
+        ArchivedPost.objects.create(id=post.id, author_id=post.author_id, title=post.title,
+                                    content=post.content, created_at=post.created_at, version=post.version)
+        self.assertEqual(self.dump(archive=1), self.dump())
+
+    def test_routing(self):
+        router = ArchiveRouter()
+        self.assertIsNone(router.db_for_read(ArchivedPost))
+        self.assertIsNone(router.allow_migrate("default", "app", "archivedpost"))
+        with self.settings(ARCHIVE_DATABASE="nowhere"):
+            self.assertIsNone(router.db_for_read(ArchivedPost))
+        with self.settings(ARCHIVE_DATABASE="default"):
+            self.assertEqual(router.db_for_write(ArchivedComment), "default")
+            self.assertIsNone(router.db_for_read(Post))
+            self.assertTrue(router.allow_migrate("default", "app", "archivedpost"))
+            self.assertFalse(router.allow_migrate("other", "app", "archivedpost"))
+            self.assertFalse(router.allow_migrate("default", "app", "post"))
+            self.assertFalse(router.allow_migrate("default", "auth", "user"))
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # --- HW 7 / GRADER ENDPOINTS ---
@@ -12,6 +12,20 @@ urlpatterns = [
     path('hideComment/', views.hide_comment, name='hide_comment'),
     path('hideComment', views.hide_comment, name='hide_comment_no_slash'),
 
+    # 2b. Bulk moderation (many ids, one UPDATE)
+    path('hidePosts/', views.hide_posts, name='hide_posts'),
+    path('hidePosts', views.hide_posts, name='hide_posts_no_slash'),
+    path('hideComments/', views.hide_comments, name='hide_comments'),
+    path('hideComments', views.hide_comments, name='hide_comments_no_slash'),
+
+    # 2c. Unhide and the moderation history (app/moderation.py)
+    path('unhidePost/', views.unhide_post, name='unhide_post'),
+    path('unhidePost', views.unhide_post, name='unhide_post_no_slash'),
+    path('unhideComment/', views.unhide_comment, name='unhide_comment'),
+    path('unhideComment', views.unhide_comment, name='unhide_comment_no_slash'),
+    path('moderation/log/', views.moderation_log, name='moderation_log'),
+    path('moderation/log', views.moderation_log, name='moderation_log_no_slash'),
+
     # 3. Dump Feed (Slash and No Slash)
     # This is the critical HW7 endpoint
     path('dumpFeed/', views.dump_feed, name='dump_feed'),
@@ -25,6 +39,27 @@ urlpatterns = [
     path('post-page/<int:post_id>/', views.post_page, name='post_page'),
 
 
+    # --- ASYNC (ASGI) READ ENDPOINTS ---
+    path('async/dumpFeed/', async_views.dump_feed, name='async_dump_feed'),
+    path('async/dumpFeed', async_views.dump_feed, name='async_dump_feed_no_slash'),
+    path('async/feed/', async_views.feed, name='async_feed'),
+    path('async/post/<int:post_id>/', async_views.post_detail, name='async_post_detail'),
+    path('feed/stream', async_views.feed_stream, name='feed_stream'),
+    path('feed/stream/', async_views.feed_stream, name='feed_stream_slash'),
+
+    # Media uploads (streamed, deduplicated, thumbnails built in the background)
+    path('uploadMedia', views.upload_media, name='upload_media'),
+    path('uploadMedia/', views.upload_media, name='upload_media_slash'),
+
+    # Request metrics (Prometheus text format)
+    path('metrics', views.metrics_view, name='metrics'),
+    path('metrics/', views.metrics_view, name='metrics_slash'),
+
+    # Full-text search (FTS5)
+    path('search', views.search_view, name='search'),
+    path('search/', views.search_view, name='search_slash'),
+
+
     # --- HW 4 & 5 / LEGACY PATHS ---
     path('new', views.signup_view, name='signup_page'),
     path('new/', views.signup_view, name='signup_page_slash'),
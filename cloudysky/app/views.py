@@ -1,5 +1,5 @@
-from django.shortcuts import render, get_object_or_404
-from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.shortcuts import render
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, HttpResponseForbidden, HttpResponseNotFound, StreamingHttpResponse
 from datetime import datetime
 import zoneinfo
 import json
@@ -7,55 +7,37 @@ from django.contrib.auth.models import User
 from django.contrib.auth import login
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.core import management
+from django.db import connection, transaction
+from django.db.models import F
 from django.contrib.auth.decorators import login_required
-from .models import Profile, Post, Comment, ModerationReason
-
-# ===================================================================
-# HELPERS
-# ===================================================================
-
-def is_censor(user):
-    """
-    Returns True if user is an admin/censor.
-    Checks Superuser, Staff, Permissions, 'admin' in username, and Groups.
-    """
-    if not user.is_authenticated:
-        return False
-    
-    # 1. Check Standard Flags
-    if user.is_superuser or user.is_staff:
-        return True
-        
-    # 2. Check Permissions
-    if user.has_perm('app.change_post') or user.has_perm('app.delete_post'):
-        return True
-        
-    # 3. Check Username (Safety net)
-    if 'admin' in user.username.lower():
-        return True
-    
-    # 4. Check Profile Type (from our merged models.py)
-    try:
-        if user.profile.user_type == 'ADMIN':
-            return True
-    except:
-        pass
-
-    # 5. Check Groups
-    user_groups = [g.name.lower() for g in user.groups.all()]
-    allowed_groups = ['censor', 'censors', 'mod', 'mods', 'moderator', 'moderators', 'admin', 'admins']
-    for g in user_groups:
-        if g in allowed_groups:
-            return True
-            
-    return False
+from django.conf import settings
+from .models import Profile, Post, Comment, ModerationEvent, rebuild_post_stats
+from .feed import (
+    can_see_post,
+    feed_queryset, page_params, keyset_page, iter_posts, stream_json_array,
+)
+from .feed_json import JsonRenderer, json_array, json_response
+from .authors import attach_author_cards
+from .feed_cache import cached_feed, DUMP, FEED, invalidate as invalidate_feeds
+from .archive import archived_feed_queryset, archived_ids, find_post, merge_posts, merged_page
+from .conditional import conditional_feed
+from .permissions import is_censor
+from .media import save_upload
+from .coalesce import create_comment
+from .ratelimit import rate_limit
+from .events import post_created, comment_created, posts_hidden, comments_hidden, content_restored
+from .schema import ensure_schema
+from .search import search
+from .moderation import ModerationLog, log_page
+from .reasons import reason_for
+from .metrics import registry as metrics_registry
 
 # ===================================================================
 # HW7: DUMP FEED (The Critical Autograder Endpoint)
 # ===================================================================
 
 @login_required
+@conditional_feed(DUMP)
 def dump_feed(request):
     """
     HW7 Endpoint: /app/dumpFeed
@@ -63,73 +45,48 @@ def dump_feed(request):
     - Returns ALL content (no truncation).
     - Admins/Owners see suppressed content flagged.
     - Others see nothing (posts) or placeholders (comments).
+
+    Opt-in modes for big tables:
+    - ?cursor=<created_at,id>&limit=N returns one keyset page; the cursor for
+      the next page comes back in the X-Next-Cursor header.
+    - ?stream=1 streams the whole array from a chunked iterator.
+    - ?archive=1 (alone or with either of the above) includes archived posts
+      (archive.py), merged in date order as both tables are read.
+    The plain (unpaged) feed is served from the feed cache (see feed_cache.py).
     """
     is_admin = is_censor(request.user)
-    
-    # Get all posts (newest first)
-    all_posts = Post.objects.all().order_by('-created_at')
-    feed_data = []
+    try:
+        cursor, limit = page_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Bad cursor or limit: {e}")
 
-    for post in all_posts:
-        is_owner = (post.author == request.user)
-        
-        # --- POST VISIBILITY ---
-        # If hidden, ONLY Admin or Owner can see it. Everyone else skips it.
-        if (post.is_hidden or post.is_suppressed) and not (is_admin or is_owner):
-            continue
-
-        # --- COMMENTS VISIBILITY ---
-        comments_data = []
-        for comment in post.comments.all().order_by('created_at'):
-            is_comment_owner = (comment.author == request.user)
-            comment_content = comment.content
-            
-            if comment.is_hidden or comment.is_suppressed:
-                if is_admin or is_comment_owner:
-                    # Admin/Owner sees content but prefixed with a flag
-                    # Retrieve the specific reason text (e.g. "NIXON") if available
-                    reason = "Hidden"
-                    if comment.hidden_reason:
-                        reason = comment.hidden_reason.reason_text
-                    comment_content = f"[{reason}] {comment.content}"
-                else:
-                    # Regular users see placeholder
-                    comment_content = "This comment has been removed"
-
-            # Get Comment Author Color
-            try:
-                c_color = comment.author.profile.color
-            except:
-                c_color = "#000000"
-
-            comments_data.append({
-                "id": comment.id,
-                "username": comment.author.username,
-                "content": comment_content,
-                "date": comment.created_at.strftime("%Y-%m-%d %H:%M"),
-                "color": c_color
-            })
-
-        # Get Post Author Color
-        try:
-            p_color = post.author.profile.color
-        except:
-            p_color = "#000000"
-
-        # Add Post to Feed
-        feed_data.append({
-            "id": post.id,
-            "title": post.title,
-            "username": post.author.username,
-            "author": post.author.username, # Redundant but safe for autograders
-            "date": post.created_at.strftime("%Y-%m-%d %H:%M"),
-            "content": post.content, # FULL content required for dumpFeed
-            "comments": comments_data,
-            "is_suppressed": post.is_hidden or post.is_suppressed,
-            "color": p_color
-        })
-
-    return JsonResponse(feed_data, safe=False)
+    with_archive = bool(request.GET.get('archive'))
+
+    if limit is not None:
+        posts = feed_queryset(request.user, is_admin, with_comments=True)
+        if with_archive:
+            archived = archived_feed_queryset(request.user, is_admin, with_comments=True)
+            page, next_cursor = merged_page(posts, archived, cursor, limit)
+        else:
+            page, next_cursor = keyset_page(posts, cursor, limit)
+        renderer = JsonRenderer(request.user.id, is_admin)
+        response = json_response(json_array([renderer.dump_post(p) for p in page]))
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    if request.GET.get('stream') or with_archive:
+        posts = iter_posts(feed_queryset(request.user, is_admin, with_comments=True))
+        if with_archive:
+            # The feed cache only holds the hot feed
+            posts = merge_posts(posts, iter_posts(archived_feed_queryset(request.user, is_admin, with_comments=True)))
+        renderer = JsonRenderer(request.user.id, is_admin)
+        fragments = (renderer.dump_post(p) for p in posts)
+        if not request.GET.get('stream'):
+            return json_response(json_array(fragments))
+        return StreamingHttpResponse(stream_json_array(fragments), content_type='application/json')
+
+    return json_response(cached_feed(DUMP, request.user, is_admin))
 
 # ===================================================================
 # HW7: MODERATION (Hide Post/Comment with Reasons)
@@ -159,22 +116,28 @@ def hide_post(request):
     if not post_id:
         return HttpResponse("Missing post_id", status=400)
 
-    # 3. Handle Reason (e.g. "NIXON")
-    reason_obj = None
-    if reason_text:
-        reason_obj, _ = ModerationReason.objects.get_or_create(reason_text=reason_text)
+    # 3. Handle Reason (e.g. "NIXON"); cached per worker, see reasons.py
+    reason_obj = reason_for(reason_text)
 
     # 4. Update Post
     post = Post.objects.filter(id=post_id).first()
     if post:
+        was_hidden, previous_reason_id = post.is_hidden, post.hidden_reason_id
         post.is_hidden = True
         post.is_suppressed = True
         post.hidden_by = request.user
         post.hidden_reason = reason_obj
         post.hidden_at = datetime.now(zoneinfo.ZoneInfo("America/Chicago"))
-        post.save()
+        with transaction.atomic(), ModerationLog(request.user) as log:
+            post.save()
+            log.hide(ModerationEvent.Target.POST, post.id, reason_obj, was_hidden, previous_reason_id)
+        posts_hidden([post.id])
         return JsonResponse({"status": "success", "message": f"Post {post_id} hidden. Reason: {reason_text}"})
 
+    # Archived threads are read-only (archive.py)
+    if _is_archived(Post, post_id):
+        return HttpResponseNotFound(f"Post {post_id} is archived.")
+
     # Fail-safe for autograder: return success even if ID is wrong
     return JsonResponse({"status": "success", "message": "Post not found, but operation marked success"})
 
@@ -200,22 +163,202 @@ def hide_comment(request):
     if not comment_id:
         return HttpResponse("Missing comment_id", status=400)
 
-    reason_obj = None
-    if reason_text:
-        reason_obj, _ = ModerationReason.objects.get_or_create(reason_text=reason_text)
+    reason_obj = reason_for(reason_text)
 
     comment = Comment.objects.filter(id=comment_id).first()
     if comment:
+        was_visible = not (comment.is_hidden or comment.is_suppressed)
+        was_hidden, previous_reason_id = comment.is_hidden, comment.hidden_reason_id
         comment.is_hidden = True
         comment.is_suppressed = True
         comment.hidden_by = request.user
         comment.hidden_reason = reason_obj
         comment.hidden_at = datetime.now(zoneinfo.ZoneInfo("America/Chicago"))
-        comment.save()
+        with transaction.atomic(), ModerationLog(request.user) as log:
+            comment.save()
+            log.hide(ModerationEvent.Target.COMMENT, comment.id, reason_obj, was_hidden, previous_reason_id)
+            if was_visible:
+                Post.objects.filter(id=comment.post_id).update(
+                    visible_comment_count=F('visible_comment_count') - 1)
+        comments_hidden([comment.id])
         return JsonResponse({"status": "success", "message": f"Comment {comment_id} hidden."})
 
+    if _is_archived(Comment, comment_id):
+        return HttpResponseNotFound(f"Comment {comment_id} is archived.")
+
     return JsonResponse({"status": "success", "message": "Comment not found, but operation marked success"})
 
+def _is_archived(model, obj_id):
+    try:
+        return bool(archived_ids(model, [int(obj_id)]))
+    except (TypeError, ValueError):
+        return False
+
+# ===================================================================
+# BULK MODERATION (hide a whole spam wave in one request)
+# ===================================================================
+
+MAX_BULK_IDS = 1000
+
+def _parse_bulk_ids(request, ids_key):
+    """
+    Hybrid parsing like hide_post: form data (repeated or comma-separated ids)
+    or a JSON body {"<ids_key>": [...], "reason": "..."}.
+    Returns (raw ids, reason text).
+    """
+    raw_ids = request.POST.getlist(ids_key)
+    reason_text = request.POST.get('reason')
+
+    if not raw_ids:
+        try:
+            data = json.loads(request.body)
+            raw_ids = data.get(ids_key) or []
+            reason_text = data.get('reason')
+        except (ValueError, AttributeError):
+            raw_ids = []
+
+    if isinstance(raw_ids, (str, int)):
+        raw_ids = [raw_ids]
+    ids = []
+    for value in raw_ids:
+        ids.extend(str(value).split(','))
+    return [i.strip() for i in ids if str(i).strip()], reason_text
+
+
+def _bulk_hide(request, model, ids_key, invalidate_kinds):
+    """Hides every listed row of `model` with one UPDATE in one transaction."""
+    if request.method != 'POST':
+        return HttpResponse("Method not allowed", status=405)
+
+    if not request.user.is_authenticated or not is_censor(request.user):
+        return HttpResponse("Unauthorized", status=401)
+
+    raw_ids, reason_text = _parse_bulk_ids(request, ids_key)
+    if not raw_ids:
+        return HttpResponse(f"Missing {ids_key}", status=400)
+    if len(raw_ids) > MAX_BULK_IDS:
+        return HttpResponse(f"Too many ids (max {MAX_BULK_IDS})", status=400)
+
+    results = {}
+    ids = set()
+    for raw in raw_ids:
+        try:
+            ids.add(int(raw))
+        except ValueError:
+            results[raw] = "invalid"
+
+    target_type = ModerationEvent.Target.POST if model is Post else ModerationEvent.Target.COMMENT
+    with transaction.atomic(), ModerationLog(request.user) as log:
+        reason_obj = reason_for(reason_text)
+
+        # Prior state comes with the existence check, for the history
+        before = model.objects.filter(id__in=ids).values_list('id', 'is_hidden', 'hidden_reason_id')
+        found = set()
+        for obj_id, was_hidden, previous_reason_id in before:
+            found.add(obj_id)
+            log.hide(target_type, obj_id, reason_obj, was_hidden, previous_reason_id)
+        model.objects.filter(id__in=found).update(
+            is_hidden=True,
+            is_suppressed=True,
+            hidden_by=request.user,
+            hidden_reason=reason_obj,
+            hidden_at=datetime.now(zoneinfo.ZoneInfo("America/Chicago")),
+        )
+        if model is Comment:
+            # Recount the affected posts' visible comments in the same transaction (one UPDATE)
+            rebuild_post_stats(Post.objects.filter(id__in=Comment.objects.filter(id__in=found).values('post_id')))
+
+    # QuerySet.update() skips post_save, so drop dependent caches here (once)
+    if found:
+        invalidate_feeds(*invalidate_kinds)
+        if model is Post:
+            posts_hidden(found)
+        else:
+            comments_hidden(found)
+
+    archived = archived_ids(model, ids - found)
+    for obj_id in ids:
+        results[str(obj_id)] = "hidden" if obj_id in found else "archived" if obj_id in archived else "not_found"
+    return JsonResponse({"status": "success", "hidden": len(found), "reason": reason_text, "results": results})
+
+@csrf_exempt
+def hide_posts(request):
+    """/app/hidePosts: post_ids=[...] + reason. Per-id results: hidden / archived / not_found / invalid."""
+    return _bulk_hide(request, Post, 'post_ids', (DUMP, FEED))
+
+@csrf_exempt
+def hide_comments(request):
+    """/app/hideComments: comment_ids=[...] + reason. Per-id results: hidden / archived / not_found / invalid."""
+    return _bulk_hide(request, Comment, 'comment_ids', (DUMP, FEED))
+
+# ===================================================================
+# UNHIDE + MODERATION HISTORY
+# ===================================================================
+
+def _unhide(request, model, id_key):
+    """Clears the moderation state of one row and logs an "unhide" event."""
+    if request.method != 'POST':
+        return HttpResponse("Method not allowed", status=405)
+
+    if not request.user.is_authenticated or not is_censor(request.user):
+        return HttpResponse("Unauthorized", status=401)
+
+    obj_id = request.POST.get(id_key)
+    if not obj_id:
+        try:
+            obj_id = json.loads(request.body).get(id_key)
+        except (ValueError, AttributeError):
+            pass
+    try:
+        obj = model.objects.filter(id=int(obj_id)).first()
+    except (TypeError, ValueError):
+        return HttpResponse(f"Missing {id_key}", status=400)
+    if obj is None:
+        return HttpResponseNotFound(f"{model.__name__} not found.")
+    if not (obj.is_hidden or obj.is_suppressed):
+        return JsonResponse({"status": "success", "message": f"{model.__name__} {obj.id} was not hidden."})
+
+    target_type = ModerationEvent.Target.POST if model is Post else ModerationEvent.Target.COMMENT
+    previous_reason_id = obj.hidden_reason_id
+    obj.is_hidden = obj.is_suppressed = False
+    obj.hidden_by = obj.hidden_reason = obj.hidden_at = None
+    with transaction.atomic(), ModerationLog(request.user) as log:
+        obj.save()
+        log.unhide(target_type, obj.id, previous_reason_id)
+        if model is Comment:
+            Post.objects.filter(id=obj.post_id).update(visible_comment_count=F('visible_comment_count') + 1)
+    content_restored()
+    return JsonResponse({"status": "success", "message": f"{model.__name__} {obj.id} unhidden."})
+
+@csrf_exempt
+def unhide_post(request):
+    """/app/unhidePost: post_id. Makes the post visible again."""
+    return _unhide(request, Post, 'post_id')
+
+@csrf_exempt
+def unhide_comment(request):
+    """/app/unhideComment: comment_id. Makes the comment visible again."""
+    return _unhide(request, Comment, 'comment_id')
+
+@login_required
+@require_http_methods(["GET"])
+def moderation_log(request):
+    """
+    /app/moderation/log: moderation events, newest first, censors only.
+    Filters: ?target_type=post|comment&target_id=, ?moderator=<user id>, ?action=hide|unhide|reason.
+    Paging: ?limit=N (default 50, max 500) and ?cursor=<next_cursor of the previous page>.
+    """
+    if not is_censor(request.user):
+        return HttpResponse("Unauthorized", status=401)
+    try:
+        events, next_cursor = log_page(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Bad filter or cursor: {e}")
+    response = JsonResponse({"events": events, "next_cursor": next_cursor})
+    if next_cursor:
+        response['X-Next-Cursor'] = next_cursor
+    return response
+
 # ALIASES (For backward compatibility with older tests)
 hide_post_api = hide_post
 hide_comment_api = hide_comment
@@ -226,6 +369,7 @@ hide_comment_api = hide_comment
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('create_post')
 def create_post_api(request):
     if not request.user.is_authenticated:
         return HttpResponse("Unauthorized", status=401)
@@ -236,11 +380,13 @@ def create_post_api(request):
     if not title or not content:
         return HttpResponseBadRequest("Missing title or content")
         
-    Post.objects.create(author=request.user, title=title, content=content)
+    post = Post.objects.create(author=request.user, title=title, content=content)
+    post_created(post)
     return HttpResponse("Post created successfully", status=201)
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('create_comment')
 def create_comment_api(request):
     if not request.user.is_authenticated:
         return HttpResponse("Unauthorized", status=401)
@@ -255,97 +401,139 @@ def create_comment_api(request):
     try:
         post = Post.objects.get(id=int(post_id))
     except (Post.DoesNotExist, ValueError):
+        # ...but never re-home a comment meant for an archived (read-only) thread
+        if _is_archived(Post, post_id):
+            return HttpResponse("Post is archived", status=410)
         post = Post.objects.first()
         if not post:
             post = Post.objects.create(author=request.user, title="Safety Net", content="Auto-created")
             
-    Comment.objects.create(author=request.user, post=post, content=content)
+    # One INSERT + stats UPDATE, or a share of a coalesced batch (app/coalesce.py)
+    comment = create_comment(request.user, post, content)
+    comment_created(comment, post)
     return HttpResponse("Comment created successfully", status=201)
 
 @login_required
+@conditional_feed(FEED)
 def feed(request):
     # Standard feed for the frontend (allows truncation)
-    all_posts = Post.objects.all().order_by('-created_at')
-    data = []
+    # Same opt-in ?cursor=&limit= paging and ?stream=1 modes as dump_feed;
+    # in paging mode the body also carries "next_cursor".
+    # ?sort=activity orders by latest comment instead of post date.
     is_admin = is_censor(request.user)
-
-    for post in all_posts:
-        is_owner = (post.author == request.user)
-        if (post.is_hidden or post.is_suppressed) and not (is_admin or is_owner):
-            continue 
-
-        # Truncate content for standard feed
-        short_content = post.content[:50] + "..." if len(post.content) > 50 else post.content
-        
-        try:
-            color = post.author.profile.color
-        except:
-            color = "#000000"
-
-        data.append({
-            "id": post.id,
-            "title": post.title,
-            "username": post.author.username,
-            "date": post.created_at.strftime("%Y-%m-%d %H:%M"),
-            "content_truncated": short_content,
-            "is_suppressed": post.is_hidden,
-            "color": color
-        })
-    return JsonResponse({"feed": data}, safe=False)
+    try:
+        cursor, limit = page_params(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Bad cursor or limit: {e}")
+    renderer = JsonRenderer(request.user.id, is_admin)
+    posts = feed_queryset(request.user, is_admin, with_media=True)
+
+    if request.GET.get('sort') == 'activity':
+        if limit is not None:
+            return HttpResponseBadRequest("Cursor paging only supports the default (newest first) order")
+        posts = posts.order_by('-last_activity_at', '-id')
+        fragments = [renderer.feed_post(p) for p in attach_author_cards(posts)]
+        return json_response(json_array(fragments, prefix=b'{"feed": [', suffix=b']}'))
+
+    if limit is not None:
+        page, next_cursor = keyset_page(posts, cursor, limit)
+        suffix = b'], "next_cursor": %s}' % renderer.cursor(next_cursor)
+        response = json_response(json_array([renderer.feed_post(p) for p in page], prefix=b'{"feed": [', suffix=suffix))
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
+
+    if request.GET.get('stream'):
+        fragments = (renderer.feed_post(p) for p in iter_posts(posts))
+        return StreamingHttpResponse(stream_json_array(fragments, prefix=b'{"feed": [', suffix=b']}'),
+                                     content_type='application/json')
+
+    return json_response(b'{"feed": %s}' % cached_feed(FEED, request.user, is_admin))
 
 @login_required
+@conditional_feed(DUMP)
 def post_detail(request, post_id):
-    # Standard detail view
-    post = get_object_or_404(Post, id=post_id)
+    # Standard detail view; archived posts (archive.py) are served from the archive
+    try:
+        post, comments = find_post(post_id)
+    except Post.DoesNotExist:
+        raise Http404("No Post matches the given query.")
     is_admin = is_censor(request.user)
-    is_owner = (post.author == request.user)
 
-    if (post.is_hidden or post.is_suppressed) and not (is_admin or is_owner):
+    if not can_see_post(post, request.user, is_admin):
         return HttpResponseNotFound("Post not found.")
 
-    comments = Comment.objects.filter(post=post).order_by('created_at')
-    comments_data = []
+    return json_response(JsonRenderer(request.user.id, is_admin).post_detail(post, comments))
 
-    for c in comments:
-        display_content = c.content
-        is_c_owner = (c.author == request.user)
-        
-        if (c.is_hidden or c.is_suppressed):
-            if not (is_admin or is_c_owner):
-                display_content = "This comment has been removed"
-            else:
-                reason = "Hidden"
-                if c.hidden_reason:
-                    reason = c.hidden_reason.reason_text
-                display_content = f"[{reason}] {c.content}"
+# ===================================================================
+# MEDIA UPLOADS
+# ===================================================================
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def upload_media(request):
+    """
+    /app/uploadMedia: multipart form with post_id and one or more "file" parts.
+    Files are streamed to storage and deduplicated by sha256 (see media.py);
+    thumbnails are built in the background and show up in /app/feed/.
+    """
+    if not request.user.is_authenticated:
+        return HttpResponse("Unauthorized", status=401)
 
-        try:
-            color = c.author.profile.color
-        except:
-            color = "#000000"
-
-        comments_data.append({
-            "id": c.id,
-            "username": c.author.username,
-            "content": display_content,
-            "date": c.created_at.strftime("%Y-%m-%d %H:%M"),
-            "color": color
-        })
-        
     try:
-        p_color = post.author.profile.color
-    except:
-        p_color = "#000000"
-
-    return JsonResponse({
-        "id": post.id,
-        "title": post.title,
-        "username": post.author.username,
-        "date": post.created_at.strftime("%Y-%m-%d %H:%M"),
-        "content": post.content,
-        "comments": comments_data,
-        "color": p_color
-    })
+        post = Post.objects.filter(id=int(request.POST.get('post_id', ''))).first()
+    except ValueError:
+        return HttpResponseBadRequest("Missing or bad post_id")
+    if post is None:
+        return HttpResponseNotFound("Post not found.")
+    if post.author_id != request.user.id and not is_censor(request.user):
+        return HttpResponseForbidden("Only the author can attach media")
+
+    uploads = request.FILES.getlist('file')
+    if not uploads:
+        return HttpResponseBadRequest("Missing file")
+    limit = settings.MEDIA_MAX_UPLOAD_SIZE
+    for upload in uploads:
+        if upload.size > limit:
+            return HttpResponse(f"{upload.name} is larger than {limit} bytes", status=413)
+
+    results = []
+    with transaction.atomic():
+        for upload in uploads:
+            media, deduplicated = save_upload(post, upload)
+            results.append({"id": media.id, "name": upload.name, "sha256": media.sha256, "size": media.size,
+                            "status": media.status, "deduplicated": deduplicated})
+    return JsonResponse({"status": "success", "media": results}, status=201)
+
+# ===================================================================
+# METRICS (Prometheus scrape endpoint)
+# ===================================================================
+
+def metrics_view(request):
+    # Scrapers connect from METRICS_ALLOWED_IPS; censors can look from anywhere
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not allowed and not (request.user.is_authenticated and is_censor(request.user)):
+        return HttpResponseForbidden("Forbidden")
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@login_required
+def search_view(request):
+    """
+    /app/search?q=...&limit=N
+    Full-text search over posts and comments (SQLite FTS5), best bm25 match first.
+    Visibility follows dumpFeed: hidden items only for censors and their authors.
+    """
+    if connection.vendor != 'sqlite':
+        return HttpResponse("Search requires the SQLite FTS5 index", status=501)
+
+    text = request.GET.get('q', '')
+    try:
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        return HttpResponseBadRequest("Bad limit")
+
+    results = search(text, request.user, is_censor(request.user), limit=limit)
+    return JsonResponse({"query": text, "results": results})
 
 # ===================================================================
 # STANDARD HTML VIEWS (HW2/HW4 - Preserved)
@@ -366,8 +554,9 @@ def index(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@rate_limit('create_user')
 def create_user_view(request):
-    management.call_command('migrate')
+    ensure_schema()
     
     # 1. Get Data
     username = request.POST.get("username") or request.POST.get("user_name")
@@ -375,27 +564,24 @@ def create_user_view(request):
     password = request.POST.get("password")
     is_admin_flag = (request.POST.get("is_admin") == "1")
     
-    # 2. Handle duplicates (Autograder quirk)
-    if User.objects.filter(username=username).exists():
-        User.objects.get(username=username).delete()
-
     try:
-        # 3. Create User
-        user = User.objects.create_user(username=username, email=email, password=password)
-        
-        # 4. Handle Profile (Signal vs Manual Race Condition)
-        # The signal in models.py likely created a SERF profile already.
-        # We must explicitly fetch and update it if is_admin is requested.
-        
-        if hasattr(user, 'profile'):
-            profile = user.profile
-            if is_admin_flag:
-                profile.user_type = 'ADMIN'
-                profile.save()
-        else:
-            # Fallback: Create manually if signal failed
-            user_type = 'ADMIN' if is_admin_flag else 'SERF'
-            Profile.objects.create(user=user, user_type=user_type)
+        with transaction.atomic():
+            # 2. Handle duplicates (Autograder quirk): one DELETE, no exists()/get() round trips
+            User.objects.filter(username=username).delete()
+
+            # 3. Create User
+            user = User.objects.create_user(username=username, email=email, password=password)
+            
+            # 4. Handle Profile
+            # The signal in models.py creates a SERF profile; only admins need an update.
+            if hasattr(user, 'profile'):
+                if is_admin_flag:
+                    user.profile.user_type = Profile.UserType.ADMIN
+                    user.profile.save(update_fields=['user_type'])
+            else:
+                # Fallback: Create manually if signal failed
+                user_type = Profile.UserType.ADMIN if is_admin_flag else Profile.UserType.SERF
+                Profile.objects.create(user=user, user_type=user_type)
         
         login(request, user)
         return HttpResponse(f"Success! User '{username}' created.")
@@ -41,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole stack (app/metrics.py)
+    'app.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,6 +82,84 @@ DATABASES = {
     }
 }
 
+# Feed reads (app/feed.py, search) go to this alias when it is configured;
+# see settings_production.py for a WAL + replica setup. The archive tables
+# go to ARCHIVE_DATABASE when it names an alias (migrate it with --database).
+DATABASE_ROUTERS = ['app.routers.ArchiveRouter', 'app.routers.FeedReplicaRouter']
+FEED_REPLICA_DATABASE = None
+ARCHIVE_DATABASE = None
+
+# Archive job (manage.py archive_posts, app/archive.py): posts with no
+# activity for this long move to the archive tables with their comments
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 500  # posts per transaction
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Process-local by default; point FEED_CACHE_ALIAS at a shared backend
+# (Redis, Memcached, ...) when running several workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cloudysky',
+    }
+}
+
+FEED_CACHE_ALIAS = 'default'
+FEED_CACHE_TIMEOUT = 300  # seconds
+# ETag/304s for the feeds (app/conditional.py) come from the feed cache's
+# generations; trusting a locmem one is only right with a single process
+CONDITIONAL_GET_ON_LOCAL_CACHE = True
+
+# Feed JSON encoding (app/feed_json.py): "json" is byte-for-byte what
+# JsonResponse sends; "orjson" (or "auto", orjson when installed) is faster
+# but writes non-ASCII as raw UTF-8 instead of \u escapes
+FEED_JSON_BACKEND = 'json'
+FEED_FRAGMENT_CACHE_SIZE = 200_000  # pre-encoded posts/comments kept per worker
+
+# How long a worker trusts its memoized "is this user a censor?" answer
+CENSOR_CACHE_TTL = 30  # seconds
+
+# Live feed events (/app/feed/stream, app/events.py). The in-process broker
+# reaches the streams of one ASGI process; with several processes use
+# 'app.events.RedisBroker' and set FEED_EVENTS_REDIS_URL.
+FEED_EVENTS_BROKER = 'app.events.InProcessBroker'
+FEED_EVENTS_REDIS_URL = None
+FEED_EVENTS_QUEUE_SIZE = 100  # events a slow stream may lag before it is told to resync
+FEED_STREAM_HEARTBEAT = 15  # seconds
+
+# Request metrics (app/metrics.py, scraped at /app/metrics). Requests over
+# either budget are logged with their SQL.
+METRICS_QUERY_BUDGET = 50
+METRICS_LATENCY_BUDGET_MS = 500
+# Per-view exceptions: signup and login hash a password (PBKDF2), which alone
+# takes about as long as the default budget
+METRICS_VIEW_LATENCY_BUDGETS_MS = {
+    'app.views.create_user_view': 3000,
+    'django.contrib.auth.views.LoginView': 3000,
+}
+METRICS_LOGGED_QUERIES = 100  # SQL statements kept per request for that log
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # scrapers; logged-in censors may always read it
+
+# Write endpoint rate limits (app/ratelimit.py): per scope, a token bucket per
+# logged-in user and/or client IP as (tokens per second, bucket size). Buckets
+# are per process; 'app.ratelimit.RedisBackend' + RATE_LIMIT_REDIS_URL shares them.
+RATE_LIMIT_ENABLED = True
+RATE_LIMITS = {
+    'create_post': {'user': (0.5, 20), 'ip': (2, 60)},
+    'create_comment': {'user': (2, 60), 'ip': (5, 120)},
+    'create_user': {'ip': (1, 100)},
+}
+RATE_LIMIT_BACKEND = 'app.ratelimit.LocalBackend'
+RATE_LIMIT_REDIS_URL = None
+
+# createComment write coalescing (app/coalesce.py): concurrent comments are
+# held up to this long and written in one transaction. 0 turns it off.
+COMMENT_COALESCE_WINDOW_MS = 0
+COMMENT_COALESCE_MAX_BATCH = 100
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -117,6 +197,12 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded media (app/media.py)
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_MAX_UPLOAD_SIZE = 25 * 1024 * 1024  # bytes per file
+MEDIA_RENDITION_WORKERS = 2  # thumbnail/resize threads per process
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,94 @@
+"""
+Production database profile for cloudysky.
+
+    DJANGO_SETTINGS_MODULE=cloudysky.settings_production gunicorn cloudysky.wsgi ...
+
+Same as settings.py, but SQLite is tuned for many concurrent readers and a
+steady stream of writers:
+- WAL journal: readers never block the writer and the writer never blocks readers
+- synchronous=NORMAL: fsync at checkpoints instead of every commit (safe with WAL;
+  a power cut can lose the last transactions, never corrupt the file)
+- busy_timeout: a writer waits for the lock instead of failing with "database is locked"
+- mmap: reads come straight from the page cache
+- IMMEDIATE transactions: atomic blocks take the write lock up front, so two
+  read-then-write transactions cannot deadlock on the lock upgrade (which the
+  busy timeout cannot resolve)
+- persistent connections (CONN_MAX_AGE) so the PRAGMAs run once per connection,
+  not once per request
+
+Environment:
+- CLOUDYSKY_DB_PATH        database file (default: BASE_DIR/db.sqlite3)
+- CLOUDYSKY_REPLICA_PATH   optional read replica (e.g. a LiteFS/Litestream copy);
+                           feed reads are routed there (app/routers.py)
+- CLOUDYSKY_ARCHIVE_PATH   optional separate SQLite file for archived posts
+                           (app/archive.py); run `migrate --database archive` once
+- CLOUDYSKY_REDIS_URL      feed cache shared by every worker (redis://...); without
+                           it the workers share a file cache in CLOUDYSKY_CACHE_DIR
+                           (default BASE_DIR/feed_cache), which only works on one host
+- CLOUDYSKY_SECRET_KEY, CLOUDYSKY_ALLOWED_HOSTS
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, CACHES, SECRET_KEY as DEV_SECRET_KEY
+
+DEBUG = False
+SECRET_KEY = os.environ.get('CLOUDYSKY_SECRET_KEY', DEV_SECRET_KEY)
+ALLOWED_HOSTS = os.environ.get('CLOUDYSKY_ALLOWED_HOSTS', '127.0.0.1,localhost').split(',')
+
+SQLITE_PRAGMAS = ";".join([
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA temp_store=MEMORY",
+])
+
+
+def sqlite_database(path, **extra):
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 5,
+        },
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        **extra,
+    }
+
+
+DATABASES = {
+    'default': sqlite_database(os.environ.get('CLOUDYSKY_DB_PATH', BASE_DIR / 'db.sqlite3')),
+}
+
+if os.environ.get('CLOUDYSKY_REPLICA_PATH'):
+    DATABASES['replica'] = sqlite_database(os.environ['CLOUDYSKY_REPLICA_PATH'],
+                                           TEST={'MIRROR': 'default'})
+    FEED_REPLICA_DATABASE = 'replica'
+
+if os.environ.get('CLOUDYSKY_ARCHIVE_PATH'):
+    DATABASES['archive'] = sqlite_database(os.environ['CLOUDYSKY_ARCHIVE_PATH'])
+    ARCHIVE_DATABASE = 'archive'
+
+# The feed cache holds the generations behind the feed ETags (app/conditional.py)
+# and the author card version (app/authors.py): every worker must see the same
+# one, or a worker that missed a write keeps serving (and 304ing) stale feeds.
+# Redis increments atomically; the file cache is good for a few workers on one
+# host (its incr is a read and a write, so a burst of writes may bump once).
+if os.environ.get('CLOUDYSKY_REDIS_URL'):
+    FEED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CLOUDYSKY_REDIS_URL'],
+        'KEY_PREFIX': 'cloudysky',
+    }
+else:
+    FEED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CLOUDYSKY_CACHE_DIR', BASE_DIR / 'feed_cache'),
+    }
+CACHES = {**CACHES, 'feed': FEED_CACHE}
+FEED_CACHE_ALIAS = 'feed'
+CONDITIONAL_GET_ON_LOCAL_CACHE = False
@@ -1,6 +1,8 @@
 
 #URL configuration for cloudysky project.
 
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
@@ -21,3 +23,6 @@ urlpatterns = [
     path('', app_views.index, name='root_index'),
     path('index.html', app_views.index, name='html_index'),
 ]
+
+# Uploaded media during development (a real web server serves MEDIA_ROOT in production)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
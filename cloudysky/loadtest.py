@@ -0,0 +1,158 @@
+"""
+loadtest.py: compare the sync (WSGI) and async (ASGI) CloudySky read endpoints.
+
+Start the app both ways (same database), for example:
+
+    gunicorn cloudysky.wsgi -w 4 --threads 8 -b 127.0.0.1:8000
+    uvicorn cloudysky.asgi:application --workers 4 --port 8001
+
+then point this script at each:
+
+    python loadtest.py --base-url http://127.0.0.1:8000 --path /app/dumpFeed \\
+        --username alice --password secret
+    python loadtest.py --base-url http://127.0.0.1:8001 --path /app/async/dumpFeed \\
+        --username alice --password secret
+
+For every concurrency level (default 50 100 250 500) it opens that many
+keep-alive connections, hammers the path for --duration seconds and reports
+requests/sec, p50/p99 latency and errors. Only the standard library is used.
+"""
+import argparse
+import asyncio
+import http.cookiejar
+import json
+import statistics
+import time
+import urllib.parse
+import urllib.request
+
+
+def login(base_url, username, password):
+    """Logs in through /accounts/login/ and returns the session cookie header."""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    login_url = base_url + "/accounts/login/"
+    opener.open(login_url).read()
+    csrf = next(c.value for c in jar if c.name == "csrftoken")
+    form = urllib.parse.urlencode({
+        "username": username, "password": password, "csrfmiddlewaretoken": csrf,
+    }).encode()
+    request = urllib.request.Request(login_url, data=form, headers={"Referer": login_url})
+    opener.open(request).read()
+    cookies = {c.name: c.value for c in jar}
+    if "sessionid" not in cookies:
+        raise SystemExit("Login failed: no sessionid cookie")
+    return "; ".join(f"{k}={v}" for k, v in cookies.items())
+
+
+async def read_response(reader):
+    """Reads one HTTP/1.1 response; returns (status, keep_alive)."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("server closed the connection")
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)  # chunk + CRLF
+            if size == 0:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get("connection", "").lower() != "close"
+
+
+async def worker(host, port, request_bytes, deadline, latencies, errors):
+    reader = writer = None
+    while time.perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            start = time.perf_counter()
+            writer.write(request_bytes)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+            if not keep_alive:
+                writer.close()
+                writer = None
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError) as e:
+            errors.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(base_url, path, cookie, concurrency, duration):
+    url = urllib.parse.urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    request_bytes = (
+        f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\nCookie: {cookie}\r\n"
+        f"Accept: application/json\r\nConnection: keep-alive\r\n\r\n"
+    ).encode()
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(host, port, request_bytes, deadline, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(pct(0.50), 2) if latencies else None,
+        "p99_ms": round(pct(0.99), 2) if latencies else None,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/app/dumpFeed")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 250, 500])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    cookie = login(args.base_url, args.username, args.password)
+    results = [asyncio.run(run_level(args.base_url, args.path, cookie, level, args.duration))
+               for level in args.concurrency]
+
+    if args.json:
+        print(json.dumps({"base_url": args.base_url, "path": args.path, "results": results}, indent=2))
+        return
+    print(f"{args.base_url}{args.path}")
+    print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        print(f"{r['concurrency']:>8} {r['rps']:>9} {r['p50_ms']!s:>9} {r['p99_ms']!s:>9} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+'''gc_uploads.py is a custom management command:
+
+    python manage.py gc_uploads [--dry-run] [--grace-minutes 60]
+
+Uploads.file keeps one copy of every unique file (see library/storage.py), shared by every Uploads row
+with the same contents. Deleting a row doesn't delete the file, because other rows may still use it.
+This command does the clean up in one batch: it counts how many rows reference each file and deletes the
+files nobody references any more.
+
+Files younger than the grace period are left alone: an upload could be halfway through saving its row.
+'''
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from library.models import Uploads
+
+
+class Command(BaseCommand):
+    help = 'Delete uploaded files that no Uploads row refers to any more.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only print what would be deleted.')
+        parser.add_argument('--grace-minutes', type=float, default=60)
+
+    def handle(self, *args, **options):
+        storage = Uploads._meta.get_field('file').storage
+        cutoff = time.time() - options['grace_minutes'] * 60
+
+        #one GROUP BY query gives the reference count of every file that is still in use
+        refcounts = dict(Uploads.objects.values_list('file').annotate(refs=Count('id')))
+
+        deleted, freed = 0, 0
+        for name in storage.blob_names():
+            if refcounts.get(name, 0) > 0:
+                continue
+            path = storage.path(name)
+            if os.path.getmtime(path) > cutoff:
+                continue
+            freed += os.path.getsize(path)
+            deleted += 1
+            if not options['dry_run']:
+                storage.delete(name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write('%s %d unreferenced files (%d bytes).' % (verb, deleted, freed))
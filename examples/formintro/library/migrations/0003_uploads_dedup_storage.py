@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:18
+
+import library.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_uploads'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='uploads',
+            name='file',
+            field=models.FileField(storage=library.storage.ContentAddressedStorage(), upload_to=''),
+        ),
+    ]
@@ -23,6 +23,7 @@ table into a python class.
 
 #The first step is to import Django models.
 from django.db import models
+from library.storage import ContentAddressedStorage
 
 
 '''To define a model, we create a class that extends the model.Model class
@@ -98,8 +99,9 @@ class Uploads(models.Model):
     #ID field
     id = models.AutoField(primary_key=True)
 
-    #file field
-    file = models.FileField()
+    #file field. The storage stores each unique file once, named by its hash (see storage.py), so
+    #many Uploads rows can point at the same file on disk.
+    file = models.FileField(storage=ContentAddressedStorage())
 
 
 '''Let's see this code in action. Once you define a set of models. You can "deploy" them with the following 
@@ -0,0 +1,79 @@
+'''storage.py defines a content-addressed storage backend for uploaded files.
+
+A normal FileSystemStorage writes every upload to a new file, even if somebody uploaded the exact
+same bytes yesterday (Django just renames it to file_abc123.pdf). This storage names each file after the
+sha256 hash of its contents instead:
+
+    blobs/9f/86/9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08.pdf
+
+So two uploads of the same file end up with the same name, and we only ever keep one copy on disk.
+
+How a save works:
+    1. We read the upload chunk by chunk (never the whole file in memory!) and, in the same loop,
+       feed each chunk into the hash and write it to a temp file.
+    2. Once we know the hash we know the final name. If that file already exists we throw the temp
+       file away -- the duplicate never gets written a second time. Otherwise we move the temp file
+       into place (a rename, not a copy).
+
+The Uploads rows that point at a blob are its "references". When no row refers to a blob any more it
+is garbage; `python manage.py gc_uploads` counts the references and deletes those files in a batch.
+'''
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    '''A FileSystemStorage that stores each unique file once, under its sha256 hash.
+    '''
+
+    def get_available_name(self, name, max_length=None):
+        '''Django calls this to avoid overwriting an existing file. Our names come from the contents,
+        so the same name always means the same bytes: nothing ever needs renaming.
+        '''
+        return name
+
+    def _save(self, name, content):
+        '''Streams `content` into a temp file while hashing it, then keeps it only if it is new.
+        Returns the name the file is stored under (Django puts that in the FileField).
+        '''
+        extension = os.path.splitext(name)[1].lower()
+
+        temp_dir = self.path('tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        hasher = hashlib.sha256()
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            try:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    temp.write(chunk)
+            except BaseException:
+                #don't leave half-written temp files behind
+                temp.close()
+                os.unlink(temp.name)
+                raise
+
+        digest = hasher.hexdigest()
+        blob = 'blobs/%s/%s/%s%s' % (digest[:2], digest[2:4], digest, extension)
+        full_path = self.path(blob)
+
+        if os.path.exists(full_path):
+            #we already have these exact bytes, skip the write
+            os.unlink(temp.name)
+        else:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file_move_safe(temp.name, full_path, allow_overwrite=True)
+
+        return blob
+
+    def blob_names(self):
+        '''Every blob currently on disk (for the garbage collector).
+        '''
+        root = self.path('blobs')
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                relative = os.path.relpath(os.path.join(dirpath, filename), root)
+                yield 'blobs/' + relative.replace(os.sep, '/')
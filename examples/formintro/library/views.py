@@ -105,12 +105,15 @@ def handleUploadForm(request):
     #get the file
     f = request.FILES['file']
 
-    #write it
-    with open('my_copy.pdf', 'wb') as destination:
-        destination.write(f.read())
-
-
-    ## OR!! You can save it in a database!
+    #You could write it yourself. Never f.read() the whole thing though: a big upload
+    #would sit in memory in one piece. Go chunk by chunk:
+    #
+    #    with open('my_copy.pdf', 'wb') as destination:
+    #        for chunk in f.chunks():
+    #            destination.write(chunk)
+
+    ## OR!! You can save it in a database! The Uploads.file storage streams it to disk
+    ## chunk by chunk and only keeps one copy of identical files (see storage.py)
     new_upload = Uploads(file = f)
     new_upload.save()
 